@@ -0,0 +1,415 @@
+import sys
+import json
+import asyncio
+import hashlib
+import logging
+import argparse
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+import db_connections
+import item_health
+import functions
+
+# asyncio HTTP server for the ProVe API described in swagger.json.
+#
+# Reads go through a fixed set of read-only SQLite connections, each used by one
+# executor thread at a time, so the event loop never blocks on the database and
+# the pipeline keeps writing (WAL) while requests are served. Status lists are
+# streamed with chunked transfer encoding straight from the cursor (or paged with
+# ?limit=&cursor=, optionally windowed with ?since=&until=), and item
+# results carry an ETag so clients can revalidate with If-None-Match.
+#
+#   python api_server.py [--db reference_checked.db] [--host 0.0.0.0] [--port 5000]
+
+STATUS_TEXT = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+               405: 'Method Not Allowed', 500: 'Internal Server Error'}
+MAX_HEADER_BYTES = 16384
+MAX_BODY_BYTES = 1024 * 1024  # a getBulkResults POST of 10k QIDs is ~150 KB
+
+
+class Request:
+    def __init__(self, method, target, headers, body=b''):
+        self.method = method
+        self.body = body
+        parts = urlsplit(target)
+        self.path = parts.path
+        self.query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        self.headers = headers
+
+    @property
+    def keep_alive(self):
+        return self.headers.get('connection', '').lower() != 'close'
+
+
+class Response:
+    def __init__(self, status=200, body=None, headers=None):
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+
+class Stream:
+    """JSON written as `prefix`, the rows of `query` rendered by `row_to_json` and comma-joined, then `suffix`."""
+
+    def __init__(self, prefix, query, params, row_to_json, suffix):
+        self.prefix = prefix
+        self.query = query
+        self.params = params
+        self.row_to_json = row_to_json
+        self.suffix = suffix
+
+
+class ReadPool:
+    def __init__(self, db_path, size):
+        self.db_path = db_path
+        self.size = size
+        self.connections = None
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='api-read')
+
+    def open(self):
+        self.connections = asyncio.Queue()
+        for _ in range(self.size):
+            self.connections.put_nowait(db_connections.connect_read_only(self.db_path))
+
+    @asynccontextmanager
+    async def acquire(self):
+        conn = await self.connections.get()
+        try:
+            yield conn
+        finally:
+            self.connections.put_nowait(conn)
+
+    async def call(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def run(self, func, *args):
+        """Runs `func(conn, *args)` on a pooled connection in the executor."""
+        async with self.acquire() as conn:
+            return await self.call(func, conn, *args)
+
+    def close(self):
+        while self.connections and not self.connections.empty():
+            self.connections.get_nowait().close()
+        self.executor.shutdown(wait=False)
+
+
+def _etag(*parts):
+    return '"' + hashlib.sha1('\x1f'.join(str(p) for p in parts).encode('utf-8')).hexdigest()[:20] + '"'
+
+
+def _not_modified(request, etag):
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(',')]
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
+
+
+def _rows(cursor):
+    columns = [d[0] for d in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def _latest_status(conn, qid):
+    cursor = conn.execute("SELECT * FROM status WHERE qid = ? ORDER BY start_time DESC LIMIT 1", (qid,))
+    rows = _rows(cursor)
+    return rows[0] if rows else None
+
+
+def _task_results(conn, task_id):
+    rows = _rows(conn.execute("SELECT * FROM aggregated_results WHERE task_id = ?", (task_id,)))
+    for row in rows:
+        for key in ('id', 'Results', 'task_id', 'reference_id'):
+            row.pop(key, None)
+    return rows
+
+
+class ApiServer:
+    def __init__(self, db_path, algo_version, read_connections=8, stream_batch_size=500, static_dir='.'):
+        self.db_path = db_path
+        self.algo_version = algo_version
+        self.pool = ReadPool(db_path, read_connections)
+        self.write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='api-write')
+        self.stream_batch_size = stream_batch_size
+        self.static = {}
+        for path, file_name, content_type in [('/', 'index.html', 'text/html; charset=utf-8'),
+                                              ('/swagger.json', 'swagger.json', 'application/json')]:
+            try:
+                with open(f"{static_dir}/{file_name}", 'rb') as file:
+                    self.static[path] = (file.read(), content_type)
+            except OSError:
+                pass
+        self.routes = {
+            '/api/task/checkQueue': self.check_queue,
+            '/api/task/checkCompleted': self.check_completed,
+            '/api/task/checkErrors': self.check_errors,
+            '/api/items/getSimpleResult': self.get_simple_result,
+            '/api/items/getCompResult': self.get_comp_result,
+            '/api/items/checkItemStatus': self.check_item_status,
+            '/api/items/getBulkResults': self.get_bulk_results,
+            '/api/requests/requestItem': self.request_item,
+        }
+        self.post_routes = {'/api/items/getBulkResults'}
+
+    # --- handlers -------------------------------------------------------------
+
+    @staticmethod
+    def _list_args(request):
+        """(limit, cursor, since, until) from the query string; limit is None unless paginating."""
+        limit = request.query.get('limit')
+        cursor = request.query.get('cursor')
+        if limit is not None:
+            limit = int(limit)
+            if limit < 1:
+                raise ValueError("limit must be positive")
+        elif cursor:
+            limit = 100
+        if cursor:
+            functions.decode_cursor(cursor)
+        return limit, cursor, request.query.get('since'), request.query.get('until')
+
+    async def _status_list(self, request, key, status, columns, to_item):
+        """Streams the whole list, or returns one keyset page when `limit` or `cursor` is given.
+        `to_item` turns a row of `columns` into the JSON value listed under `key`."""
+        try:
+            limit, cursor, since, until = self._list_args(request)
+        except ValueError as e:
+            return Response(400, {'error': str(e)})
+        if limit is None:
+            query, params = functions.status_query(status, since, until, columns=', '.join(columns))
+            return Stream(f'{{"{key}": [', query, params, lambda row: json.dumps(to_item(row)), ']}')
+        page = await self.pool.run(functions.status_page, status, limit, cursor, since, until)
+        items = [to_item(tuple(row[c] for c in columns)) for row in page['items']]
+        return Response(200, {key: items, 'next_cursor': page['next_cursor'], 'total': page['total']})
+
+    async def check_queue(self, request):
+        return await self._status_list(request, 'queue', 'in queue', ('qid',), lambda row: row[0])
+
+    async def check_completed(self, request):
+        return await self._status_list(request, 'completedItems', 'completed', ('qid',), lambda row: row[0])
+
+    async def check_errors(self, request):
+        def error_item(row):
+            qid, task_id, start_time, attempts = row
+            return {'qid': qid, 'errorMessage': f"Processing failed after {attempts or 1} attempt(s)",
+                    'task_id': task_id, 'start_time': start_time}
+        return await self._status_list(request, 'errors', 'error', ('qid', 'task_id', 'start_time', 'attempts'), error_item)
+
+    async def get_simple_result(self, request):
+        qid = request.query['qid']
+        row = await self.pool.run(item_health.get_item, qid)
+        etag = _etag('simple', qid, row and row['task_id'], row and row['updated_at'])
+        if _not_modified(request, etag):
+            return Response(304, headers={'ETag': etag})
+        summary = functions.health_summary(qid, row)
+        body = dict(summary, result=str(summary['health_value']))
+        return Response(200, body, {'ETag': etag, 'Cache-Control': 'no-cache'})
+
+    async def get_comp_result(self, request):
+        qid = request.query['qid']
+        async with self.pool.acquire() as conn:
+            latest = await self.pool.call(_latest_status, conn, qid)
+            etag = _etag('comp', qid, latest and latest['task_id'], latest and latest['status'], latest and latest['start_time'])
+            if _not_modified(request, etag):
+                return Response(304, headers={'ETag': etag})
+            if latest is None:
+                results = [{'error': 'Not processed yet'}]
+            else:
+                rows = await self.pool.call(_task_results, conn, latest['task_id'])
+                results = [latest] + (rows or [{'Result': 'No available URLs'}])
+        return Response(200, {'qid': qid, 'results': results}, {'ETag': etag, 'Cache-Control': 'no-cache'})
+
+    async def get_bulk_results(self, request):
+        """GET ?qids=Q1,Q2&details=true, or POST {"qids": [...], "details": true} for long lists."""
+        if request.method == 'POST':
+            try:
+                payload = json.loads(request.body or b'{}')
+            except ValueError:
+                return Response(400, {'error': 'Request body must be JSON'})
+            qids, details = payload.get('qids'), bool(payload.get('details', False))
+        else:
+            qids = [q for q in request.query.get('qids', '').split(',') if q]
+            details = request.query.get('details', '').lower() in ('1', 'true', 'yes')
+        if not qids or not isinstance(qids, list) or not all(isinstance(q, str) for q in qids):
+            return Response(400, {'error': 'Missing required parameter: qids (list of QIDs)'})
+        try:
+            items = await self.pool.run(functions.bulk_results, qids, details)
+        except ValueError as e:
+            return Response(400, {'error': str(e)})
+        return Response(200, {'items': items})
+
+    async def check_item_status(self, request):
+        qid = request.query['qid']
+        latest = await self.pool.run(_latest_status, qid)
+        return Response(200, latest or {'qid': qid, 'status': 'Not processed yet'})
+
+    def _request_item(self, qid):
+        try:
+            with db_connections.connection(self.db_path) as conn:
+                if functions.check_queue_status(conn, qid):
+                    return f"QID {qid} is already in queue. Skipping..."
+                task_id = functions.update_status(conn, qid, "in queue", self.algo_version, 'user_request')
+            return f"Task {task_id} created for QID {qid}"
+        except Exception as e:
+            return f"An error occurred: {e}"
+
+    async def request_item(self, request):
+        qid = request.query['qid']
+        # A single writer thread; SQLite serialises writes anyway
+        message = await asyncio.get_running_loop().run_in_executor(self.write_executor, self._request_item, qid)
+        return Response(200, {'message': message})
+
+    # --- HTTP -----------------------------------------------------------------
+
+    async def dispatch(self, request):
+        if request.method not in ('GET', 'HEAD') and not (request.method == 'POST' and request.path in self.post_routes):
+            return Response(405, {'error': f'{request.method} is not supported for {request.path}'})
+        if request.path in self.static:
+            body, content_type = self.static[request.path]
+            return Response(200, body, {'Content-Type': content_type})
+        handler = self.routes.get(request.path)
+        if handler is None:
+            return Response(404, {'error': f'Unknown path {request.path}'})
+        if (request.path.startswith(('/api/items/', '/api/requests/')) and request.path not in self.post_routes
+                and not request.query.get('qid')):
+            return Response(400, {'error': 'Missing required parameter: qid'})
+        try:
+            return await handler(request)
+        except Exception as e:
+            logging.exception(f"Request {request.path} failed")
+            return Response(500, {'error': str(e)})
+
+    async def write_response(self, writer, request, response):
+        body = response.body
+        if body is None:
+            payload = b''
+        elif isinstance(body, bytes):
+            payload = body
+        else:
+            payload = json.dumps(body, default=str).encode('utf-8')
+        headers = {'Content-Type': 'application/json', **response.headers}
+        if response.status != 304:
+            headers['Content-Length'] = str(len(payload))
+        self._write_head(writer, response.status, headers, request.keep_alive)
+        if request.method != 'HEAD' and response.status != 304:
+            writer.write(payload)
+        await writer.drain()
+
+    async def write_stream(self, writer, request, stream):
+        self._write_head(writer, 200, {'Content-Type': 'application/json', 'Transfer-Encoding': 'chunked'},
+                         request.keep_alive)
+        if request.method == 'HEAD':
+            writer.write(b'0\r\n\r\n')
+            await writer.drain()
+            return
+
+        def chunk(text):
+            data = text.encode('utf-8')
+            writer.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+
+        chunk(stream.prefix)
+        first = True
+        async with self.pool.acquire() as conn:
+            cursor = await self.pool.call(conn.execute, stream.query, stream.params)
+            try:
+                while True:
+                    rows = await self.pool.call(cursor.fetchmany, self.stream_batch_size)
+                    if not rows:
+                        break
+                    text = ','.join(stream.row_to_json(row) for row in rows)
+                    chunk(text if first else ',' + text)
+                    first = False
+                    # Back-pressure: don't read further while the client is slow
+                    await writer.drain()
+            finally:
+                # An unfinished statement would keep the connection's read snapshot open
+                await self.pool.call(cursor.close)
+        chunk(stream.suffix)
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    @staticmethod
+    def _write_head(writer, status, headers, keep_alive):
+        lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}"]
+        lines += [f"{k}: {v}" for k, v in headers.items()]
+        lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+    @staticmethod
+    async def read_request(reader):
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            return None
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, _ = lines[0].split(' ', 2)
+        except ValueError:
+            return None
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        # Only getBulkResults POSTs carry a body; a GET that sends one anyway has it ignored
+        length = int(headers.get('content-length', 0) or 0)
+        if length > MAX_BODY_BYTES:
+            return None
+        body = await reader.readexactly(length) if length else b''
+        return Request(method.upper(), target, headers, body)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                response = await self.dispatch(request)
+                if isinstance(response, Stream):
+                    await self.write_stream(writer, request, response)
+                else:
+                    await self.write_response(writer, request, response)
+                if not request.keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='0.0.0.0', port=5000, ready=None):
+        self.pool.open()
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+        logging.info(f"ProVe API listening on {host}:{port} ({self.db_path}, {self.pool.size} read connections)")
+        if ready:
+            ready()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.pool.close()
+            self.write_executor.shutdown(wait=False)
+
+
+def main(argv=None):
+    config = functions.get_config()
+    api_config = config.get('api', {})
+    parser = argparse.ArgumentParser(description='ProVe API server')
+    parser.add_argument('--db', default=config['database']['result_db_for_API'])
+    parser.add_argument('--host', default=api_config.get('host', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=api_config.get('port', 5000))
+    parser.add_argument('--read-connections', type=int, default=api_config.get('read_connections', 8))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=config.get('logging', {}).get('level', 'INFO'),
+                        format=config.get('logging', {}).get('format', '%(asctime)s - %(levelname)s - %(message)s'))
+    server = ApiServer(args.db, config['version']['algo_version'], args.read_connections,
+                       api_config.get('stream_batch_size', 500))
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,184 @@
+import os
+import sys
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import db_connections
+import item_health
+
+# Load test for api_server.py against a synthetic results database.
+#
+#   python benchmark_api.py --items 20000 --concurrency 32 --duration 20
+#
+# Builds the database (or reuses --db), starts the server in a subprocess and
+# drives it with keep-alive clients, then prints requests/sec and p50/p99 latency
+# per endpoint. getCompResult is requested both cold and with If-None-Match.
+
+LABELS = ['SUPPORTS', 'REFUTES', 'NOT ENOUGH INFO']
+
+
+def make_synthetic_db(path, items, results_per_item, queued, errors):
+    import eventHandler
+    eventHandler.initialize_database(path)
+    rng = random.Random(42)
+    status_rows, result_rows = [], []
+    for n in range(items):
+        qid, task_id = f"Q{n + 1}", f"task-{n + 1}"
+        state = 'in queue' if n < queued else 'error' if n < queued + errors else 'completed'
+        start_time = f"2024-01-{1 + n % 28:02d}T{n % 24:02d}:{n % 60:02d}:00"
+        status_rows.append((task_id, qid, state, start_time, '1.0.3', 'from_pagepile'))
+        if state == 'completed':
+            for r in range(results_per_item):
+                result_rows.append((f"triple {r} of {qid}", f"P{r}", f"https://example.org/{qid}/{r}", qid,
+                                    f"ref-{r}", task_id, rng.choice(LABELS), f"evidence sentence {r}"))
+    with db_connections.connection(path) as conn:
+        conn.executemany("INSERT INTO status (task_id, qid, status, start_time, algo_version, request_type) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", status_rows)
+        conn.executemany("INSERT INTO aggregated_results (triple, property_id, url, qid, reference_id, task_id, result, "
+                         "result_sentence) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", result_rows)
+        item_health.rebuild(conn)
+    print(f"Synthetic DB {path}: {items} items, {len(result_rows)} results")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ')[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    if headers.get('transfer-encoding') == 'chunked':
+        body = bytearray()
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).strip(), 16)
+            if size == 0:
+                await reader.readuntil(b'\r\n')
+                break
+            body += await reader.readexactly(size)
+            await reader.readexactly(2)
+        return status, headers, bytes(body)
+    length = int(headers.get('content-length', 0))
+    return status, headers, await reader.readexactly(length) if length else b''
+
+
+async def client(port, deadline, endpoints, items, latencies, etags):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    rng = random.Random()
+    try:
+        while time.perf_counter() < deadline:
+            name, path, takes_qid = rng.choice(endpoints)
+            qid = f"Q{rng.randint(1, items)}"
+            target = f"{path}?qid={qid}" if takes_qid else path
+            extra = ''
+            if name == 'getCompResult (If-None-Match)' and qid in etags:
+                extra = f"If-None-Match: {etags[qid]}\r\n"
+            start = time.perf_counter()
+            writer.write(f"GET {target} HTTP/1.1\r\nHost: localhost\r\n{extra}\r\n".encode('latin-1'))
+            status, headers, body = await read_response(reader)
+            latencies.setdefault(name, []).append(time.perf_counter() - start)
+            if status not in (200, 304):
+                raise RuntimeError(f"{target} returned {status}: {body[:200]}")
+            if name.startswith('getCompResult') and 'etag' in headers:
+                etags[qid] = headers['etag']
+    finally:
+        writer.close()
+
+
+async def run_load(port, concurrency, duration, endpoints, items):
+    latencies, etags = {}, {}
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*[client(port, deadline, endpoints, items, latencies, etags) for _ in range(concurrency)])
+    return latencies
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+def report(latencies, duration):
+    print(f"{'endpoint':<32} {'requests':>9} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    total = 0
+    for name, values in sorted(latencies.items()):
+        values.sort()
+        total += len(values)
+        print(f"{name:<32} {len(values):>9} {len(values) / duration:>9.1f} "
+              f"{percentile(values, 0.5) * 1000:>8.2f} {percentile(values, 0.99) * 1000:>8.2f}")
+    everything = sorted(v for values in latencies.values() for v in values)
+    if everything:
+        print(f"{'all':<32} {total:>9} {total / duration:>9.1f} "
+              f"{percentile(everything, 0.5) * 1000:>8.2f} {percentile(everything, 0.99) * 1000:>8.2f}")
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("api_server exited during startup")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"api_server did not open port {port}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test for api_server.py')
+    parser.add_argument('--db', help="existing results DB; a synthetic one is built when omitted")
+    parser.add_argument('--items', type=int, default=20000)
+    parser.add_argument('--results-per-item', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--read-connections', type=int, default=8)
+    parser.add_argument('--with-lists', action='store_true', help="include the (streamed) checkCompleted list")
+    args = parser.parse_args()
+
+    tmp_dir = None
+    db_path = args.db
+    if db_path is None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(tmp_dir.name, 'synthetic_results.db')
+        make_synthetic_db(db_path, args.items, args.results_per_item, queued=min(100, args.items // 10),
+                          errors=min(100, args.items // 10))
+
+    endpoints = [
+        ('getSimpleResult', '/api/items/getSimpleResult', True),
+        ('getCompResult', '/api/items/getCompResult', True),
+        ('getCompResult (If-None-Match)', '/api/items/getCompResult', True),
+        ('checkItemStatus', '/api/items/checkItemStatus', True),
+        ('checkQueue', '/api/task/checkQueue', False),
+    ]
+    if args.with_lists:
+        endpoints.append(('checkCompleted', '/api/task/checkCompleted', False))
+
+    port = free_port()
+    server = subprocess.Popen([sys.executable, 'api_server.py', '--db', db_path, '--host', '127.0.0.1',
+                               '--port', str(port), '--read-connections', str(args.read_connections)],
+                              cwd=os.path.dirname(os.path.abspath(__file__)))
+    try:
+        wait_for_port(port, server)
+        print(f"Load: {args.concurrency} keep-alive clients for {args.duration:.0f}s")
+        latencies = asyncio.run(run_load(port, args.concurrency, args.duration, endpoints, args.items))
+        report(latencies, args.duration)
+    finally:
+        server.terminate()
+        server.wait()
+        if tmp_dir:
+            tmp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
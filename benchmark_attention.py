@@ -0,0 +1,135 @@
+import sys
+import json
+import time
+import argparse
+import resource
+import statistics
+import subprocess
+
+# Fused (scaled_dot_product_attention) against the explicit attention in
+# utils/bert_model.py, on the retrieval encoder (BertForSequenceEncoder). The
+# explicit path is the default; set models.fused_attention once parity passes.
+#
+#   python benchmark_attention.py                           # bert-base shape, random weights
+#   python benchmark_attention.py --bert-pretrain base/bert_base --seq-lens 128 256 512 --batch-size 16
+#
+# Parity: both paths run on the same weights and a batch padded to each length
+# (every other row half masked); the pooled outputs must agree within --atol.
+# Latency and memory: every (path, length) runs in a fresh interpreter; memory is
+# the peak RSS (or CUDA peak allocation) above the RSS once the model is built.
+
+
+def build_model(bert_pretrain):
+    import torch
+    from utils.bert_model import BertForSequenceEncoder, BertConfig
+    torch.manual_seed(0)
+    if bert_pretrain:
+        model = BertForSequenceEncoder.from_pretrained(bert_pretrain)
+    else:
+        model = BertForSequenceEncoder(BertConfig(28996))  # bert-base-cased vocabulary
+    return model.eval()
+
+
+def make_batch(batch_size, seq_len, vocab_size, device):
+    import torch
+    generator = torch.Generator().manual_seed(1)
+    input_ids = torch.randint(1000, vocab_size, (batch_size, seq_len), generator=generator)
+    attention_mask = torch.ones(batch_size, seq_len, dtype=torch.long)
+    attention_mask[1::2, seq_len // 2:] = 0
+    token_type_ids = torch.zeros(batch_size, seq_len, dtype=torch.long)
+    token_type_ids[:, seq_len // 4:] = 1
+    return input_ids.to(device), attention_mask.to(device), token_type_ids.to(device)
+
+
+def current_rss_mb():
+    with open('/proc/self/status') as file:
+        for line in file:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def child(fused, seq_len, args):
+    import torch
+    from utils.bert_model import set_fused_attention
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    model = build_model(args.bert_pretrain).to(device)
+    fused = set_fused_attention(model, fused)
+    batch = make_batch(args.batch_size, seq_len, model.bert.embeddings.word_embeddings.num_embeddings, device)
+    timings = []
+    with torch.no_grad():
+        model(*batch)  # warm-up
+        if device == 'cuda':
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats()
+        before_mb = current_rss_mb()
+        for _ in range(args.iterations):
+            start = time.perf_counter()
+            model(*batch)
+            if device == 'cuda':
+                torch.cuda.synchronize()
+            timings.append(time.perf_counter() - start)
+    if device == 'cuda':
+        memory_mb = torch.cuda.max_memory_allocated() / 2 ** 20
+    else:
+        memory_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 - before_mb
+    print(json.dumps({'fused': fused, 'latency_ms': statistics.median(timings) * 1000, 'memory_mb': memory_mb}))
+
+
+def check_parity(args):
+    import torch
+    from utils.bert_model import set_fused_attention
+    model = build_model(args.bert_pretrain)
+    if not set_fused_attention(model, True):
+        print("scaled_dot_product_attention is not available in this torch; only the explicit path runs")
+        return True
+    ok = True
+    with torch.no_grad():
+        for seq_len in args.seq_lens:
+            batch = make_batch(4, seq_len, model.bert.embeddings.word_embeddings.num_embeddings, 'cpu')
+            set_fused_attention(model, False)
+            explicit_output, explicit_pooled = model(*batch)
+            set_fused_attention(model, True)
+            fused_output, fused_pooled = model(*batch)
+            mask = batch[1].unsqueeze(-1).bool()
+            diff = max(float((explicit_pooled - fused_pooled).abs().max()),
+                       float((explicit_output - fused_output).masked_select(mask).abs().max()))
+            print(f"parity seq_len {seq_len:>4}: max |diff| {diff:.2e}")
+            ok = ok and diff <= args.atol
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fused vs explicit attention in utils/bert_model.py')
+    parser.add_argument('--bert-pretrain', help="directory of a pretrained BERT; random bert-base weights if omitted")
+    parser.add_argument('--seq-lens', type=int, nargs='+', default=[128, 256, 512])
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--atol', type=float, default=1e-4)
+    parser.add_argument('--child', nargs=2, metavar=('FUSED', 'SEQ_LEN'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child[0] == '1', int(args.child[1]), args)
+        return
+
+    parity_ok = check_parity(args)
+    print(f"{'seq_len':>7} {'explicit ms':>12} {'fused ms':>9} {'speed-up':>9} {'explicit MB':>12} {'fused MB':>9}")
+    for seq_len in args.seq_lens:
+        results = {}
+        for fused in ('0', '1'):
+            command = [sys.executable, __file__, '--child', fused, str(seq_len), '--batch-size', str(args.batch_size),
+                       '--iterations', str(args.iterations)]
+            if args.bert_pretrain:
+                command += ['--bert-pretrain', args.bert_pretrain]
+            result = subprocess.run(command, capture_output=True, text=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"benchmark run failed:\n{result.stderr}")
+            results[fused] = json.loads(result.stdout.strip().splitlines()[-1])
+        explicit, fused = results['0'], results['1']
+        print(f"{seq_len:>7} {explicit['latency_ms']:>12.1f} {fused['latency_ms']:>9.1f} "
+              f"{explicit['latency_ms'] / fused['latency_ms']:>8.2f}x {explicit['memory_mb']:>12.0f} {fused['memory_mb']:>9.0f}")
+    sys.exit(0 if parity_ok else 1)
+
+
+if __name__ == '__main__':
+    main()
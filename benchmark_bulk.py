@@ -0,0 +1,80 @@
+import os
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+import db_connections
+import item_health
+import functions
+import api_server
+from benchmark_api import make_synthetic_db
+
+# Throughput of functions.bulk_results against one getSimpleResult/getCompResult
+# lookup per QID, on a synthetic results database (or an existing one with --db).
+#
+#   python benchmark_bulk.py                       # 1k and 10k QIDs, 20k-item DB
+#   python benchmark_bulk.py --sizes 1000 10000 --details --repeat 5
+
+
+def per_item(conn, qids, details):
+    items = []
+    for qid in qids:
+        latest = api_server._latest_status(conn, qid)
+        summary = functions.health_summary(qid, item_health.get_item(conn, qid))
+        item = {'qid': qid, 'latest_task': latest, 'summary': summary}
+        if details:
+            item['results'] = api_server._task_results(conn, summary['task_id']) if 'task_id' in summary else []
+        items.append(item)
+    return items
+
+
+def measure(func, conn, qids, details, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        items = func(conn, qids, details)
+        timings.append(time.perf_counter() - start)
+        assert len(items) == len(qids)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk item lookup benchmark')
+    parser.add_argument('--db', help="existing results DB; a synthetic one is built when omitted")
+    parser.add_argument('--items', type=int, default=20000)
+    parser.add_argument('--results-per-item', type=int, default=10)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--details', action='store_true', help="also fetch the aggregated results")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    tmp_dir = None
+    db_path = args.db
+    if db_path is None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(tmp_dir.name, 'synthetic_results.db')
+        make_synthetic_db(db_path, args.items, args.results_per_item, queued=min(100, args.items // 10),
+                          errors=min(100, args.items // 10))
+    conn = db_connections.connect_read_only(db_path)
+    all_qids = [row[0] for row in conn.execute("SELECT DISTINCT qid FROM status")]
+    rng = random.Random(7)
+    try:
+        print(f"{'QIDs':>6} {'details':>8} {'per-item s':>11} {'bulk s':>8} {'bulk QIDs/s':>12} {'speed-up':>9}")
+        for size in args.sizes:
+            # A few unknown QIDs, as real gadget/bot lists have
+            qids = rng.sample(all_qids, min(size, len(all_qids)))
+            qids += [f"Q{10 ** 12 + n}" for n in range(size - len(qids))]
+            baseline = measure(per_item, conn, qids, args.details, args.repeat)
+            bulk = measure(functions.bulk_results, conn, qids, args.details, args.repeat)
+            print(f"{size:>6} {str(args.details):>8} {baseline:>11.3f} {bulk:>8.3f} {size / bulk:>12.0f} "
+                  f"{baseline / bulk:>8.1f}x")
+    finally:
+        conn.close()
+        if tmp_dir:
+            tmp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
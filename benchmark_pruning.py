@@ -0,0 +1,101 @@
+import os
+import ast
+import sys
+import sqlite3
+import argparse
+
+import yaml
+
+from utils.candidate_pruning import query_terms, select_candidates
+
+# Recall@K of the BM25 first stage (evidence_selection.candidate_k) against the
+# exhaustive cross-encoder scores already stored in original_results, so no model
+# is needed. For each K: the share of each row's TOP_N (n_top_sentences) that is
+# among the K candidates, the share of rows whose TOP_N is kept whole (then the
+# final evidence is unchanged), and the share of BERT pairs still scored.
+#
+#   python benchmark_pruning.py                                 # databases from config.yaml
+#   python benchmark_pruning.py --k 16 32 64 128 --limit 2000
+#   python benchmark_pruning.py --k 64 --min-preserved 0.99     # exit 1 below the threshold
+#
+# Rows scored with pruning on (None scores) or saved with compact_results (score
+# summaries) are skipped: run with compact_results false to collect rows.
+
+COLUMNS = ['nlp_sentences', 'nlp_sentences_slide_2']
+LABEL_COLUMNS = ['entity_label', 'entity_alias', 'object_label', 'object_alias']
+
+
+def load_rows(result_db, parse_db, limit):
+    conn = sqlite3.connect(f'file:{result_db}?mode=ro', uri=True)
+    query = f"""SELECT reference_id, final_verbalisation, {', '.join(f'{c}, {c}_scores' for c in COLUMNS)}
+                FROM original_results ORDER BY id DESC""" + (" LIMIT ?" if limit else "")
+    records = conn.execute(query, (limit,) if limit else ()).fetchall()
+    conn.close()
+    labels = {}
+    if parse_db and os.path.exists(parse_db):
+        conn = sqlite3.connect(f'file:{parse_db}?mode=ro', uri=True)
+        for reference_id, *values in conn.execute(f"SELECT reference_id, {', '.join(LABEL_COLUMNS)} FROM claim_text"):
+            labels.setdefault(reference_id, values)
+        conn.close()
+    rows, skipped = [], 0
+    for reference_id, verbalisation, *values in records:
+        try:
+            row = {'verbalisation': verbalisation, 'labels': labels.get(reference_id, [])}
+            for i, column in enumerate(COLUMNS):
+                row[column] = ast.literal_eval(values[2 * i])
+                row[f'{column}_scores'] = ast.literal_eval(values[2 * i + 1])
+                if len(row[column]) != len(row[f'{column}_scores']) or None in row[f'{column}_scores']:
+                    raise ValueError('not exhaustively scored')
+        except (ValueError, SyntaxError, TypeError):
+            skipped += 1
+            continue
+        rows.append(row)
+    return rows, skipped
+
+
+def evaluate(rows, k, n_top):
+    kept = total = preserved = scored = exhaustive = 0
+    for row in rows:
+        query = query_terms(row['verbalisation'], row['labels'])
+        row_preserved = True
+        for column in COLUMNS:
+            documents, scores = row[column], row[f'{column}_scores']
+            top_n = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:n_top]
+            candidates = set(select_candidates(query, documents, k))
+            hits = sum(i in candidates for i in top_n)
+            kept += hits
+            total += len(top_n)
+            row_preserved = row_preserved and hits == len(top_n)
+            scored += len(candidates)
+            exhaustive += len(documents)
+        preserved += row_preserved
+    return {'recall': kept / max(1, total), 'preserved': preserved / max(1, len(rows)),
+            'work': scored / max(1, exhaustive)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recall@K of BM25 candidate pruning against stored exhaustive scores')
+    parser.add_argument('--config', default='config.yaml')
+    parser.add_argument('--results-db', help="database with original_results; database.result_db_for_API if omitted")
+    parser.add_argument('--k', type=int, nargs='+', default=[8, 16, 32, 64, 128])
+    parser.add_argument('--limit', type=int, default=0, help="most recent rows only")
+    parser.add_argument('--min-preserved', type=float, help="exit 1 if any K keeps fewer rows' TOP_N whole")
+    args = parser.parse_args()
+    with open(args.config, 'r') as file:
+        config = yaml.safe_load(file)
+    n_top = config['evidence_selection']['n_top_sentences']
+    rows, skipped = load_rows(args.results_db or config['database']['result_db_for_API'],
+                              config['database']['name'], args.limit)
+    print(f"{len(rows)} rows ({skipped} skipped), TOP_N = {n_top}")
+    print(f"{'K':>6} {'recall@K':>9} {'TOP_N kept':>11} {'BERT pairs':>11}")
+    ok = True
+    for k in args.k:
+        result = evaluate(rows, k, n_top)
+        print(f"{k:>6} {result['recall']:>9.3f} {result['preserved']:>11.3f} {result['work']:>11.1%}")
+        if args.min_preserved is not None and result['preserved'] < args.min_preserved:
+            ok = False
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
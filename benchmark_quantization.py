@@ -0,0 +1,128 @@
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+# Accuracy and throughput of int8 dynamic quantisation (utils/quantization.py)
+# for the sentence retrieval and entailment models, against fp32 on the same
+# (claim, sentence) pairs.
+#
+#   python benchmark_quantization.py                         # built-in fixture pairs
+#   python benchmark_quantization.py --pairs pairs.json      # [[claim, sentence], ...] or JSON lines
+#   python benchmark_quantization.py --repeat 8 --min-agreement 0.98
+#
+# Retrieval is compared on raw scores, on the `score > score_threshold` decision
+# used to weight evidence and on the top-N sentences chosen per claim; entailment
+# on probabilities and argmax labels.
+
+FIXTURE_PAIRS = [
+    ('Douglas Adams was born in Cambridge.', 'Douglas Noel Adams was born on 11 March 1952 in Cambridge, England.'),
+    ('Douglas Adams was born in Cambridge.', 'Adams moved to Brentwood, Essex, with his mother after his parents divorced.'),
+    ('Douglas Adams was born in Cambridge.', 'He was born in London and spent his childhood in Edinburgh.'),
+    ('Douglas Adams was born in Cambridge.', 'The Hitchhiker\'s Guide to the Galaxy began as a radio comedy in 1978.'),
+    ('Douglas Adams is a writer.', 'Adams was an English author, humorist and screenwriter.'),
+    ('Douglas Adams is a writer.', 'He is best known for The Hitchhiker\'s Guide to the Galaxy.'),
+    ('Douglas Adams is a writer.', 'Adams never published any books or scripts during his life.'),
+    ('The World Trade Center has a height of 200 metres.', 'The North Tower stood 417 metres tall when completed in 1972.'),
+    ('The World Trade Center has a height of 200 metres.', 'The complex was located in Lower Manhattan, New York City.'),
+    ('The World Trade Center has a height of 200 metres.', 'Its twin towers were the tallest buildings in the world until 1973.'),
+    ('Paris is the capital of France.', 'Paris is the capital and most populous city of France.'),
+    ('Paris is the capital of France.', 'The capital of France is Lyon, which hosts the national government.'),
+    ('Paris is the capital of France.', 'The Seine flows through the city from east to west.'),
+    ('Marie Curie received the Nobel Prize in Chemistry.', 'In 1911 she was awarded the Nobel Prize in Chemistry for the discovery of radium and polonium.'),
+    ('Marie Curie received the Nobel Prize in Chemistry.', 'Curie was the first woman to win a Nobel Prize.'),
+    ('Marie Curie received the Nobel Prize in Chemistry.', 'She never received any scientific award during her career.'),
+]
+
+
+def load_pairs(path):
+    with open(path, 'r') as file:
+        text = file.read().strip()
+    if text.startswith('['):
+        return [tuple(p) for p in json.loads(text)]
+    return [tuple(json.loads(line)) for line in text.splitlines() if line.strip()]
+
+
+def timed(func, pairs, batch_size, repeat):
+    outputs, best = None, float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = []
+        for i in range(0, len(pairs), batch_size):
+            result += list(func(pairs[i:i + batch_size]))
+        best = min(best, time.perf_counter() - start)
+        outputs = result
+    return np.array(outputs), len(pairs) / best
+
+
+def top_n_agreement(pairs, fp32, int8, n):
+    """Share of claims whose top-n sentences (as a set) are the same with both models."""
+    by_claim = {}
+    for i, (claim, _) in enumerate(pairs):
+        by_claim.setdefault(claim, []).append(i)
+    same = 0
+    for indices in by_claim.values():
+        top = lambda scores: set(sorted(indices, key=lambda i: -scores[i])[:n])
+        same += top(fp32) == top(int8)
+    return same / len(by_claim)
+
+
+def compare_retrieval(pairs, args, config):
+    from utils.sentence_retrieval_module import SentenceRetrievalModule
+    max_len = config['evidence_selection']['token_size']
+    threshold = config['evidence_selection']['score_threshold']
+    fp32, fp32_rate = timed(SentenceRetrievalModule(max_len=max_len).score_sentence_pairs, pairs, args.batch_size, args.repeat)
+    int8, int8_rate = timed(SentenceRetrievalModule(max_len=max_len, int8=True).score_sentence_pairs, pairs,
+                            args.batch_size, args.repeat)
+    agreement = float(np.mean((fp32 > threshold) == (int8 > threshold)))
+    print(f"retrieval   fp32 {fp32_rate:8.1f} pairs/s  int8 {int8_rate:8.1f} pairs/s  speed-up {int8_rate / fp32_rate:5.2f}x")
+    print(f"            score |diff| mean {np.mean(np.abs(fp32 - int8)):.4f} max {np.max(np.abs(fp32 - int8)):.4f}  "
+          f"threshold agreement {agreement:.3f}  "
+          f"top-{args.top_n} agreement {top_n_agreement(pairs, fp32, int8, args.top_n):.3f}")
+    return agreement
+
+
+def compare_entailment(pairs, args):
+    from utils.textual_entailment_module import TextualEntailmentModule
+
+    def scorer(module):
+        return lambda batch: module.get_batch_scores([c for c, _ in batch], [s for _, s in batch])
+    fp32, fp32_rate = timed(scorer(TextualEntailmentModule()), pairs, args.batch_size, args.repeat)
+    int8, int8_rate = timed(scorer(TextualEntailmentModule(int8=True)), pairs, args.batch_size, args.repeat)
+    agreement = float(np.mean(fp32.argmax(axis=1) == int8.argmax(axis=1)))
+    print(f"entailment  fp32 {fp32_rate:8.1f} pairs/s  int8 {int8_rate:8.1f} pairs/s  speed-up {int8_rate / fp32_rate:5.2f}x")
+    print(f"            prob |diff| mean {np.mean(np.abs(fp32 - int8)):.4f} max {np.max(np.abs(fp32 - int8)):.4f}  "
+          f"label agreement {agreement:.3f}")
+    return agreement
+
+
+def main():
+    import yaml
+    parser = argparse.ArgumentParser(description='int8 vs fp32 accuracy/throughput for retrieval and entailment')
+    parser.add_argument('--pairs', help="JSON list or JSON lines of [claim, sentence]; built-in fixture if omitted")
+    parser.add_argument('--models', nargs='+', choices=['retrieval', 'entailment'], default=['retrieval', 'entailment'])
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--repeat', type=int, default=3, help="timing runs per model; the fastest counts")
+    parser.add_argument('--top-n', type=int, default=5)
+    parser.add_argument('--min-agreement', type=float, help="exit non-zero if a label agreement is below this")
+    parser.add_argument('--config', default='config.yaml')
+    args = parser.parse_args()
+    with open(args.config, 'r') as file:
+        config = yaml.safe_load(file)
+
+    pairs = load_pairs(args.pairs) if args.pairs else FIXTURE_PAIRS
+    print(f"{len(pairs)} (claim, sentence) pairs, batch size {args.batch_size}")
+    agreements = []
+    if 'retrieval' in args.models:
+        agreements.append(compare_retrieval(pairs, args, config))
+    if 'entailment' in args.models:
+        agreements.append(compare_entailment(pairs, args))
+    if args.min_agreement is not None and min(agreements) < args.min_agreement:
+        print(f"label agreement below {args.min_agreement}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
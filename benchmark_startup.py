@@ -0,0 +1,111 @@
+import os
+import sys
+import csv
+import time
+import argparse
+import datetime
+import statistics
+import subprocess
+
+# Wall time of importing a module in a fresh interpreter, i.e. what an API or
+# pipeline worker pays before it can serve anything.
+#
+#   python benchmark_startup.py                       # functions, 10 runs
+#   python benchmark_startup.py eventHandler --runs 5 --max-seconds 1.0
+#   python benchmark_startup.py --history startup_times.csv   # append the result for tracking
+#   python benchmark_startup.py eventHandler --importtime 15  # slowest imports, from -X importtime
+
+
+def time_import(module, runs, cwd):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', f'import {module}'], cwd=cwd,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{result.stderr}")
+        timings.append(elapsed)
+    return timings
+
+
+def import_profile(module, cwd):
+    """(cumulative_us, self_us, name, depth) for every module imported by `import <module>`."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=cwd,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        # Nested imports are indented by two spaces per level after the single separator space
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((int(cumulative_us), int(self_us), name.strip(), depth))
+    return entries
+
+
+def print_import_profile(module, cwd, top):
+    entries = import_profile(module, cwd)
+    roots = [i for i, e in enumerate(entries) if e[3] == 0 and e[2] == module]
+    if not roots:
+        print(f"  no -X importtime output for {module}")
+        return
+    # A module's imports are printed right before it, back to the previous top-level entry
+    end = roots[-1]
+    start = end
+    while start > 0 and entries[start - 1][3] > 0:
+        start -= 1
+    print(f"  slowest imports under {module} (total {entries[end][0] / 1e6:.3f}s):")
+    for cumulative_us, self_us, name, depth in sorted(entries[start:end], reverse=True)[:top]:
+        print(f"    {cumulative_us / 1e6:8.3f}s cumulative {self_us / 1e6:8.3f}s self  {'  ' * (depth - 1)}{name}")
+
+
+def git_revision(cwd):
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=cwd, capture_output=True,
+                              text=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure `python -c 'import <module>'` wall time")
+    parser.add_argument('modules', nargs='*', default=['functions'])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--max-seconds', type=float, help="exit non-zero if a median exceeds this")
+    parser.add_argument('--history', help="CSV file the results are appended to")
+    parser.add_argument('--importtime', type=int, metavar='N', help="also list the N slowest imports of each module")
+    args = parser.parse_args()
+
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    # Empty interpreter as the baseline, so the import cost can be read off directly
+    baseline = statistics.median(time_import('sys', args.runs, cwd))
+    print(f"{'interpreter':<20} median {baseline:.3f}s")
+
+    failed = False
+    rows = []
+    for module in args.modules:
+        timings = time_import(module, args.runs, cwd)
+        median = statistics.median(timings)
+        print(f"{module:<20} median {median:.3f}s  min {min(timings):.3f}s  max {max(timings):.3f}s  "
+              f"(import cost {median - baseline:.3f}s)")
+        rows.append([datetime.datetime.now().isoformat(), git_revision(cwd), module, args.runs,
+                     f"{median:.4f}", f"{min(timings):.4f}", f"{baseline:.4f}"])
+        if args.importtime:
+            print_import_profile(module, cwd, args.importtime)
+        if args.max_seconds is not None and median > args.max_seconds:
+            print(f"  {module} is above the {args.max_seconds:.3f}s budget")
+            failed = True
+
+    if args.history:
+        new_file = not os.path.exists(args.history)
+        with open(args.history, 'a', newline='') as file:
+            writer = csv.writer(file)
+            if new_file:
+                writer.writerow(['timestamp', 'revision', 'module', 'runs', 'median_s', 'min_s', 'interpreter_s'])
+            writer.writerows(rows)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
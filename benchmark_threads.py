@@ -0,0 +1,96 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+import resources
+
+# Host throughput of the retrieval encoder for different splits of the cores
+# into worker processes x intra-op threads, with and without core pinning,
+# using the same code path as the pipeline (resources.apply_process_settings
+# and resources.threads).
+#
+#   python benchmark_threads.py                              # e.g. 1x16, 2x8, 4x4, 8x2, 16x1 on 16 cores
+#   python benchmark_threads.py --layouts 1x8 2x4 4x2 --seq-len 256 --duration 30
+#   python benchmark_threads.py --bert-pretrain base/bert_base --no-pinning
+#
+# A layout that oversubscribes the host (processes x threads > cores) shows what
+# an unconfigured deployment does.
+
+
+def default_layouts(cores):
+    layouts, processes = [], 1
+    while processes <= cores:
+        layouts.append((processes, cores // processes))
+        processes *= 2
+    layouts.append((max(1, cores // 2), cores))  # oversubscribed: every worker uses every core
+    return layouts
+
+
+def child(settings, worker_index, args):
+    resources.configure(settings)
+    resources.apply_process_settings(worker_index)
+    import torch
+    from benchmark_attention import build_model, make_batch
+    model = build_model(args.bert_pretrain)
+    batch = make_batch(args.batch_size, args.seq_len, model.bert.embeddings.word_embeddings.num_embeddings, 'cpu')
+    done = 0
+    with torch.no_grad(), resources.threads('sentence_retrieval'):
+        model(*batch)  # warm-up
+        start = time.perf_counter()
+        while time.perf_counter() - start < args.duration:
+            model(*batch)
+            done += args.batch_size
+        elapsed = time.perf_counter() - start
+    print(json.dumps({'sequences': done, 'seconds': elapsed}))
+
+
+def run_layout(processes, threads, pinned, args):
+    settings = {'enabled': True, 'cpu_affinity': 'auto' if pinned else None, 'workers_per_host': processes,
+                'interop_threads': 1, 'threads': {'sentence_retrieval': threads}}
+    command = [sys.executable, os.path.abspath(__file__), '--seq-len', str(args.seq_len),
+               '--batch-size', str(args.batch_size), '--duration', str(args.duration)]
+    if args.bert_pretrain:
+        command += ['--bert-pretrain', args.bert_pretrain]
+    workers = [subprocess.Popen(command + ['--child', json.dumps(settings), str(index)], stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+               for index in range(processes)]
+    rate = 0.0
+    for worker in workers:
+        stdout, stderr = worker.communicate()
+        if worker.returncode != 0:
+            raise RuntimeError(f"worker failed:\n{stderr}")
+        result = json.loads(stdout.strip().splitlines()[-1])
+        rate += result['sequences'] / result['seconds']
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Retrieval encoder throughput by processes x threads')
+    parser.add_argument('--layouts', nargs='+', help="PROCESSESxTHREADS, e.g. 2x8; a sweep over the cores if omitted")
+    parser.add_argument('--bert-pretrain', help="directory of a pretrained BERT; random bert-base weights if omitted")
+    parser.add_argument('--seq-len', type=int, default=128)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--no-pinning', action='store_true', help="skip the pinned runs")
+    parser.add_argument('--child', nargs=2, metavar=('SETTINGS', 'WORKER_INDEX'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(json.loads(args.child[0]), int(args.child[1]), args)
+        return
+
+    cores = resources.available_cores()
+    layouts = [tuple(int(n) for n in layout.lower().split('x')) for layout in args.layouts] if args.layouts \
+        else default_layouts(cores)
+    print(f"{cores} cores, seq_len {args.seq_len}, batch {args.batch_size}, {args.duration:.0f}s per run")
+    print(f"{'processes':>9} {'threads':>8} {'unpinned seq/s':>15} {'pinned seq/s':>13}")
+    for processes, threads in layouts:
+        unpinned = run_layout(processes, threads, False, args)
+        pinned = '' if args.no_pinning or processes * threads > cores else f"{run_layout(processes, threads, True, args):.1f}"
+        print(f"{processes:>9} {threads:>8} {unpinned:>15.1f} {pinned:>13}")
+
+
+if __name__ == '__main__':
+    main()
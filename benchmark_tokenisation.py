@@ -0,0 +1,70 @@
+import sys
+import time
+import argparse
+
+from benchmark_quantization import FIXTURE_PAIRS, load_pairs
+from utils.token_cache import TokenCache, encode_pairs
+
+# Pair encodings from cached segment ids (utils/token_cache.py) against the
+# tokenizer called on the text pairs, for the retrieval and entailment
+# tokenizers. Every claim is paired with every sentence, as when one page is
+# cited by many claims of an item. Parity: input ids, attention masks and token
+# type ids must be identical; speed: pairs/s with a cold cache per run.
+#
+#   python benchmark_tokenisation.py
+#   python benchmark_tokenisation.py --pairs pairs.json --repeat 5 --max-len 128
+
+TOKENIZERS = {
+    'retrieval': ('base/bert_base', {'do_lower_case': False}, True),
+    'entailment': ('base/models/BERT_FEVER_v4_tok_PBT', {}, False),
+}
+
+
+def workload(pairs, repeat):
+    claims = list(dict.fromkeys(claim for claim, _ in pairs))
+    sentences = list(dict.fromkeys(sentence for _, sentence in pairs)) * repeat
+    return [(claim, sentence) for claim in claims for sentence in sentences]
+
+
+def run(name, path, kwargs, token_type_ids, pairs, max_len, batch_size):
+    from transformers import BertTokenizer
+    tokenizer = BertTokenizer.from_pretrained(path, **kwargs)
+    batches = [pairs[i:i + batch_size] for i in range(0, len(pairs), batch_size)]
+
+    start = time.perf_counter()
+    expected = [tokenizer(batch, padding='max_length', truncation='longest_first', max_length=max_len,
+                          return_token_type_ids=token_type_ids, return_attention_mask=True) for batch in batches]
+    direct = time.perf_counter() - start
+
+    cache = TokenCache()
+    start = time.perf_counter()
+    cached = [encode_pairs(tokenizer, batch, max_len, return_token_type_ids=token_type_ids, return_tensors=None,
+                           cache=cache) for batch in batches]
+    assembled = time.perf_counter() - start
+
+    keys = ['input_ids', 'attention_mask'] + (['token_type_ids'] if token_type_ids else [])
+    same = all(a[key] == b[key] for a, b in zip(expected, cached) for key in keys)
+    stats = cache.stats()
+    print(f"{name:<11} {'identical' if same else 'DIFFERENT':<10} tokenizer {len(pairs) / direct:8.0f} pairs/s  "
+          f"cached {len(pairs) / assembled:8.0f} pairs/s  ({direct / assembled:.1f}x, "
+          f"{stats['misses']} tokenised / {stats['hits'] + stats['misses']} segments)")
+    return same
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cached-segment pair encodings against direct tokenisation')
+    parser.add_argument('--pairs', help="JSON [[claim, sentence], ...]; built-in fixture if omitted")
+    parser.add_argument('--repeat', type=int, default=20, help="copies of the sentence list (a longer page)")
+    parser.add_argument('--max-len', type=int, default=384)
+    parser.add_argument('--batch-size', type=int, default=256)
+    args = parser.parse_args()
+    pairs = workload(load_pairs(args.pairs) if args.pairs else FIXTURE_PAIRS, args.repeat)
+    print(f"{len(pairs)} pairs, max_len {args.max_len}")
+    ok = True
+    for name, (path, kwargs, token_type_ids) in TOKENIZERS.items():
+        ok = run(name, path, kwargs, token_type_ids, pairs, args.max_len, args.batch_size) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import sys
+import json
+import time
+import argparse
+import resource
+import statistics
+import subprocess
+
+# Load time and peak RSS of VerbModule from the Lightning checkpoint versus the
+# inference export (python -m utils.verbalisation_export). Every load runs in a
+# fresh interpreter so peak RSS is not shared between runs; the sample
+# verbalisations of both are compared to make sure the export is equivalent.
+#
+#   python benchmark_verbaliser.py [--runs 3] [--model-dir base/t5-base_inference]
+
+SAMPLE = 'translate Graph to English: <H> World Trade Center <R> height <T> 200 meter <H> World Trade Center <R> is a <T> tower'
+
+
+def current_rss_mb():
+    with open('/proc/self/status') as file:
+        for line in file:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def child(mode, model_dir):
+    from utils.verbalisation_module import VerbModule  # imports torch before the timer; both modes pay it
+    baseline_mb = current_rss_mb()
+    start = time.perf_counter()
+    verb_module = VerbModule(model_dir=model_dir if mode == 'export' else None)
+    load_s = time.perf_counter() - start
+    loaded_mb = current_rss_mb()
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+    print(json.dumps({'load_s': load_s, 'baseline_mb': baseline_mb, 'loaded_mb': loaded_mb, 'peak_mb': peak_mb,
+                      'sample': verb_module.verbalise(SAMPLE)}))
+
+
+def run(mode, model_dir):
+    result = subprocess.run([sys.executable, __file__, '--child', mode, '--model-dir', model_dir],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{mode} load failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='VerbModule load benchmark: checkpoint vs inference export')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--model-dir', default='base/t5-base_inference')
+    parser.add_argument('--child', choices=['checkpoint', 'export'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child, args.model_dir)
+        return
+
+    samples = {}
+    print(f"{'mode':<12} {'load s':>8} {'RSS after load MB':>18} {'peak RSS MB':>12}")
+    for mode in ('checkpoint', 'export'):
+        results = [run(mode, args.model_dir) for _ in range(args.runs)]
+        samples[mode] = results[0]['sample']
+        print(f"{mode:<12} {statistics.median(r['load_s'] for r in results):>8.2f} "
+              f"{statistics.median(r['loaded_mb'] - r['baseline_mb'] for r in results):>18.0f} "
+              f"{statistics.median(r['peak_mb'] - r['baseline_mb'] for r in results):>12.0f}")
+    print(f"sample verbalisation: {samples['export']!r}")
+    if samples['checkpoint'] != samples['export']:
+        print(f"  MISMATCH: checkpoint gave {samples['checkpoint']!r}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
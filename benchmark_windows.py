@@ -0,0 +1,70 @@
+import sys
+import argparse
+
+import yaml
+
+from benchmark_pruning import load_rows
+from utils.candidate_pruning import window_candidates
+
+# Windows derived from the sentence pass (evidence_selection.window_threshold)
+# against exhaustive window scoring, on the scores stored in original_results.
+# For each threshold: the share of the exhaustive window TOP_N still among the
+# scored windows, the share of rows whose window TOP_N is kept whole (the sentence
+# pass is unchanged, so their final evidence is too), and the share of window
+# pairs still sent to the cross-encoder. This is the window_threshold-only setting
+# (candidate_k 0); with candidate_k > 0 the BM25 windows are added to these, so the
+# figures here are a lower bound on what is kept.
+#
+#   python benchmark_windows.py                                # thresholds at percentiles of the sentence scores
+#   python benchmark_windows.py --thresholds -1 0 1 --limit 2000
+#   python benchmark_windows.py --thresholds 0 --min-preserved 0.99
+
+COLUMN = 'nlp_sentences_slide_2'
+
+
+def evaluate(rows, threshold, n_top):
+    kept = total = preserved = scored = exhaustive = 0
+    for row in rows:
+        scores = row[f'{COLUMN}_scores']
+        top_n = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:n_top]
+        candidates = set(window_candidates(row['nlp_sentences_scores'], len(scores), threshold, n_top))
+        hits = sum(i in candidates for i in top_n)
+        kept += hits
+        total += len(top_n)
+        preserved += hits == len(top_n)
+        scored += len(candidates)
+        exhaustive += len(scores)
+    return {'recall': kept / max(1, total), 'preserved': preserved / max(1, len(rows)),
+            'work': scored / max(1, exhaustive)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sentence-derived window candidates against exhaustive window scores')
+    parser.add_argument('--config', default='config.yaml')
+    parser.add_argument('--results-db', help="database with original_results; database.result_db_for_API if omitted")
+    parser.add_argument('--thresholds', type=float, nargs='+')
+    parser.add_argument('--limit', type=int, default=0, help="most recent rows only")
+    parser.add_argument('--min-preserved', type=float, help="exit 1 if any threshold keeps fewer rows' TOP_N whole")
+    args = parser.parse_args()
+    with open(args.config, 'r') as file:
+        config = yaml.safe_load(file)
+    n_top = config['evidence_selection']['n_top_sentences']
+    rows, skipped = load_rows(args.results_db or config['database']['result_db_for_API'],
+                              config['database']['name'], args.limit)
+    print(f"{len(rows)} rows ({skipped} skipped), TOP_N = {n_top}")
+    thresholds = args.thresholds
+    if not thresholds:
+        sentence_scores = sorted(s for row in rows for s in row['nlp_sentences_scores']) or [0.0]
+        thresholds = [sentence_scores[(len(sentence_scores) - 1) * p // 100] for p in (50, 75, 90, 95, 99)]
+    print(f"{'threshold':>10} {'recall':>7} {'TOP_N kept':>11} {'window pairs':>13}")
+    ok = True
+    for threshold in thresholds:
+        result = evaluate(rows, threshold, n_top)
+        print(f"{threshold:>10.3f} {result['recall']:>7.3f} {result['preserved']:>11.3f} {result['work']:>13.1%}")
+        if args.min_preserved is not None and result['preserved'] < args.min_preserved:
+            ok = False
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import sqlite3
+import hashlib
+import logging
+from typing import Dict, List, Set, Tuple
+
+# Fingerprints of the (claim, reference) pairs verified by each task.
+# A pair whose fingerprint matches the one stored for the item's last completed
+# task has identical claim data, labels, reference hash and page HTML (the inputs
+# reference_checking reads), so its previous results can be carried forward
+# instead of running the models again. Pages are still fetched to compare them:
+# only verbalisation, sentence retrieval and entailment are skipped.
+
+
+def fingerprint(*parts) -> str:
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(str(part).encode('utf-8', errors='replace'))
+        digest.update(b'\x1f')
+    return digest.hexdigest()
+
+
+def ensure_tables(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS pair_fingerprints (
+        task_id TEXT,
+        qid TEXT,
+        claim_id TEXT,
+        reference_id TEXT,
+        fingerprint TEXT,
+        PRIMARY KEY (task_id, claim_id, reference_id)
+    )
+    """)
+
+
+def compute_pair_fingerprints(parse_db_path, qid, algo_version) -> Dict[Tuple[str, str], str]:
+    """Fingerprints every (claim_id, reference_id) pair of `qid` from the parsed claim and the fetched page."""
+    with sqlite3.connect(parse_db_path) as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                SELECT c.claim_id, c.reference_id, c.rank, c.property_id, c.datavalue,
+                       c.entity_label, c.entity_alias, c.property_label, c.object_label, c.object_alias, h.url, h.html
+                FROM claim_text c
+                JOIN html_text h ON h.entity_id = c.entity_id AND h.reference_id = c.reference_id
+                WHERE c.entity_id = ?
+            ''', (qid,))
+        except sqlite3.OperationalError as e:
+            # claim_text/html_text are created by html_fetching; nothing to compare against yet
+            logging.info(f"No parsed text to fingerprint for {qid}: {e}")
+            return {}
+        rows = cursor.fetchall()
+
+    fingerprints = {}
+    for claim_id, reference_id, rank, property_id, datavalue, *labels, url, html in rows:
+        # The checker splits `html` itself; extracted_text is html_fetching's own extraction
+        page_fingerprint = fingerprint(url, html)
+        fingerprints[(claim_id, reference_id)] = fingerprint(
+            algo_version, claim_id, rank, property_id, datavalue, *labels, reference_id, page_fingerprint
+        )
+    return fingerprints
+
+
+# Checked by db_migrations.API_QUERY_PLANS
+LATEST_COMPLETED_SQL = '''
+    SELECT task_id FROM status
+    WHERE qid = ? AND status = 'completed' AND algo_version = ?
+    ORDER BY start_time DESC
+    LIMIT 1
+    '''
+
+
+def latest_completed_task(conn, qid, algo_version):
+    cursor = conn.cursor()
+    cursor.execute(LATEST_COMPLETED_SQL, (qid, algo_version))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def load_fingerprints(conn, task_id) -> Dict[Tuple[str, str], str]:
+    cursor = conn.cursor()
+    cursor.execute('SELECT claim_id, reference_id, fingerprint FROM pair_fingerprints WHERE task_id = ?', (task_id,))
+    return {(claim_id, reference_id): fp for claim_id, reference_id, fp in cursor.fetchall()}
+
+
+def plan_recomputation(current, previous) -> Tuple[Set[str], Set[str]]:
+    """Splits the reference_ids of an item into (changed, unchanged).
+
+    Results are stored per reference, so a reference is only carried forward when
+    every claim citing it kept the same fingerprint.
+    """
+    changed, seen = set(), set()
+    for (claim_id, reference_id), fp in current.items():
+        seen.add(reference_id)
+        if previous.get((claim_id, reference_id)) != fp:
+            changed.add(reference_id)
+    return changed, seen - changed
+
+
+def save_fingerprints(conn, task_id, qid, fingerprints):
+    conn.executemany('''
+    INSERT OR REPLACE INTO pair_fingerprints (task_id, qid, claim_id, reference_id, fingerprint)
+    VALUES (?, ?, ?, ?, ?)
+    ''', [(task_id, qid, claim_id, reference_id, fp) for (claim_id, reference_id), fp in fingerprints.items()])
+
+
+def _table_columns(conn, table_name) -> List[str]:
+    return [col[1] for col in conn.execute(f"PRAGMA table_info({table_name})").fetchall()]
+
+
+def carry_forward(conn, qid, previous_task_id, task_id, reference_ids) -> int:
+    """Copies the results of `reference_ids` from `previous_task_id` to `task_id`."""
+    if not reference_ids:
+        return 0
+    placeholders = ','.join('?' * len(reference_ids))
+    copied = 0
+    for table_name in ['original_results', 'aggregated_results']:
+        columns = [c for c in _table_columns(conn, table_name) if c not in ('id', 'task_id')]
+        column_list = ', '.join(columns)
+        cursor = conn.execute(f'''
+        INSERT OR IGNORE INTO {table_name} ({column_list}, task_id)
+        SELECT {column_list}, ? FROM {table_name}
+        WHERE task_id = ? AND reference_id IN ({placeholders})
+        ''', [task_id, previous_task_id] + sorted(reference_ids))
+        copied += cursor.rowcount
+    logging.info(f"Carried forward {len(reference_ids)} unchanged references of {qid} from task {previous_task_id}")
+    return copied
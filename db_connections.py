@@ -0,0 +1,83 @@
+import sqlite3
+import threading
+import logging
+from contextlib import contextmanager
+
+# Shared connection handling for the results database. Every thread keeps one
+# open connection per database file instead of connecting for each query, and
+# every connection is opened in WAL mode so API reads run alongside pipeline
+# writes instead of waiting for them. Defaults can be changed from the `sqlite`
+# section of config.yaml via `configure`.
+
+SETTINGS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',  # safe with WAL; only the last commits can be lost on power failure
+    'busy_timeout': 30,  # seconds a connection waits for a lock before raising "database is locked"
+    'cache_size_mb': 64,
+    'mmap_size_mb': 256,
+}
+
+_local = threading.local()
+
+
+def configure(settings=None):
+    if settings:
+        SETTINGS.update(settings)
+
+
+def connect(db_path, **overrides) -> sqlite3.Connection:
+    """Opens a new connection with the configured pragmas applied."""
+    settings = dict(SETTINGS, **overrides)
+    conn = sqlite3.connect(db_path, timeout=settings['busy_timeout'])
+    conn.execute(f"PRAGMA busy_timeout = {int(settings['busy_timeout'] * 1000)}")
+    try:
+        conn.execute(f"PRAGMA journal_mode = {settings['journal_mode']}")
+    except sqlite3.OperationalError as e:
+        # Switching to WAL needs a moment without other connections; the next connection retries
+        logging.warning(f"Could not set journal_mode={settings['journal_mode']} on {db_path}: {e}")
+    conn.execute(f"PRAGMA synchronous = {settings['synchronous']}")
+    # Negative cache_size is in KiB
+    conn.execute(f"PRAGMA cache_size = {-int(settings['cache_size_mb'] * 1024)}")
+    conn.execute(f"PRAGMA mmap_size = {int(settings['mmap_size_mb'] * 1024 * 1024)}")
+    return conn
+
+
+def connect_read_only(db_path) -> sqlite3.Connection:
+    """Read-only connection that may be handed between threads (one user at a time), e.g. by a pool."""
+    settings = SETTINGS
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=settings['busy_timeout'],
+                           check_same_thread=False)
+    conn.execute(f"PRAGMA busy_timeout = {int(settings['busy_timeout'] * 1000)}")
+    conn.execute(f"PRAGMA cache_size = {-int(settings['cache_size_mb'] * 1024)}")
+    conn.execute(f"PRAGMA mmap_size = {int(settings['mmap_size_mb'] * 1024 * 1024)}")
+    return conn
+
+
+def get_connection(db_path) -> sqlite3.Connection:
+    """Returns this thread's pooled connection to `db_path`; callers must not close it."""
+    pool = getattr(_local, 'connections', None)
+    if pool is None:
+        pool = _local.connections = {}
+    conn = pool.get(db_path)
+    if conn is None:
+        conn = pool[db_path] = connect(db_path)
+    return conn
+
+
+@contextmanager
+def connection(db_path):
+    """Pooled replacement for `with sqlite3.connect(db_path) as conn`: commits on success, rolls back on error."""
+    conn = get_connection(db_path)
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def close_thread_connections():
+    pool = getattr(_local, 'connections', None) or {}
+    for conn in pool.values():
+        conn.close()
+    pool.clear()
@@ -0,0 +1,312 @@
+import sys
+import time
+import sqlite3
+import logging
+import item_health
+import task_queue
+import change_detection
+import worklists
+import metrics
+import page_sentences
+import functions
+import scheduler
+from typing import Dict, List, Tuple, Union
+
+# Versioned schema changes for the results database. Each migration runs once,
+# in order, inside its own transaction and is recorded in `schema_migrations`;
+# initialize_database only calls `migrate`. Applied migrations are never edited:
+# a schema change is a new version. Version 0 is the schema that predates
+# versioning (it is a no-op on databases that already have it).
+#
+#   python db_migrations.py [db_path]           apply pending migrations
+#   python db_migrations.py --check [db_path]   verify the API queries use their indexes
+
+# Natural key of a result row within a task; saving the same row again updates it in place.
+# One reference can back several claims of an item, so the claim is part of the key.
+RESULT_KEYS = {
+    'original_results': ('task_id', 'claim_id', 'reference_id', 'url', 'final_verbalisation'),
+    'aggregated_results': ('task_id', 'claim_id', 'reference_id', 'url', 'triple'),
+}
+# The key as migration 1 created it
+_RESULT_KEYS_V1 = {
+    'original_results': ('task_id', 'reference_id', 'url', 'final_verbalisation'),
+    'aggregated_results': ('task_id', 'reference_id', 'url', 'triple'),
+}
+
+
+def _index_exists(conn, index_name) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (index_name,)).fetchone() is not None
+
+
+def _baseline(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS original_results (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        final_verbalisation TEXT,
+        url TEXT,
+        nlp_sentences TEXT,
+        nlp_sentences_slide_2 TEXT,
+        nlp_sentences_scores TEXT,
+        nlp_sentences_slide_2_scores TEXT,
+        nlp_sentences_TOP_N TEXT,
+        nlp_sentences_slide_2_TOP_N TEXT,
+        nlp_sentences_all_TOP_N TEXT,
+        evidence_TE_prob_TOP_N TEXT,
+        evidence_TE_prob_weighted_TOP_N TEXT,
+        evidence_TE_labels_TOP_N TEXT,
+        claim_TE_prob_weighted_sum_TOP_N TEXT,
+        claim_TE_label_weighted_sum_TOP_N TEXT,
+        claim_TE_label_malon_TOP_N TEXT,
+        evidence_TE_prob_slide_2_TOP_N TEXT,
+        evidence_TE_prob_weighted_slide_2_TOP_N TEXT,
+        evidence_TE_labels_slide_2_TOP_N TEXT,
+        claim_TE_prob_weighted_sum_slide_2_TOP_N TEXT,
+        claim_TE_label_weighted_sum_slide_2_TOP_N TEXT,
+        claim_TE_label_malon_slide_2_TOP_N TEXT,
+        evidence_TE_prob_all_TOP_N TEXT,
+        evidence_TE_prob_weighted_all_TOP_N TEXT,
+        evidence_TE_labels_all_TOP_N TEXT,
+        claim_TE_prob_weighted_sum_all_TOP_N TEXT,
+        claim_TE_label_weighted_sum_all_TOP_N TEXT,
+        claim_TE_label_malon_all_TOP_N TEXT,
+        qid TEXT,
+        processed_timestamp TEXT,
+        task_id TEXT,
+        reference_id TEXT
+    )
+    """)
+    # Databases created before original_results had reference_id
+    columns = [col[1] for col in conn.execute("PRAGMA table_info(original_results)").fetchall()]
+    if 'reference_id' not in columns:
+        conn.execute("ALTER TABLE original_results ADD COLUMN reference_id TEXT")
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS aggregated_results (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        triple TEXT,
+        property_id TEXT,
+        url TEXT,
+        Results TEXT,
+        qid TEXT,
+        reference_id TEXT,
+        task_id TEXT,
+        result TEXT,
+        result_sentence TEXT
+    )
+    """)
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS reformedHTML_results (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        qid TEXT,
+        HTML TEXT,
+        task_id TEXT
+    )
+    """)
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS status (
+        task_id TEXT PRIMARY KEY,
+        qid TEXT,
+        status TEXT,
+        start_time TEXT,
+        algo_version TEXT,
+        request_type TEXT
+    )
+    """)
+    change_detection.ensure_tables(conn)
+    task_queue.ensure_queue_columns(conn)
+
+
+def _create_result_key(conn, table_name, key, identified):
+    key_columns = ', '.join(key)
+    # One-off clean-up of rows saved twice before the key existed; rows without the identifying
+    # columns cannot be told apart from other claims' rows and are kept (NULLs never conflict)
+    conn.execute(f"DELETE FROM {table_name} WHERE {identified} AND id NOT IN "
+                 f"(SELECT MAX(id) FROM {table_name} WHERE {identified} GROUP BY {key_columns})")
+    conn.execute(f"CREATE UNIQUE INDEX ux_{table_name}_key ON {table_name} ({key_columns})")
+
+
+def _result_keys(conn):
+    for table_name, key in _RESULT_KEYS_V1.items():
+        if not _index_exists(conn, f"ux_{table_name}_key"):
+            _create_result_key(conn, table_name, key, "reference_id IS NOT NULL")
+
+
+def _result_claim_keys(conn):
+    # The key gains claim_id; databases keyed by migration 1 get it rebuilt
+    for table_name, key in RESULT_KEYS.items():
+        index_name = f"ux_{table_name}_key"
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")]
+        if 'claim_id' not in columns:
+            conn.execute(f"ALTER TABLE {table_name} ADD COLUMN claim_id TEXT")
+        if 'claim_id' in [row[2] for row in conn.execute(f"PRAGMA index_info({index_name})")]:
+            continue
+        conn.execute(f"DROP INDEX IF EXISTS {index_name}")
+        _create_result_key(conn, table_name, key, "reference_id IS NOT NULL AND claim_id IS NOT NULL")
+
+
+def _lookup_indexes(conn):
+    # aggregated_results/original_results lookups by task_id use the leading column of ux_*_key
+    for statement in [
+        # GetItem / CheckItemStatus / requestItem duplicate check / latest completed task of an item
+        "CREATE INDEX IF NOT EXISTS ix_status_qid ON status (qid, status, start_time)",
+        # checkQueue / checkCompleted / checkErrors and the queue claim order
+        "CREATE INDEX IF NOT EXISTS ix_status_status ON status (status, priority DESC, start_time)",
+        # Queued-task counts per scheduling class, answered from the index alone
+        "CREATE INDEX IF NOT EXISTS ix_status_status_request_type ON status (status, request_type)",
+        # Per-item label counts, answered from the index alone
+        "CREATE INDEX IF NOT EXISTS ix_aggregated_results_qid ON aggregated_results (qid, task_id, result)",
+        "CREATE INDEX IF NOT EXISTS ix_original_results_qid ON original_results (qid, task_id)",
+    ]:
+        conn.execute(statement)
+
+
+def _item_health(conn):
+    item_health.ensure_table(conn)
+    item_health.rebuild(conn)
+
+
+def _metrics_rollup(conn):
+    metrics.ensure_table(conn)
+    metrics.rebuild(conn)
+
+
+def _status_time_index(conn):
+    # Keyset pages / time windows of checkQueue / checkCompleted / checkErrors, in (start_time, task_id) order
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_status_status_time ON status (status, start_time, task_id)")
+
+
+
+def _label_count_index(conn):
+    # item_health.LABEL_COUNTS_SQL (per task, grouped by result) answered from the index alone
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_aggregated_results_task_result ON aggregated_results (task_id, result)")
+
+
+def _claimed_at_index(conn):
+    # scheduler.QUEUE_WAIT_SQL: claims in the report window, covering the columns it reads
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_status_claimed_at ON status (claimed_at, enqueued_at, request_type)")
+
+
+MIGRATIONS = [
+    (0, 'baseline', _baseline),
+    (1, 'result_keys', _result_keys),
+    (2, 'lookup_indexes', _lookup_indexes),
+    (3, 'item_health', _item_health),
+    (4, 'worklists', worklists.ensure_tables),
+    (5, 'metrics_rollup', _metrics_rollup),
+    (6, 'status_time_index', _status_time_index),
+    (7, 'result_claim_keys', _result_claim_keys),
+    (8, 'page_sentences', page_sentences.ensure_table),
+    (9, 'label_count_index', _label_count_index),
+    (10, 'claimed_at_index', _claimed_at_index),
+]
+
+
+def ensure_migrations_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT,
+        applied_at REAL
+    )
+    """)
+    conn.commit()
+
+
+def applied_versions(conn) -> List[int]:
+    ensure_migrations_table(conn)
+    return [row[0] for row in conn.execute("SELECT version FROM schema_migrations ORDER BY version")]
+
+
+def migrate(conn) -> List[int]:
+    """Applies every pending migration; returns the versions applied."""
+    done = set(applied_versions(conn))
+    applied = []
+    for version, name, apply in MIGRATIONS:
+        if version in done:
+            continue
+        if conn.in_transaction:
+            conn.commit()
+        # sqlite3 does not open a transaction for DDL by itself; without BEGIN a failed migration
+        # would leave its earlier statements applied. IMMEDIATE serialises workers migrating at once.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM schema_migrations WHERE version = ?", (version,)).fetchone():
+                conn.rollback()
+                continue
+            apply(conn)
+            conn.execute("INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                         (version, name, time.time()))
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            logging.error(f"Migration {version} ({name}) failed: {e}")
+            raise
+        print(f"Applied migration {version}: {name}")
+        applied.append(version)
+    return applied
+
+
+# Hot API queries and the index each one must use
+# The statements are taken from the modules that run them, so the check plans the real SQL
+API_QUERY_PLANS: Dict[str, Tuple[str, tuple, Union[str, Tuple[str, ...]]]] = {
+    'GetItem status': (functions.filtered_sql('status', 'qid'), ('Q42',), 'ix_status_qid'),
+    # Either index serves the task_id lookup; the planner's pick depends on which was built last
+    'GetItem results': (functions.filtered_sql('aggregated_results', 'task_id'), ('t',),
+                        ('ix_aggregated_results_task_result', 'ux_aggregated_results_key')),
+    'checkQueue': (functions.status_query('in queue')[0], ('in queue',), 'ix_status_status'),
+    'checkCompleted page': (*functions.status_page_query('completed', '2024-01-01', None, ('2024-01-02', 't')),
+                            'ix_status_status_time'),
+    'checkCompleted total': (*functions.status_query('completed', '2024-01-01', '2024-02-01', columns='COUNT(*)',
+                                                     ordered=False), 'ix_status_status_time'),
+    'requestItem duplicate check': (functions.DUPLICATE_CHECK_SQL, ('Q42', 'in queue', 'in progress'), 'ix_status_qid'),
+    'latest completed task': (change_detection.LATEST_COMPLETED_SQL, ('Q42', 'v'), 'ix_status_qid'),
+    'item label counts': (item_health.LABEL_COUNTS_SQL, ('t',), 'ix_aggregated_results_task_result'),
+    'getSimpleResult': (item_health.GET_ITEM_SQL, ('Q42',), 'sqlite_autoindex_item_health_1'),
+    'getBulkResults latest tasks': (functions.BULK_LATEST_SQL, ('["Q42", "Q1"]',), 'ix_status_qid'),
+    'worklist by label': (worklists.by_label_sql('REFUTES'), (100,), 'ix_item_health_refutes'),
+    'plot_status window': (metrics.SERIES_SQL, ('hour', '2024-01-01T00', '2024-01-07T23'),
+                           'sqlite_autoindex_metrics_rollup_1'),
+    'worklist top cited': (worklists.TOP_CITED_SQL, (100,), 'ix_item_sitelinks_n'),
+    'worklist top cited without site links': (worklists.UNLINKED_SQL, (100,), 'ix_item_health_refutes'),
+    'queue wait report': (scheduler.QUEUE_WAIT_SQL, (0.0,), 'ix_status_claimed_at'),
+    **{f'queued count ({scheduling_class})': (*scheduler.count_queued_query(scheduling_class),
+                                          'ix_status_status_request_type')
+       for scheduling_class in (scheduler.INTERACTIVE, scheduler.BACKGROUND)},
+}
+
+
+def query_plan(conn, sql, params) -> List[str]:
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+
+
+def check_query_plans(conn) -> List[str]:
+    """Returns a description of every API query that no longer uses its index."""
+    problems = []
+    for name, (sql, params, index_name) in API_QUERY_PLANS.items():
+        plan = query_plan(conn, sql, params)
+        index_names = (index_name,) if isinstance(index_name, str) else index_name
+        if not any(name_ in step for step in plan for name_ in index_names):
+            problems.append(f"{name}: expected {' or '.join(index_names)}, got {' | '.join(plan)}")
+    return problems
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    check = '--check' in args
+    args = [a for a in args if a != '--check']
+    if args:
+        path = args[0]
+    else:
+        import yaml
+        with open('config.yaml', 'r') as file:
+            path = yaml.safe_load(file)['database']['result_db_for_API']
+    with sqlite3.connect(path) as conn:
+        if check:
+            problems = check_query_plans(conn)
+            for problem in problems:
+                print(problem)
+            print(f"{len(API_QUERY_PLANS) - len(problems)}/{len(API_QUERY_PLANS)} API queries use their index")
+            sys.exit(1 if problems else 0)
+        migrate(conn)
@@ -1,120 +1,64 @@
-import wikidata_reader
-import html_fetching
-import reference_checking
-import pandas as pd
+import change_detection
+import task_queue
+import scheduler
+import db_migrations
+import db_connections
+import item_health
+import metrics
+import resources
+import model_host
+import page_sentences
+from pipeline import Pipeline, Stage
 import sqlite3
+import logging
 import os
-from SPARQLWrapper import SPARQLWrapper, JSON
 import random
 import datetime
 import time
 import uuid
 import yaml
 
-def save_to_sqlite(result_df, db_path, table_name):
-    result_df = result_df.astype(str)
-    conn = sqlite3.connect(db_path)
+# The stage modules (wikidata_reader, html_fetching, reference_checking) pull in
+# spaCy, selenium, torch and transformers, and pandas is needed only for results.
+# They are imported where a stage runs, so a worker polling an empty queue starts fast.
+
+def save_to_sqlite(result_df, db_path, table_name, conn=None):
+    # With `conn`, the rows join the caller's transaction and are committed by the caller
+    own_conn = conn is None
+    if own_conn:
+        conn = db_connections.get_connection(db_path)
+    pages = None
+    if 'page_sentences' in result_df.columns:
+        # Compacted rows: their pages are saved in the same transaction as the rows referring to them
+        pages = result_df[result_df['page_sentences'].notna()]
+        result_df = result_df.drop(columns=['page_sentences'])
+    columns = list(result_df.columns)
+    query = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    key = db_migrations.RESULT_KEYS.get(table_name)
+    if key:
+        updates = ', '.join(f"{c} = excluded.{c}" for c in columns if c not in key)
+        query += f" ON CONFLICT({', '.join(key)}) DO " + (f"UPDATE SET {updates}" if updates else "NOTHING")
+    # Values are stored as their str() form, as before
+    rows = ([str(value) for value in row] for row in result_df.itertuples(index=False, name=None))
     try:
-        # Insert new data
-        result_df.to_sql(table_name, conn, if_exists='append', index=False)
-
-        # Remove duplicates, considering both task_id and id
-        conn.execute(f"""
-        DELETE FROM {table_name}
-        WHERE (task_id, id) NOT IN (
-            SELECT task_id, MAX(id)
-            FROM {table_name}
-            GROUP BY task_id, id
-        )
-        """)
-
-        conn.commit()
+        if pages is not None:
+            page_sentences.save(conn, zip(pages['nlp_sentences'], pages['url'], pages['page_sentences']))
+        conn.executemany(query, rows)
+        if own_conn:
+            conn.commit()
     except sqlite3.Error as e:
         print(f"An error occurred: {e}")
+        if not own_conn:
+            raise
         conn.rollback()
-    finally:
-        conn.close()
 
 def initialize_database(db_path):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS original_results (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        final_verbalisation TEXT,
-        url TEXT,
-        nlp_sentences TEXT,
-        nlp_sentences_slide_2 TEXT,
-        nlp_sentences_scores TEXT,
-        nlp_sentences_slide_2_scores TEXT,
-        nlp_sentences_TOP_N TEXT,
-        nlp_sentences_slide_2_TOP_N TEXT,
-        nlp_sentences_all_TOP_N TEXT,
-        evidence_TE_prob_TOP_N TEXT,
-        evidence_TE_prob_weighted_TOP_N TEXT,
-        evidence_TE_labels_TOP_N TEXT,
-        claim_TE_prob_weighted_sum_TOP_N TEXT,
-        claim_TE_label_weighted_sum_TOP_N TEXT,
-        claim_TE_label_malon_TOP_N TEXT,
-        evidence_TE_prob_slide_2_TOP_N TEXT,
-        evidence_TE_prob_weighted_slide_2_TOP_N TEXT,
-        evidence_TE_labels_slide_2_TOP_N TEXT,
-        claim_TE_prob_weighted_sum_slide_2_TOP_N TEXT,
-        claim_TE_label_weighted_sum_slide_2_TOP_N TEXT,
-        claim_TE_label_malon_slide_2_TOP_N TEXT,
-        evidence_TE_prob_all_TOP_N TEXT,
-        evidence_TE_prob_weighted_all_TOP_N TEXT,
-        evidence_TE_labels_all_TOP_N TEXT,
-        claim_TE_prob_weighted_sum_all_TOP_N TEXT,
-        claim_TE_label_weighted_sum_all_TOP_N TEXT,
-        claim_TE_label_malon_all_TOP_N TEXT,
-        qid TEXT,
-        processed_timestamp TEXT,
-        task_id TEXT
-    )
-    """)
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS aggregated_results (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        triple TEXT,
-        property_id TEXT,
-        url TEXT,
-        Results TEXT,
-        qid TEXT,
-        reference_id TEXT,
-        task_id TEXT,
-        result TEXT,
-        result_sentence TEXT
-    )
-    """)
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS reformedHTML_results (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        qid TEXT,
-        HTML TEXT,
-        task_id TEXT
-    )
-    """)
-
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS status (
-        task_id TEXT PRIMARY KEY,
-        qid TEXT,
-        status TEXT,
-        start_time TEXT,
-        algo_version TEXT,
-        request_type TEXT
-    )
-    """)
-
-
-    conn.commit()
+    conn = db_connections.connect(db_path)
+    db_migrations.migrate(conn)
     conn.close()
 
 def get_random_qids(num_qids, max_retries, delay):
+    from SPARQLWrapper import SPARQLWrapper, JSON
     sparql = SPARQLWrapper("https://query.wikidata.org/sparql")
     sparql.setQuery("""
         SELECT ?item {
@@ -157,8 +101,10 @@ def get_random_qids(num_qids, max_retries, delay):
     return []  # This line should never be reached, but it's here for completeness
 
 def get_popular_connected_qids(num_qids):
+    import pandas as pd
     file_path = 'CodeArchive/prior_item_list.csv'  # Add .csv extension
     url = "https://quarry.wmcloud.org/run/888614/output/0/csv"
+
     def format_qid(qid):
         return 'Q' + str(qid).lstrip('Q')
     if os.path.exists(file_path):
@@ -184,43 +130,120 @@ def update_status(conn, qid, status, algo_version, request_type):
     task_id = str(uuid.uuid4())  # Generate a random UUID
     start_time = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
     cursor.execute('''
-    INSERT INTO status (task_id, qid, status, start_time, algo_version, request_type)
-    VALUES (?, ?, ?, ?, ?, ?)
-    ''', (task_id, qid, status, start_time, algo_version, request_type))
+    INSERT INTO status (task_id, qid, status, start_time, algo_version, request_type, priority, enqueued_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (task_id, qid, status, start_time, algo_version, request_type, task_queue.priority_for(request_type), time.time()))
     conn.commit()
     return task_id
 
+def enqueue_backfill(conn, batch_qids, algo_version, watermark):
+    # Background items only while no user request is waiting and the backlog is low
+    if not scheduler.should_backfill(conn, watermark):
+        return
+    #qids = get_random_qids(batch_qids, 10, 1)
+    qids = get_popular_connected_qids(batch_qids)
+    for qid in qids:
+        update_status(conn, qid, "in queue", algo_version, 'from_pagepile')
+
 def get_queued_qids(conn):
     cursor = conn.cursor()
     cursor.execute('SELECT task_id, qid, start_time FROM status WHERE status = "in queue"')
     return [(row[0], row[1], row[2]) for row in cursor.fetchall()]
 
-def prove_process(db_path, batch_qids, algo_version):
-    original_results, aggregated_results, reformedHTML_results = pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+def plan_incremental_checks(conn, parse_db_path, qids, algo_version):
+    # Compare each item's (claim, reference) fingerprints with its last completed task
+    reference_ids, plans = {}, {}
+    for qid in qids:
+        fingerprints = change_detection.compute_pair_fingerprints(parse_db_path, qid, algo_version)
+        previous_task_id = change_detection.latest_completed_task(conn, qid, algo_version)
+        previous = change_detection.load_fingerprints(conn, previous_task_id) if previous_task_id else {}
+        changed, unchanged = change_detection.plan_recomputation(fingerprints, previous)
+        reference_ids[qid] = changed
+        plans[qid] = (fingerprints, previous_task_id, unchanged)
+        logging.info(f"QID {qid}: {len(changed)} references to check, {len(unchanged)} unchanged")
+    return reference_ids, plans
+
+def finish_task(db_path, task_id, worker_id, status="completed"):
+    with db_connections.connection(db_path) as conn:
+        task_queue.finish_task(conn, task_id, worker_id, status)
+
+def record_error(conn, qid, task_id):
+    # Bookkeeping for a task that ran out of attempts; joins the caller's transaction
+    item_health.update_item(conn, qid, task_id, task_queue.ERROR)
+    metrics.record_task(conn, task_id, task_queue.ERROR)
+
+def fail_task(db_path, qid, task_id, worker_id, max_attempts):
+    with db_connections.connection(db_path) as conn:
+        new_status = task_queue.retry_or_fail(conn, task_id, worker_id, max_attempts, commit=False)
+        if new_status == task_queue.ERROR:
+            record_error(conn, qid, task_id)
+    print(f"Task {task_id} failed, now '{new_status}'")
+
+def requeue_expired(conn, max_attempts):
+    # Tasks whose lease expired on their last attempt are errors, recorded like failed ones
+    for task_id, qid, new_status in task_queue.requeue_expired(conn, max_attempts, commit=False):
+        if new_status == task_queue.ERROR:
+            record_error(conn, qid, task_id)
+    conn.commit()
+
+def save_task_results(db_path, qid, task_id, task_original, task_aggregated, plan, worker_id) -> bool:
+    """Saves a task's results and completes it, unless this worker lost its lease; returns whether it saved."""
+    # Results, carried-forward rows, fingerprints and the status change commit as one transaction
+    try:
+        with db_connections.connection(db_path) as task_conn:
+            # Checked first: holds the write lock, so the task cannot be requeued until this transaction ends
+            task_queue.confirm_lease(task_conn, task_id, worker_id)
+            if not task_original.empty:
+                task_original['task_id'] = task_id
+                save_to_sqlite(task_original, db_path, 'original_results', task_conn)
+            if not task_aggregated.empty:
+                task_aggregated['task_id'] = task_id
+                save_to_sqlite(task_aggregated, db_path, 'aggregated_results', task_conn)
+
+            fingerprints, previous_task_id, unchanged = plan
+            if previous_task_id:
+                change_detection.carry_forward(task_conn, qid, previous_task_id, task_id, unchanged)
+            change_detection.save_fingerprints(task_conn, task_id, qid, fingerprints)
+            item_health.update_item(task_conn, qid, task_id, task_queue.COMPLETED)
+            metrics.record_task(task_conn, task_id, task_queue.COMPLETED)
+            if not task_queue.finish_task(task_conn, task_id, worker_id, task_queue.COMPLETED, commit=False):
+                raise task_queue.LeaseLost(f"Task {task_id} is no longer held by {worker_id}")
+    except task_queue.LeaseLost as e:
+        # Rolled back: the task was requeued and runs again under the same task_id
+        print(f"{e}; its results were discarded")
+        return False
+    return True
+
+def prove_process(db_path, batch_qids, algo_version, parse_db_path='wikidata_claims_refs_parsed.db', lease=None, queue_config=None, scheduler_config=None):
+    queue_config = queue_config or {}
+    scheduler_config = scheduler_config or {}
+    lease_seconds = queue_config.get('lease_seconds', 900)
+    max_attempts = queue_config.get('max_attempts', 3)
+    worker_id = lease.worker_id if lease else task_queue.make_worker_id()
+    queued_qids, task_ids = [], []
 
     try:
-        conn = sqlite3.connect(db_path)
-        if len(get_queued_qids(conn)) < batch_qids:
-            """
-            #qids = get_random_qids(batch_qids, 10, 1)
-            #qids = get_popular_connected_qids(batch_qids)  
-            for qid in qids:
-                task_id = update_status(conn, qid, "in queue", algo_version, 'random_running')
-            """
-        qids = get_popular_connected_qids(batch_qids)  
-        for qid in qids:
-            task_id = update_status(conn, qid, "in queue", algo_version, 'from_pagepile')
-        queued_tasks = get_queued_qids(conn)[:batch_qids] 
-        queued_qids = [qid for _, qid, _ in queued_tasks]
-        task_ids = [task_id for task_id, _, _ in queued_tasks]
-        print(f"Tasks in queue: {queued_tasks}")
+        conn = db_connections.get_connection(db_path)
+        requeue_expired(conn, max_attempts)
+        enqueue_backfill(conn, batch_qids, algo_version, scheduler_config.get('backfill_watermark', batch_qids))
+        queued_tasks = scheduler.claim_next(conn, worker_id, batch_qids, lease_seconds)
+        queued_qids = [qid for _, qid, _, _ in queued_tasks]
+        task_ids = [task_id for task_id, _, _, _ in queued_tasks]
+        if lease:
+            for task_id in task_ids:
+                lease.add(task_id)
+        print(f"Tasks claimed by {worker_id}: {queued_tasks}")
 
         if queued_qids:
+            import pandas as pd
+            import wikidata_reader, html_fetching, reference_checking
+            original_results, aggregated_results, reformedHTML_results = pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
             # Process all queued QIDs in batch
             print(f"Processing QIDs: {queued_qids}")
             wikidata_reader.main(queued_qids)
             html_fetching.main(queued_qids)
-            batch_original, batch_aggregated, batch_reformedHTML = reference_checking.main(queued_qids)
+            reference_ids, plans = plan_incremental_checks(conn, parse_db_path, queued_qids, algo_version)
+            batch_original, batch_aggregated, batch_reformedHTML = reference_checking.main(queued_qids, reference_ids)
 
             # Process results for each QID
             for qid, task_id in zip(queued_qids, task_ids):
@@ -231,24 +254,15 @@ def prove_process(db_path, batch_qids, algo_version):
                 task_aggregated = batch_aggregated[batch_aggregated['qid'] == qid] if not batch_aggregated.empty else pd.DataFrame()
                 task_reformedHTML = batch_reformedHTML[batch_reformedHTML['qid'] == qid] if not batch_reformedHTML.empty else pd.DataFrame()
 
-                with sqlite3.connect(db_path) as task_conn:
-                    if not task_original.empty:
-                        task_original['task_id'] = task_id
-                        save_to_sqlite(task_original, db_path, 'original_results')
-                    if not task_aggregated.empty:
-                        task_aggregated['task_id'] = task_id
-                        save_to_sqlite(task_aggregated, db_path, 'aggregated_results')
-                    if not task_reformedHTML.empty:
-                        task_reformedHTML['task_id'] = task_id
-                        #save_to_sqlite(task_reformedHTML, db_path, 'reformedHTML_results')
-
-                    cursor = task_conn.cursor()
-                    cursor.execute('''
-                    UPDATE status
-                    SET status = ?, start_time = ?
-                    WHERE task_id = ?
-                    ''', ("completed", datetime.datetime.now().isoformat(), task_id))
-                
+                saved = save_task_results(db_path, qid, task_id, task_original, task_aggregated, plans[qid], worker_id)
+                if lease:
+                    lease.discard(task_id)
+                if not saved:
+                    continue
+                if not task_reformedHTML.empty:
+                    task_reformedHTML['task_id'] = task_id
+                    #save_to_sqlite(task_reformedHTML, db_path, 'reformedHTML_results')
+
                 # Concatenate results
                 original_results = pd.concat([original_results, task_original])
                 aggregated_results = pd.concat([aggregated_results, task_aggregated])
@@ -266,17 +280,103 @@ def prove_process(db_path, batch_qids, algo_version):
     except Exception as e:
         print(f"An error occurred: {e}")
         for task_id, qid in zip(task_ids, queued_qids):
-            with sqlite3.connect(db_path) as error_conn:
-                cursor = error_conn.cursor()
-                cursor.execute('''
-                UPDATE status
-                SET status = ?, start_time = ?
-                WHERE task_id = ?
-                ''', ("error", datetime.datetime.now().isoformat(), task_id))
+            fail_task(db_path, qid, task_id, worker_id, max_attempts)
         raise
     finally:
-        if 'conn' in locals():
-            conn.close()
+        if lease:
+            for task_id in task_ids:
+                lease.discard(task_id)
+
+def build_pipeline(db_path, algo_version, parse_db_path, pipeline_config, lease, max_attempts):
+    # QIDs flow parse -> fetch -> check one by one, so stages of different items overlap
+    workers = pipeline_config.get('workers', {})
+
+    def parse_stage(task, _):
+        import wikidata_reader
+        wikidata_reader.main([task['qid']])
+        return task
+
+    def fetch_stage(task, _):
+        import html_fetching
+        html_fetching.main([task['qid']])
+        return task
+
+    def open_checker():
+        import reference_checking
+        return reference_checking.ReferenceChecker().__enter__()
+
+    def close_checker(checker):
+        if checker:
+            checker.__exit__(None, None, None)
+
+    def check_stage(task, checker):
+        import reference_checking
+        qid, task_id = task['qid'], task['task_id']
+        with db_connections.connection(db_path) as conn:
+            reference_ids, plans = plan_incremental_checks(conn, parse_db_path, [qid], algo_version)
+        task_original, task_aggregated, _ = reference_checking.check_qids(checker, [qid], reference_ids)
+        saved = save_task_results(db_path, qid, task_id, task_original, task_aggregated, plans[qid], lease.worker_id)
+        lease.discard(task_id)
+        if saved:
+            print(f"Completed processing QID {qid} with Task ID {task_id}")
+
+    def on_error(task, stage_name, e):
+        print(f"An error occurred in stage {stage_name} for QID {task['qid']}: {e}")
+        fail_task(db_path, task['qid'], task['task_id'], lease.worker_id, max_attempts)
+        lease.discard(task['task_id'])
+
+    stages = [
+        Stage('wikidata_reader', parse_stage, workers.get('wikidata_reader', 1)),
+        Stage('html_fetching', fetch_stage, workers.get('html_fetching', 1)),
+        Stage('reference_checking', check_stage, workers.get('reference_checking', 1),
+              setup=open_checker, teardown=close_checker),
+    ]
+    return Pipeline(stages, queue_size=pipeline_config.get('queue_size', 2), on_error=on_error,
+                    priority=lambda task: 0 if task['class'] == scheduler.INTERACTIVE else 1,
+                    # fail_task could not record the failure: stop heartbeating so the lease expires and it is requeued
+                    on_drop=lambda task: lease.discard(task['task_id']))
+
+def prove_pipelined(db_path, batch_qids, algo_version, parse_db_path, pipeline_config, lease, queue_config, scheduler_config):
+    lease_seconds = queue_config.get('lease_seconds', 900)
+    max_attempts = queue_config.get('max_attempts', 3)
+    pipe = build_pipeline(db_path, algo_version, parse_db_path, pipeline_config, lease, max_attempts).start()
+    stats_interval = pipeline_config.get('stats_interval', 60)
+    last_stats = time.monotonic()
+    try:
+        while True:
+            try:
+                has_capacity = pipe.has_capacity()
+                with db_connections.connection(db_path) as conn:
+                    requeue_expired(conn, max_attempts)
+                    enqueue_backfill(conn, batch_qids, algo_version, scheduler_config.get('backfill_watermark', batch_qids))
+                    # Only claim what the first stage can take now; the rest stays available to other workers
+                    queued_tasks = scheduler.claim_next(conn, lease.worker_id, batch_qids, lease_seconds) if has_capacity else []
+
+                if not has_capacity:
+                    print("Pipeline is backed up; waiting for the first stage to take more QIDs.")
+                    time.sleep(4)
+                elif not queued_tasks:
+                    print("No QIDs in queue to process.")
+                    time.sleep(4)
+                for task_id, qid, _, scheduling_class in queued_tasks:
+                    lease.add(task_id)
+                    # blocks while the parse stage is backed up; interactive tasks take the next free slot
+                    pipe.submit({'task_id': task_id, 'qid': qid, 'class': scheduling_class})
+
+                if time.monotonic() - last_stats >= stats_interval:
+                    pipe.log_stats()
+                    with db_connections.connection(db_path) as conn:
+                        scheduler.log_queue_wait_stats(conn, scheduler_config.get('wait_report_window', 86400))
+                    last_stats = time.monotonic()
+            except Exception as e:
+                # Same as the batch loop: a failed poll (e.g. a locked database) is retried, not fatal
+                print(f"An error occurred in the pipeline loop: {e}")
+                time.sleep(30)
+    except KeyboardInterrupt:
+        print("Process interrupted by user.")
+    finally:
+        pipe.stop()
+        pipe.log_stats()
 
 def load_config(config_path: str):
     with open(config_path, 'r') as file:
@@ -287,16 +387,34 @@ def main(batch_qids):
     reset_database = False  # Developer mode to test, it initialize db for getting clean db
     config = load_config('config.yaml')
     db_path = config['database']['result_db_for_API']
+    parse_db_path = config['database']['name']
     algo_version = config['version']['algo_version']
     if reset_database and os.path.exists(db_path):
         os.remove(db_path)
         print(f"Database file {db_path} has been deleted.")
     
+    db_connections.configure(config.get('sqlite'))
+    # Pin the worker and size thread pools before any stage imports torch or spaCy (under model_host
+    # the parent already loaded them with its pool sizes, so this only pins the forked worker)
+    resources.configure(config.get('resources'))
+    resources.apply_process_settings()
     initialize_database(db_path)
 
+    queue_config = config.get('task_queue', {})
+    lease = task_queue.LeaseKeeper(db_path, task_queue.make_worker_id(),
+                                   queue_config.get('lease_seconds', 900),
+                                   queue_config.get('heartbeat_interval', 60)).start()
+    print(f"Worker {lease.worker_id} started")
+
+    scheduler_config = config.get('scheduler', {})
+    pipeline_config = config.get('pipeline', {})
+    if pipeline_config.get('enabled', False):
+        prove_pipelined(db_path, batch_qids, algo_version, parse_db_path, pipeline_config, lease, queue_config, scheduler_config)
+        return
+
     while True:
         try:
-            prove_process(db_path, batch_qids, algo_version)
+            prove_process(db_path, batch_qids, algo_version, parse_db_path, lease, queue_config, scheduler_config)
 
         except Exception as e:
             print(f"An error occurred in the main loop: {e}")
@@ -305,6 +423,12 @@ def main(batch_qids):
 
 if __name__ == "__main__":
     batch_qids = 2
-    main(batch_qids)
+    host_config = load_config('config.yaml').get('model_host', {})
+    if host_config.get('workers', 1) > 1:
+        # Models are loaded once here and shared copy-on-write with the forked workers
+        model_host.run_workers(host_config['workers'], main, (batch_qids,),
+                               report_interval=host_config.get('memory_report_interval', 300))
+    else:
+        main(batch_qids)
     # nohup python3 eventHandler.py > output.log 2>&1 &
     # nohup python3 -u eventHandler.py > output.log 2>&1 &
\ No newline at end of file
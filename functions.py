@@ -1,28 +1,56 @@
 import sqlite3
-import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 import yaml
 import uuid
 from urllib.parse import urlparse
 import json
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import plotly.io as pio
-import requests
-
+import base64
+import task_queue
+import scheduler
+import db_connections
+import item_health
+import worklists
+import metrics
+import page_sentences
+import time
+
+# Nothing is read or connected at import time: config.yaml is loaded and the results
+# DB opened on first use, and pandas/plotly are imported inside the functions that
+# need them, so API workers start fast and can import this module before the DB exists.
 
 #Params.
 def load_config(config_path: str):
     with open(config_path, 'r') as file:
         return yaml.safe_load(file)
-config = load_config('config.yaml')
 
-db_path = config['database']['result_db_for_API']
-algo_version = config['version']['algo_version']
+_config = None
+
+def get_config():
+    global _config
+    if _config is None:
+        _config = load_config('config.yaml')
+        db_connections.configure(_config.get('sqlite'))
+    return _config
+
+def get_db_path():
+    return get_config()['database']['result_db_for_API']
+
+def get_algo_version():
+    return get_config()['version']['algo_version']
+
+def __getattr__(name):
+    # Keeps `functions.config`, `functions.db_path` and `functions.algo_version` working for callers
+    if name == 'config':
+        return get_config()
+    if name == 'db_path':
+        return get_db_path()
+    if name == 'algo_version':
+        return get_algo_version()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 #Table summary
 def get_all_tables_and_schemas(db_path):
-    conn = sqlite3.connect(db_path)
+    conn = db_connections.get_connection(db_path)
     cursor = conn.cursor()
 
     # Get all table names
@@ -35,7 +63,6 @@ def get_all_tables_and_schemas(db_path):
         schema = cursor.fetchall()
         table_schemas[table_name] = schema
 
-    conn.close()
     return table_schemas
 
 def print_schemas(table_schemas):
@@ -45,31 +72,31 @@ def print_schemas(table_schemas):
         for column in schema:
             print(f"  Name: {column[1]}, Type: {column[2]}, NotNull: {column[3]}, DefaultVal: {column[4]}, PK: {column[5]}")
 
-table_schemas = get_all_tables_and_schemas(db_path)
-
-
-print("\nSchema information for each table:")
-print_schemas(table_schemas)
+def show_schemas():
+    print("\nSchema information for each table:")
+    print_schemas(get_all_tables_and_schemas(get_db_path()))
 
 #Utils
+def filtered_sql(table_name, column_name):
+    return f"SELECT * FROM {table_name} WHERE {column_name} = ?"
+
 def get_filtered_data(db_path, table_name, column_name, filter_value):
-    conn = sqlite3.connect(db_path)
+    conn = db_connections.get_connection(db_path)
     cursor = conn.cursor()
     
     cursor.execute(f"PRAGMA table_info({table_name})")
     columns = [col[1] for col in cursor.fetchall()]
     
-    query = f"SELECT * FROM {table_name} WHERE {column_name} = ?"
-    cursor.execute(query, (filter_value,))
+    cursor.execute(filtered_sql(table_name, column_name), (filter_value,))
     results = cursor.fetchall()
     
-    conn.close()
-    
     data = [dict(zip(columns, row)) for row in results]
+    if table_name == 'original_results':
+        data = page_sentences.resolve_rows(conn, data)
     return data
 
 def get_full_data(db_path, table_name):
-    conn = sqlite3.connect(db_path)
+    conn = db_connections.get_connection(db_path)
     cursor = conn.cursor()
     
     cursor.execute(f"PRAGMA table_info({table_name})")
@@ -78,8 +105,9 @@ def get_full_data(db_path, table_name):
     query = f"SELECT * FROM {table_name}"
     cursor.execute(query)
     results = cursor.fetchall()
-    conn.close()
     data = [dict(zip(columns, row)) for row in results]
+    if table_name == 'original_results':
+        data = page_sentences.resolve_rows(conn, data)
     return data
 
 
@@ -87,10 +115,10 @@ def get_full_data(db_path, table_name):
 #1. items
 #1.1. check the aggregated results for an item (only recent one)
 def GetItem(target_id):
-    check_item = get_filtered_data(db_path, 'status', 'qid', f'{target_id}')
+    check_item = get_filtered_data(get_db_path(), 'status', 'qid', f'{target_id}')
     if len(check_item) != 0:
         check_item = max(check_item, key=lambda x: x['start_time'][:-5])#select recent one
-        getResult_item = get_filtered_data(db_path, 'aggregated_results', 'task_id', check_item['task_id'])
+        getResult_item = get_filtered_data(get_db_path(), 'aggregated_results', 'task_id', check_item['task_id'])
 
         if len(getResult_item) ==0:
             getResult_item = [{'Result':'No available URLs'}]
@@ -104,7 +132,7 @@ def GetItem(target_id):
         return [{'error': 'Not processed yet'}]
 
 def CheckItemStatus(target_id):
-    check_item = get_filtered_data(db_path, 'status', 'qid', f'{target_id}')
+    check_item = get_filtered_data(get_db_path(), 'status', 'qid', f'{target_id}')
     if len(check_item) != 0:
         return check_item[-1]
     else:
@@ -137,6 +165,7 @@ def comprehensive_results(target_id):
                         'REFUTES': 'No external URLs'
                         }
             else:
+                import pandas as pd
                 details =  pd.DataFrame(response[1:])
                 chekck_value_counts = details['result'].value_counts() 
                 health_value = 1-((chekck_value_counts.get('REFUTES', 0)+ chekck_value_counts.get('NOT ENOUGH INFO', 0)*0.5)/chekck_value_counts.sum())
@@ -146,27 +175,186 @@ def comprehensive_results(target_id):
                         'SUPPORTS': details[details['result']=='SUPPORTS'].to_dict()
                         }
 
+#1.3. reference health summary for an item, one row lookup in item_health (kept up to date on task completion)
+def simple_results(target_id):
+    return health_summary(target_id, item_health.get_item(db_connections.get_connection(get_db_path()), target_id))
+
+def health_summary(target_id, row):
+    if row is None:
+        value = 'Not processed yet'
+    elif row['status'] == 'error':
+        value = 'processing error'
+    elif not row['total']:
+        value = 'No external URLs'
+    else:
+        return {'qid': target_id,
+                'task_id': row['task_id'],
+                'health_value': row['health_value'],
+                'REFUTES': row['refutes'],
+                'NOT ENOUGH INFO': row['not_enough_info'],
+                'SUPPORTS': row['supports'],
+                'updated_at': row['updated_at']
+                }
+    return {'qid': target_id,
+            'health_value': value,
+            'NOT ENOUGH INFO': value,
+            'SUPPORTS': value,
+            'REFUTES': value
+            }
+
+
+#1.4. many items at once: latest task and health summary of every QID from one query
+MAX_BULK_QIDS = 10000
+HEALTH_COLUMNS = ('task_id', 'status', 'supports', 'refutes', 'not_enough_info', 'total', 'health_value', 'updated_at')
+# Checked by db_migrations.API_QUERY_PLANS
+BULK_LATEST_SQL = f'''
+    WITH wanted(qid) AS (SELECT value FROM json_each(?)),
+    latest AS (
+        SELECT qid, task_id, status, start_time,
+               ROW_NUMBER() OVER (PARTITION BY qid ORDER BY start_time DESC) AS n
+        FROM status WHERE qid IN (SELECT qid FROM wanted)
+    )
+    SELECT w.qid, l.task_id, l.status, l.start_time, {', '.join('h.' + c for c in HEALTH_COLUMNS)}, h.qid IS NOT NULL
+    FROM wanted w
+    LEFT JOIN latest l ON l.qid = w.qid AND l.n = 1
+    LEFT JOIN item_health h ON h.qid = w.qid
+    '''
+
+def bulk_results(conn, target_ids, details=False):
+    """[{'qid', 'latest_task', 'summary'[, 'results']}] in the order of `target_ids` (duplicates dropped).
+    `latest_task` is the newest status row of the item (None if never requested); `summary` and the
+    optional `results` come from its latest finished task, like simple_results."""
+    target_ids = list(dict.fromkeys(target_ids))
+    if len(target_ids) > MAX_BULK_QIDS:
+        raise ValueError(f"At most {MAX_BULK_QIDS} QIDs per request, got {len(target_ids)}")
+    rows = conn.execute(BULK_LATEST_SQL, (json.dumps(target_ids),)).fetchall()
+    by_qid = {}
+    for row in rows:
+        qid, latest_task_id, latest_status, latest_start = row[:4]
+        health = dict(zip(HEALTH_COLUMNS, row[4:-1])) if row[-1] else None
+        by_qid[qid] = {'qid': qid,
+                       'latest_task': {'task_id': latest_task_id, 'status': latest_status, 'start_time': latest_start}
+                                      if latest_task_id else None,
+                       'summary': health_summary(qid, health)}
+    items = [by_qid[qid] for qid in target_ids]
+    if details:
+        task_ids = [item['summary']['task_id'] for item in items if 'task_id' in item['summary']]
+        results = {}
+        cursor = conn.execute("SELECT * FROM aggregated_results WHERE task_id IN (SELECT value FROM json_each(?))",
+                              (json.dumps(task_ids),))
+        columns = [d[0] for d in cursor.description]
+        for values in cursor:
+            row = dict(zip(columns, values))
+            task_id = row['task_id']
+            for key in ('id', 'Results', 'task_id', 'reference_id'):
+                row.pop(key, None)
+            results.setdefault(task_id, []).append(row)
+        for item in items:
+            item['results'] = results.get(item['summary'].get('task_id'), [])
+    return items
+
+def GetItems(target_ids, details=False):
+    return bulk_results(db_connections.get_connection(get_db_path()), target_ids, details)
+
 
 #2. status
+# Status lists are read in (start_time, task_id) order, optionally limited to a start_time
+# window [since, until) of ISO timestamps (prefixes such as '2024-05-01' work). Pages are
+# keyset-paginated: the opaque cursor holds the (start_time, task_id) of the last row returned.
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(start_time, task_id):
+    return base64.urlsafe_b64encode(json.dumps([start_time, task_id]).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        start_time, task_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return start_time, task_id
+
+def status_query(status, since=None, until=None, after=None, columns='*', ordered=True):
+    """(sql, params) selecting `columns` of the status rows in the window, after the keyset `after`."""
+    where, params = ["status = ?"], [status]
+    if since:
+        where.append("start_time >= ?")
+        params.append(since)
+    if until:
+        where.append("start_time < ?")
+        params.append(until)
+    if after is not None:
+        start_time, task_id = after
+        if start_time is None:
+            # NULL start_time sorts first; the rest of those rows, then everything with a start_time
+            where.append("(start_time IS NOT NULL OR task_id > ?)")
+            params.append(task_id)
+        else:
+            where.append("(start_time, task_id) > (?, ?)")
+            params += [start_time, task_id]
+    sql = f"SELECT {columns} FROM status WHERE {' AND '.join(where)}"
+    return (f"{sql} ORDER BY start_time, task_id" if ordered else sql), params
+
+def status_page_query(status, since=None, until=None, after=None, limit=100):
+    sql, params = status_query(status, since, until, after)
+    return f"{sql} LIMIT ?", params + [limit + 1]
+
+def count_status(conn, status, since=None, until=None):
+    sql, params = status_query(status, since, until, columns='COUNT(*)', ordered=False)
+    return conn.execute(sql, params).fetchone()[0]
+
+def iter_status(conn, status, since=None, until=None, after=None, batch_size=500):
+    """Yields status rows (without algo_version) from the cursor, `batch_size` at a time."""
+    sql, params = status_query(status, since, until, after)
+    cursor = conn.execute(sql, params)
+    try:
+        columns = [d[0] for d in cursor.description]
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield {k: v for k, v in zip(columns, row) if k != 'algo_version'}
+    finally:
+        cursor.close()
+
+def status_page(conn, status, limit=100, cursor=None, since=None, until=None):
+    """One page of status rows: {'items', 'next_cursor' (None on the last page), 'total' (rows in the window)}."""
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    after = decode_cursor(cursor) if cursor else None
+    sql, params = status_page_query(status, since, until, after, limit)
+    query = conn.execute(sql, params)
+    columns = [d[0] for d in query.description]
+    rows = [{k: v for k, v in zip(columns, row) if k != 'algo_version'} for row in query.fetchall()]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['start_time'], rows[-1]['task_id'])
+    return {'items': rows, 'next_cursor': next_cursor, 'total': count_status(conn, status, since, until)}
+
 #2.1. checkQueue
-def checkQueue():
-    data_df = get_filtered_data(db_path, 'status', 'status', 'in queue')
-    data_df = [{k: v for k, v in item.items() if k not in 'algo_version'} for item in data_df]
-    return data_df
+def checkQueue(since=None, until=None):
+    return list(iter_status(db_connections.get_connection(get_db_path()), 'in queue', since, until))
+
+def checkQueuePage(limit=100, cursor=None, since=None, until=None):
+    return status_page(db_connections.get_connection(get_db_path()), 'in queue', limit, cursor, since, until)
 #2.2. checkCompleted
-def checkCompleted():
-    data_df = get_filtered_data(db_path, 'status', 'status', 'completed')
-    data_df = [{k: v for k, v in item.items() if k not in 'algo_version'} for item in data_df]
-    return data_df
+def checkCompleted(since=None, until=None):
+    return list(iter_status(db_connections.get_connection(get_db_path()), 'completed', since, until))
+
+def checkCompletedPage(limit=100, cursor=None, since=None, until=None):
+    return status_page(db_connections.get_connection(get_db_path()), 'completed', limit, cursor, since, until)
 #2.3. checkErrors
-def checkErrors():
-    data_df = get_filtered_data(db_path, 'status', 'status', 'error')
-    data_df = [{k: v for k, v in item.items() if k not in 'algo_version'} for item in data_df]
-    return data_df
+def checkErrors(since=None, until=None):
+    return list(iter_status(db_connections.get_connection(get_db_path()), 'error', since, until))
+
+def checkErrorsPage(limit=100, cursor=None, since=None, until=None):
+    return status_page(db_connections.get_connection(get_db_path()), 'error', limit, cursor, since, until)
 #2.4. checkParams
+#2.5. checkQueueWait
+def checkQueueWait(window_seconds=86400):
+    return scheduler.queue_wait_stats(db_connections.get_connection(get_db_path()), window_seconds)
 
 #3. statistics
-data_df = get_filtered_data(db_path, 'status', 'status', 'in queue')
 
 #4. requests
 def update_status(conn, qid, status, algo_version, request_type):
@@ -174,9 +362,9 @@ def update_status(conn, qid, status, algo_version, request_type):
     task_id = str(uuid.uuid4())
     start_time = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
     cursor.execute('''
-        INSERT INTO status (task_id, qid, status, start_time, algo_version, request_type)
-        VALUES (?, ?, ?, ?, ?, ?)
-        ''', (task_id, qid, status, start_time, algo_version, request_type))
+        INSERT INTO status (task_id, qid, status, start_time, algo_version, request_type, priority, enqueued_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (task_id, qid, status, start_time, algo_version, request_type, task_queue.priority_for(request_type), time.time()))
     conn.commit()
     return task_id
 
@@ -185,19 +373,21 @@ def get_queued_qids(conn):
     cursor.execute('SELECT task_id, qid, start_time FROM status WHERE status = "in queue"')
     return [(row[0], row[1], row[2]) for row in cursor.fetchall()]
 
+DUPLICATE_CHECK_SQL = 'SELECT COUNT(*) FROM status WHERE qid = ? AND status IN (?, ?)'
+
 def check_queue_status(conn, qid):
     cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) FROM status WHERE qid = ? AND status = "in queue"', (qid,))
+    cursor.execute(DUPLICATE_CHECK_SQL, (qid, task_queue.IN_QUEUE, task_queue.IN_PROGRESS))
     count = cursor.fetchone()[0]
     return count > 0
 
 def requestItemProcessing(qid):
     conn = None
     try:
-        conn = sqlite3.connect(db_path, timeout=100)
+        conn = db_connections.get_connection(get_db_path())
         if check_queue_status(conn, qid):
             return f"QID {qid} is already in queue. Skipping..."
-        task_id = update_status(conn, qid, "in queue", algo_version, 'user_request')
+        task_id = update_status(conn, qid, "in queue", get_algo_version(), 'user_request')
         queued_tasks = get_queued_qids(conn)
         conn.commit() 
         return f"Task {task_id} created for QID {qid}"
@@ -205,9 +395,6 @@ def requestItemProcessing(qid):
         if conn:
             conn.rollback()  
         return f"An error occurred: {e}"
-    finally:
-        if conn:
-            conn.close()
 
 #5. Generation worklist
 def finding_latest_entries(full_df):
@@ -217,6 +404,7 @@ def finding_latest_entries(full_df):
     return latest_entries
 
 def sorting_items_based_on_results(latest_entries_site, result_label, group_by, top_n):
+    import pandas as pd
     sub_df = latest_entries_site[latest_entries_site['result'] == result_label]
     url_groups = sub_df.groupby(group_by)['url'].apply(list).reset_index(name='url_list')
     item_count = sub_df.groupby(group_by).size().reset_index(name='count')
@@ -228,10 +416,7 @@ def sorting_items_based_on_site(latest_entries_site):
     result_counts = latest_entries_site.groupby('qid')['result'].value_counts().unstack(fill_value=0)
     result_counts.columns.name = None
     result_counts = result_counts.reset_index()
-    url = "https://quarry.wmcloud.org/run/888614/output/0/csv"
-    df = pd.read_csv(url)
-    df = df.rename(columns={'ips_item_id': 'qid', 'count(i.ips_site_id)': 'N_connected_site'})
-    df['qid'] = 'Q' + df['qid'].astype(str)
+    df = load_sitelinks()
     merged_df = result_counts.merge(df, on='qid', how='left').sort_values('N_connected_site')
     return merged_df
 
@@ -243,83 +428,75 @@ def extract_domain(url):
 def dataframe_to_json(df):
     return json.loads(df.to_json(orient='records'))
 
-def generation_worklists():
-    full_df = pd.DataFrame(get_full_data(db_path, 'aggregated_results')).set_index('id')
-    latest_entries = finding_latest_entries(full_df)
-    latest_entries['url_domain'] = latest_entries['url'].apply(extract_domain)
-    url = "https://quarry.wmcloud.org/run/888614/output/0/csv"
-    df = pd.read_csv(url)
-    df = df.rename(columns={'ips_item_id': 'qid', 'count(i.ips_site_id)': 'N_connected_site'})
-    df['qid'] = 'Q' + df['qid'].astype(str)
-    merged_df = latest_entries.merge(df, on='qid', how='left')
-    latest_entries_site = merged_df.sort_values('N_connected_site')
-    grouped_table = sorting_items_based_on_site(latest_entries_site)
-    grouped_table = grouped_table.sort_values('REFUTES', ascending=False)
-    grouped_table = grouped_table.sort_values('N_connected_site', ascending=False)
+def worklist_connection():
+    # The Quarry site-link counts are kept locally; a missing or stale copy is downloaded in the background
+    worklists.refresh_in_background(get_db_path(), get_config().get('worklists', {}).get('sitelinks_max_age_hours', 24))
+    return db_connections.get_connection(get_db_path())
+
+def load_sitelinks():
+    import pandas as pd
+    return pd.read_sql_query('SELECT qid, n_connected_site AS N_connected_site FROM item_sitelinks', worklist_connection())
+
+def generation_worklists(top_n=None):
     result = {
-        'TOP_Cited_Items': dataframe_to_json(grouped_table)
+        'TOP_Cited_Items': worklists.top_cited_items(worklist_connection(), top_n)
     }
     return json.dumps(result)
 
+def label_worklist(result_label='REFUTES', top_n=100):
+    return json.dumps({result_label: worklists.top_items_by_label(worklist_connection(), result_label, top_n)})
 
 
-def plot_status():
-    def extract_hour(x):
-        return x[11:13]
-    status_df = pd.DataFrame(get_full_data(db_path, 'status'))
-    result_df = pd.DataFrame(get_full_data(db_path, 'aggregated_results')).set_index('id')
-    status_subset = status_df[['task_id', 'start_time']].set_index('task_id')
-    result_df = result_df.join(status_subset, on='task_id')
-
-    #Fisrt plot
-    status_df['hour'] = status_df['start_time'].apply(extract_hour)
-    hourly_status = status_df.groupby('hour')['status'].value_counts().unstack(fill_value=0)
 
-    #Second plot
-    result_df['hour'] = result_df['start_time'].apply(extract_hour)
-    hourly_result_df= result_df.groupby('hour')['result'].value_counts().unstack(fill_value=0)
-
-    #Trhid plot
-    hourly_status_request = status_df.groupby('hour')['request_type'].value_counts().unstack(fill_value=0)
+def plot_status(window_hours=168, granularity='hour'):
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+    import plotly.io as pio
 
+    # Reads pre-aggregated counts (metrics_rollup) for the last `window_hours` only
+    since = (datetime.now() - timedelta(hours=window_hours)).isoformat()
+    data = metrics.series(db_connections.get_connection(get_db_path()), granularity, since)
+    status_series = data.get('status', {})
+    result_series = data.get('result', {})
+    request_series = data.get('request_type', {})
+    axis_title = granularity.capitalize()
+    period = 'Hourly' if granularity == 'hour' else 'Daily'
 
     # Create subplots
-    fig = make_subplots(rows=3, cols=1, subplot_titles=("Hourly Status Count", "Hourly Result Count", "Hourly Request Type Count"))
+    fig = make_subplots(rows=3, cols=1, subplot_titles=(f"{period} Status Count", f"{period} Result Count", f"{period} Request Type Count"))
 
     # First plot: Status
-    fig.add_trace(
-        go.Scatter(x=hourly_status.index, y=hourly_status['completed'], name="Completed"),
-        row=1, col=1
-    )
-    fig.add_trace(
-        go.Scatter(x=hourly_status.index, y=hourly_status['error'], name="Error"),
-        row=1, col=1
-    )
+    for status, name in [('completed', 'Completed'), ('error', 'Error')]:
+        counts = status_series.get(status, {})
+        fig.add_trace(
+            go.Scatter(x=list(counts.keys()), y=list(counts.values()), name=name),
+            row=1, col=1
+        )
 
     # Second plot: Results
-    for result_type in hourly_result_df.columns:
+    for result_type, counts in result_series.items():
         fig.add_trace(
-            go.Scatter(x=hourly_result_df.index, y=hourly_result_df[result_type], name=result_type),
+            go.Scatter(x=list(counts.keys()), y=list(counts.values()), name=result_type),
             row=2, col=1
         )
 
     # Third plot: Request Types
-    for request_type in hourly_status_request.columns:
+    for request_type, counts in request_series.items():
         fig.add_trace(
-            go.Scatter(x=hourly_status_request.index, y=hourly_status_request[request_type], name=f"Request: {request_type}"),
+            go.Scatter(x=list(counts.keys()), y=list(counts.values()), name=f"Request: {request_type}"),
             row=3, col=1
         )
 
     # Update layout
     fig.update_layout(
-        title_text="Hourly Status, Result, and Request Type Counts",
+        title_text=f"{period} Status, Result, and Request Type Counts",
         height=1200,  # Increase height to accommodate three subplots
         hovermode="x unified"
     )
 
     # Update axes
     for i in range(1, 4):
-        fig.update_xaxes(title_text="Hour", row=i, col=1)
+        fig.update_xaxes(title_text=axis_title, row=i, col=1)
         fig.update_yaxes(title_text="Count", row=i, col=1)
 
     # Adjust legend
@@ -331,5 +508,13 @@ def plot_status():
         x=0.5
     ))
 
-    plot_html = pio.to_html(fig, full_html=True, include_plotlyjs=True)
-    return plot_html
\ No newline at end of file
+    # 'cdn' (cached by browsers) or the URL of a self-hosted plotly.min.js written by write_plotly_bundle,
+    # instead of inlining the ~3MB bundle into every response
+    plotlyjs = get_config().get('plots', {}).get('plotlyjs', 'cdn')
+    plot_html = pio.to_html(fig, full_html=True, include_plotlyjs=plotlyjs)
+    return plot_html
+
+def write_plotly_bundle(path):
+    from plotly.offline import get_plotlyjs
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(get_plotlyjs())
\ No newline at end of file
@@ -9,20 +9,18 @@ import utils.wikidata_utils as wdutils
 from tqdm import tqdm
 import ast, json
 from datetime import datetime
-import re, string, fasttext, pysbd, spacy, os, lxml, time
+import re, string, os, time
 from bs4 import BeautifulSoup
-from spacy.language import Language
 from json.decoder import JSONDecodeError
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import WebDriverException
 from urllib.parse import quote
 
 import tempfile
 import os
 import pdb
 
+import resources
+import model_host
+
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -269,6 +267,7 @@ class HTMLFetcher:
             logging.error(f"Failed to fetch HTML for URL {url}: {error_message}")
 
     def reading_html_by_chrome(self, driver, url: str) -> None:
+        from selenium.common.exceptions import WebDriverException
         try:
             driver.get(url)
             time.sleep(1)
@@ -291,22 +290,31 @@ class HTMLFetcher:
             logging.error(f"Failed to fetch HTML for URL {url}: {error_message}")
 
 
-    def fetch_and_update_html(self):
+    def fetch_and_update_html(self, urls: List[str] = None):
         batch_size = self.config.get('html_fetching', {}).get('batch_size', 20)
         delay = self.config.get('html_fetching', {}).get('delay', 1.0)
 
         try:
-            self.cursor.execute("SELECT url FROM url_html WHERE html IS NULL")
+            if urls is None:
+                self.cursor.execute("SELECT url FROM url_html WHERE html IS NULL")
+            else:
+                # Only this call's URLs, so concurrent fetch workers don't pick up each other's pages
+                urls = list(set(urls))
+                placeholders = ','.join('?' * len(urls))
+                self.cursor.execute(f"SELECT url FROM url_html WHERE html IS NULL AND url IN ({placeholders})", urls)
             urls_to_fetch = self.cursor.fetchall()
             
             if self.fetching_driver == 'requests':
                 for i, (url,) in enumerate(urls_to_fetch):
                     if i > 0 and i % batch_size == 0:
-                        self.conn.commit()
                         time.sleep(delay)  # Delay to avoid overwhelming the server
 
                     self.reading_html_by_requests(url)
+                    self.conn.commit()  # don't hold the write lock across network fetches
             else:
+                from selenium import webdriver
+                from selenium.webdriver.chrome.service import Service
+                from selenium.webdriver.chrome.options import Options
                 chrome_options = Options()
                 chrome_options.add_argument("--headless")  
                 chrome_options.add_argument("--no-sandbox")
@@ -328,10 +336,10 @@ class HTMLFetcher:
                 driver.set_page_load_timeout(20) 
                 for i, (url,) in enumerate(urls_to_fetch):
                     if i > 0 and i % batch_size == 0:
-                        self.conn.commit()
                         time.sleep(delay)  # Delay to avoid overwhelming the server
 
                     self.reading_html_by_chrome(driver, url)
+                    self.conn.commit()
                 if 'driver' in locals():
                     driver.quit()
                     
@@ -720,12 +728,14 @@ class HTMLTextProcessor:
     def __init__(self, config_path='config.yaml'):
         self.config = load_config(config_path)
         self.reset = self.config.get('parsing', {}).get('reset_database', False)
+        resources.configure(self.config.get('resources'))
         self._RE_COMBINE_WHITESPACE = re.compile(r"\s+")
-        self.ft_model = fasttext.load_model('base/lid.176.ftz')
+        import fasttext, pysbd, spacy
+        self.ft_model = model_host.get('fasttext', lambda: fasttext.load_model('base/lid.176.ftz'))
         self.splitter = pysbd.Segmenter(language="en", clean=False)
         if not spacy.util.is_package("en_core_web_lg"):
             os.system("python -m spacy download en_core_web_lg")
-        self.nlp = spacy.load("en_core_web_lg")
+        self.nlp = model_host.get('spacy', lambda: spacy.load("en_core_web_lg"))
 
 
     def predict_language(self, text: str, k: int = 20) -> List[Tuple[str, float]]:
@@ -789,9 +799,10 @@ class HTMLTextProcessor:
             lambda html: self.retrieve_text_from_html(html).split('\n')
         )
         reference_html_df['extracted_text'] = reference_html_df.extracted_sentences.apply(' '.join)
-        reference_html_df['nlp_sentences'] = reference_html_df.extracted_text.progress_apply(
-            lambda x: [str(s) for s in self.nlp(x).sents]
-        )
+        with resources.threads('spacy'):
+            reference_html_df['nlp_sentences'] = reference_html_df.extracted_text.progress_apply(
+                lambda x: [str(s) for s in self.nlp(x).sents]
+            )
 
         slide_config = self.config['text_processing']['sentence_slide']
         if slide_config['enabled']:
@@ -819,7 +830,7 @@ def main(qids: List[str]):
             fetcher.reset_tables()
         url_references_df = fetcher.get_url_references(qids)
         fetcher.create_url_html_table(url_references_df)
-        fetcher.fetch_and_update_html()
+        fetcher.fetch_and_update_html(url_references_df['url'].tolist() if 'url' in url_references_df else [])
         for qid in qids:  # claim label getting
             html_set = fetcher.process_qid(qid)
             if len(html_set) != 0:
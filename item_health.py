@@ -0,0 +1,88 @@
+import datetime
+from typing import Dict, Optional
+
+# Materialised reference health of every item, as of its latest finished task.
+# The row is rewritten in the same transaction that completes (or fails) a task,
+# so API calls read one row by qid instead of re-aggregating aggregated_results.
+
+LABELS = {
+    'SUPPORTS': 'supports',
+    'REFUTES': 'refutes',
+    'NOT ENOUGH INFO': 'not_enough_info',
+}
+
+
+def ensure_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS item_health (
+        qid TEXT PRIMARY KEY,
+        task_id TEXT,
+        status TEXT,
+        supports INTEGER DEFAULT 0,
+        refutes INTEGER DEFAULT 0,
+        not_enough_info INTEGER DEFAULT 0,
+        total INTEGER DEFAULT 0,
+        health_value REAL,
+        updated_at TEXT
+    )
+    """)
+
+
+def health_value(counts: Dict[str, int], total: int) -> Optional[float]:
+    """Same score as comprehensive_results: NOT ENOUGH INFO counts half as bad as REFUTES."""
+    if not total:
+        return None
+    return 1 - ((counts.get('refutes', 0) + counts.get('not_enough_info', 0) * 0.5) / total)
+
+
+# Both statements are in db_migrations.API_QUERY_PLANS
+LABEL_COUNTS_SQL = "SELECT result, COUNT(*) FROM aggregated_results WHERE task_id = ? GROUP BY result"
+GET_ITEM_SQL = "SELECT * FROM item_health WHERE qid = ?"
+
+
+def label_counts(conn, task_id):
+    counts, total = {column: 0 for column in LABELS.values()}, 0
+    for result, count in conn.execute(LABEL_COUNTS_SQL, (task_id,)):
+        if result is None:
+            continue
+        total += count
+        if result in LABELS:
+            counts[LABELS[result]] = count
+    return counts, total
+
+
+def update_item(conn, qid, task_id, status, updated_at=None):
+    """Recomputes the row of `qid` from `task_id`; older tasks never overwrite newer ones. Does not commit."""
+    updated_at = updated_at or datetime.datetime.now().isoformat()
+    counts, total = label_counts(conn, task_id) if status == 'completed' else ({c: 0 for c in LABELS.values()}, 0)
+    conn.execute('''
+    INSERT INTO item_health (qid, task_id, status, supports, refutes, not_enough_info, total, health_value, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(qid) DO UPDATE SET
+        task_id = excluded.task_id, status = excluded.status, supports = excluded.supports,
+        refutes = excluded.refutes, not_enough_info = excluded.not_enough_info, total = excluded.total,
+        health_value = excluded.health_value, updated_at = excluded.updated_at
+    WHERE excluded.updated_at >= item_health.updated_at
+    ''', (qid, task_id, status, counts['supports'], counts['refutes'], counts['not_enough_info'],
+          total, health_value(counts, total), updated_at))
+
+
+def rebuild(conn):
+    """Fills the table from the latest finished task of every item (used by the migration)."""
+    rows = conn.execute('''
+    SELECT qid, task_id, status, start_time FROM status s
+    WHERE status IN ('completed', 'error') AND start_time = (
+        SELECT MAX(start_time) FROM status WHERE qid = s.qid AND status IN ('completed', 'error')
+    )
+    ''').fetchall()
+    for qid, task_id, status, start_time in rows:
+        update_item(conn, qid, task_id, status, start_time)
+    return len(rows)
+
+
+def get_item(conn, qid) -> Optional[Dict]:
+    cursor = conn.execute(GET_ITEM_SQL, (qid,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip([d[0] for d in cursor.description], row))
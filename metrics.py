@@ -0,0 +1,74 @@
+import datetime
+from typing import Dict
+
+# Hourly and daily counts of finished tasks by status, result label and request
+# type. Rows are incremented in the transaction that finishes a task, so plots
+# read a handful of rows for the requested window instead of whole tables.
+
+GRANULARITIES = {
+    'hour': 13,  # 'YYYY-MM-DDTHH'
+    'day': 10,   # 'YYYY-MM-DD'
+}
+
+
+def ensure_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS metrics_rollup (
+        granularity TEXT,
+        bucket TEXT,
+        dimension TEXT,
+        value TEXT,
+        count INTEGER DEFAULT 0,
+        PRIMARY KEY (granularity, bucket, dimension, value)
+    )
+    """)
+
+
+def _increment(conn, finished_at, dimension, value, count):
+    if value is None or not count:
+        return
+    for granularity, width in GRANULARITIES.items():
+        conn.execute('''
+        INSERT INTO metrics_rollup (granularity, bucket, dimension, value, count) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(granularity, bucket, dimension, value) DO UPDATE SET count = count + excluded.count
+        ''', (granularity, finished_at[:width], dimension, value, count))
+
+
+def record_task(conn, task_id, status, finished_at=None):
+    """Counts a finished task and its result labels. Does not commit."""
+    finished_at = finished_at or datetime.datetime.now().isoformat()
+    row = conn.execute("SELECT request_type FROM status WHERE task_id = ?", (task_id,)).fetchone()
+    _increment(conn, finished_at, 'status', status, 1)
+    _increment(conn, finished_at, 'request_type', row[0] if row else None, 1)
+    if status == 'completed':
+        for result, count in conn.execute(
+                "SELECT result, COUNT(*) FROM aggregated_results WHERE task_id = ? GROUP BY result", (task_id,)).fetchall():
+            _increment(conn, finished_at, 'result', result, count)
+
+
+def rebuild(conn):
+    """Recounts every finished task from status/aggregated_results (used by the migration)."""
+    conn.execute("DELETE FROM metrics_rollup")
+    rows = conn.execute("SELECT task_id, status, start_time FROM status WHERE status IN ('completed', 'error') AND start_time IS NOT NULL").fetchall()
+    for task_id, status, start_time in rows:
+        record_task(conn, task_id, status, start_time)
+    return len(rows)
+
+
+# Checked by db_migrations.API_QUERY_PLANS
+SERIES_SQL = '''
+    SELECT dimension, bucket, value, count FROM metrics_rollup
+    WHERE granularity = ? AND bucket >= ? AND bucket <= ?
+    ORDER BY dimension, bucket
+    '''
+
+
+def series(conn, granularity='hour', since=None, until=None) -> Dict[str, Dict[str, Dict[str, int]]]:
+    """{dimension: {value: {bucket: count}}} for buckets in [since, until]; bounds are ISO timestamps."""
+    width = GRANULARITIES[granularity]
+    since = (since or '0000')[:width]
+    until = (until or '9999')[:width]
+    data = {}
+    for dimension, bucket, value, count in conn.execute(SERIES_SQL, (granularity, since, until)):
+        data.setdefault(dimension, {}).setdefault(value, {})[bucket] = count
+    return data
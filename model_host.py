@@ -0,0 +1,172 @@
+import os
+import gc
+import sys
+import time
+import argparse
+import logging
+import threading
+import multiprocessing
+from typing import Any, Callable, Dict, List
+
+# One copy of every model per host instead of per worker. Inside a process, `get`
+# loads a model once and hands the same object to every checker and pipeline
+# thread. `run_workers` goes further: the parent loads all models, then forks the
+# verification workers, which share the weights copy-on-write (torch tensors,
+# spaCy vectors and the fastText matrix are never written during inference).
+# `memory_report` shows RSS next to PSS/USS per worker, which is what decides how
+# many workers fit on a host.
+#
+#   python model_host.py              # load every model once and print this process's footprint
+#   python model_host.py PID [PID..]  # RSS/PSS/USS of running workers
+
+_models: Dict[Any, Any] = {}
+_lock = threading.Lock()
+
+
+def get(name, factory: Callable[[], Any]):
+    """Returns the process-wide instance of `name`, building it with `factory` on first use."""
+    model = _models.get(name)
+    if model is None:
+        with _lock:
+            model = _models.get(name)
+            if model is None:
+                start = time.perf_counter()
+                model = _models[name] = factory()
+                logging.info(f"Loaded {name} in {time.perf_counter() - start:.1f}s")
+    return model
+
+
+def loaded() -> List[str]:
+    return [str(name) for name in _models]
+
+
+def preload(config_path='config.yaml'):
+    """Loads every model a verification worker uses into this process."""
+    torch = None
+    try:
+        import torch
+        # Loading must not start the OpenMP pool: libgomp is not fork-safe once it has run
+        previous_threads = torch.get_num_threads()
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+    try:
+        import html_fetching
+        import reference_checking
+        html_fetching.HTMLTextProcessor(config_path)
+        checker = reference_checking.ReferenceChecker(config_path)
+        checker.retrieval_module()
+        checker.entailment_module()
+        if torch is not None:
+            # Weights are read-only from here on; keeps them out of autograd bookkeeping
+            for model in _models.values():
+                if isinstance(getattr(model, 'model', None), torch.nn.Module):
+                    model.model.requires_grad_(False)
+    finally:
+        if torch is not None:
+            torch.set_num_threads(previous_threads)
+    logging.info(f"Preloaded models: {', '.join(loaded())}")
+
+
+def _memory_kb(pid) -> Dict[str, int]:
+    values = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as file:
+            for line in file:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                    values[parts[0][:-1]] = int(parts[1])
+    except OSError:
+        pass
+    return values
+
+
+def memory_report(pids) -> List[Dict[str, float]]:
+    """RSS, PSS (shared pages split between sharers) and USS (private pages) per process, in MB."""
+    report = []
+    for pid in pids:
+        values = _memory_kb(pid)
+        if not values:
+            continue
+        report.append({
+            'pid': pid,
+            'rss_mb': values.get('Rss', 0) / 1024,
+            'pss_mb': values.get('Pss', 0) / 1024,
+            'uss_mb': (values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)) / 1024,
+        })
+    return report
+
+
+def log_memory_report(pids, label='worker'):
+    report = memory_report(pids)
+    for row in report:
+        logging.info(f"{label} {row['pid']}: RSS {row['rss_mb']:.0f} MB, PSS {row['pss_mb']:.0f} MB, "
+                     f"USS {row['uss_mb']:.0f} MB")
+    if report:
+        logging.info(f"{len(report)} {label}s: PSS total {sum(r['pss_mb'] for r in report):.0f} MB, "
+                     f"RSS total {sum(r['rss_mb'] for r in report):.0f} MB")
+    return report
+
+
+def _worker_entry(worker_index, target, args):
+    os.environ['PROVE_WORKER_INDEX'] = str(worker_index)
+    target(*args)
+
+
+def run_workers(n_workers, target, args=(), config_path='config.yaml', report_interval=300):
+    """Preloads the models, forks `n_workers` processes running `target(*args)` and reports their memory.
+
+    Workers inherit the loaded models, so `target` must not open database connections or
+    threads before the fork; everything opened in the parent stays in the parent.
+    """
+    if sys.platform != 'linux':
+        raise RuntimeError('Shared model hosting relies on fork copy-on-write (Linux only)')
+    import yaml
+    import db_connections
+    import resources
+    with open(config_path, 'r') as file:
+        resources.configure(yaml.safe_load(file).get('resources'))
+    # Pool sizes are fixed when torch/spaCy load, here in the parent; workers only pin their cores
+    resources.apply_thread_environment()
+    preload(config_path)
+    db_connections.close_thread_connections()
+    # Objects that exist now are never collected; stops the GC from writing to (and so copying) their pages
+    gc.collect()
+    gc.freeze()
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=_worker_entry, args=(index, target, args), name=f'verification-{index}')
+               for index in range(n_workers)]
+    for worker in workers:
+        worker.start()
+    logging.info(f"Started {n_workers} workers sharing the preloaded models: {[w.pid for w in workers]}")
+    try:
+        while any(worker.is_alive() for worker in workers):
+            for worker in workers:
+                worker.join(timeout=report_interval / max(1, len(workers)))
+            log_memory_report([os.getpid()], label='model host')
+            log_memory_report([w.pid for w in workers if w.is_alive()])
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+    finally:
+        for worker in workers:
+            worker.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory of processes sharing the preloaded models')
+    parser.add_argument('pids', nargs='*', type=int, help="processes to report; preloads the models here if omitted")
+    parser.add_argument('--config', default='config.yaml')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if not args.pids:
+        # Footprint of one full set of models, i.e. what each worker costs without sharing
+        preload(args.config)
+        args.pids = [os.getpid()]
+    print(f"{'pid':>8} {'RSS MB':>8} {'PSS MB':>8} {'USS MB':>8}")
+    for row in memory_report(args.pids):
+        print(f"{row['pid']:>8} {row['rss_mb']:>8.0f} {row['pss_mb']:>8.0f} {row['uss_mb']:>8.0f}")
+
+
+if __name__ == '__main__':
+    main()
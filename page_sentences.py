@@ -0,0 +1,64 @@
+import json
+import hashlib
+from typing import Dict, Iterable, List, Tuple
+
+# Sentence lists of cited pages, stored once per page in the results database.
+# With evidence_selection.compact_results, original_results rows hold a
+# "page:<hash>" reference in nlp_sentences and nlp_sentences_slide_2 instead of
+# their own copy of the page. The page is saved in the same transaction as the
+# rows that refer to it (eventHandler.save_to_sqlite); readers call
+# `resolve_rows` to get the lists back, the windows rebuilt from the sentences.
+
+PREFIX = 'page:'
+LIST_COLUMNS = ('nlp_sentences', 'nlp_sentences_slide_2')
+
+
+def ensure_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS page_sentences (
+        page_hash TEXT PRIMARY KEY,
+        url TEXT,
+        nlp_sentences TEXT
+    )
+    """)
+
+
+def page_ref(sentences_json: str) -> str:
+    return PREFIX + hashlib.sha1(sentences_json.encode('utf-8')).hexdigest()
+
+
+def is_ref(value) -> bool:
+    return isinstance(value, str) and value.startswith(PREFIX)
+
+
+def slide_sentences(sentences: List[str], window_size: int = 2) -> List[str]:
+    if not sentences:
+        return ["No TEXT"]
+    if len(sentences) < window_size:
+        return [" ".join(sentences)]
+    return [" ".join(sentences[i:i + window_size]) for i in range(len(sentences) - window_size + 1)]
+
+
+def save(conn, pages: Iterable[Tuple[str, str, str]]):
+    """Stores (reference, url, sentence list as JSON) rows. Does not commit."""
+    conn.executemany("INSERT OR IGNORE INTO page_sentences (page_hash, url, nlp_sentences) VALUES (?, ?, ?)",
+                     [(ref[len(PREFIX):], url, sentences_json) for ref, url, sentences_json in pages])
+
+
+def resolve_rows(conn, rows: List[Dict]) -> List[Dict]:
+    """Replaces page references in original_results rows with the lists, in the form uncompacted rows store them."""
+    hashes = {row[column][len(PREFIX):] for row in rows for column in LIST_COLUMNS if is_ref(row.get(column))}
+    if not hashes:
+        return rows
+    stored = {page_hash: json.loads(sentences_json) for page_hash, sentences_json in conn.execute(
+        "SELECT page_hash, nlp_sentences FROM page_sentences WHERE page_hash IN (SELECT value FROM json_each(?))",
+        (json.dumps(sorted(hashes)),))}
+    missing = hashes - stored.keys()
+    if missing:
+        raise LookupError(f"{len(missing)} referenced pages are missing from page_sentences, e.g. {min(missing)}")
+    for row in rows:
+        if is_ref(row.get('nlp_sentences')):
+            row['nlp_sentences'] = str(stored[row['nlp_sentences'][len(PREFIX):]])
+        if is_ref(row.get('nlp_sentences_slide_2')):
+            row['nlp_sentences_slide_2'] = str(slide_sentences(stored[row['nlp_sentences_slide_2'][len(PREFIX):]]))
+    return rows
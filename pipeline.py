@@ -0,0 +1,192 @@
+import itertools
+import queue
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+# Staged execution for the verification pipeline. Each stage has its own pool of
+# worker threads and hands items to the next stage through a bounded queue, so a
+# slow stage applies back-pressure instead of letting work pile up in memory.
+# Queues are ordered by the item's priority (lower first, FIFO within a priority),
+# so urgent items overtake waiting ones at every stage.
+
+_STOP = object()
+_STOP_PRIORITY = float('inf')
+
+
+class Stage:
+    def __init__(self, name: str, func: Callable[[Any, Any], Any], workers: int = 1,
+                 setup: Optional[Callable[[], Any]] = None, teardown: Optional[Callable[[Any], None]] = None):
+        """`func(item, context)` returns the item for the next stage, or None to drop it.
+
+        `setup` runs once in every worker thread and its return value is passed to
+        `func` as `context` (e.g. a model that should be loaded once per worker).
+        """
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+        self.setup = setup
+        self.teardown = teardown
+
+
+class StageStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.active = 0
+
+    def record(self, seconds: float, failed: bool = False):
+        with self.lock:
+            self.busy_seconds += seconds
+            if failed:
+                self.failed += 1
+            else:
+                self.processed += 1
+
+
+class Pipeline:
+    def __init__(self, stages: List[Stage], queue_size: int = 4,
+                 on_error: Optional[Callable[[Any, str, Exception], None]] = None,
+                 priority: Optional[Callable[[Any], float]] = None,
+                 on_drop: Optional[Callable[[Any], None]] = None):
+        """`on_error(item, stage_name, error)` handles a failed item; if it raises (or is not set),
+        `on_drop(item)` is called so the item can at least be released."""
+        self.stages = stages
+        self.queues = [queue.PriorityQueue(maxsize=max(1, queue_size)) for _ in stages]
+        self.priority = priority or (lambda item: 0)
+        self.sequence = itertools.count()
+        self.stats_by_stage = {stage.name: StageStats() for stage in stages}
+        self.on_error = on_error
+        self.on_drop = on_drop
+        self.threads: Dict[str, List[threading.Thread]] = {}
+        self.started_at = None
+
+    def start(self):
+        self.started_at = time.monotonic()
+        for index, stage in enumerate(self.stages):
+            self.threads[stage.name] = []
+            for n in range(stage.workers):
+                thread = threading.Thread(target=self._worker, args=(index,), name=f"{stage.name}-{n}", daemon=True)
+                thread.start()
+                self.threads[stage.name].append(thread)
+        return self
+
+    def submit(self, item, timeout: Optional[float] = None):
+        """Queues an item for the first stage; blocks while that queue is full."""
+        self._put(0, item, timeout=timeout)
+
+    def _put(self, index, item, timeout=None):
+        priority = _STOP_PRIORITY if item is _STOP else self.priority(item)
+        self.queues[index].put((priority, next(self.sequence), item), timeout=timeout)
+
+    def has_capacity(self) -> bool:
+        return not self.queues[0].full()
+
+    def _fail(self, item, stage_name: str, error: Exception):
+        if self.on_error:
+            try:
+                self.on_error(item, stage_name, error)
+                return
+            except Exception as e:
+                logging.error(f"Error handler failed in stage {stage_name} for {item}: {e}")
+        if self.on_drop:
+            try:
+                self.on_drop(item)
+            except Exception as e:
+                logging.error(f"Could not release {item} in stage {stage_name}: {e}")
+
+    def _drain(self, index: int, error: Exception):
+        # A worker whose setup failed keeps taking items so none wait forever on a dead thread; each is failed
+        stage = self.stages[index]
+        inbox = self.queues[index]
+        while True:
+            _, _, item = inbox.get()
+            try:
+                if item is _STOP:
+                    break
+                self.stats_by_stage[stage.name].record(0.0, failed=True)
+                self._fail(item, stage.name, error)
+            finally:
+                inbox.task_done()
+
+    def _worker(self, index: int):
+        stage = self.stages[index]
+        stats = self.stats_by_stage[stage.name]
+        inbox = self.queues[index]
+        has_next = index + 1 < len(self.stages)
+        try:
+            context = stage.setup() if stage.setup else None
+        except Exception as e:
+            logging.error(f"Stage {stage.name} setup failed in {threading.current_thread().name}; "
+                          f"failing the items it receives: {e}")
+            self._drain(index, e)
+            return
+        try:
+            while True:
+                _, _, item = inbox.get()
+                if item is _STOP:
+                    inbox.task_done()
+                    break
+                with stats.lock:
+                    stats.active += 1
+                start = time.monotonic()
+                try:
+                    result = stage.func(item, context)
+                except Exception as e:
+                    stats.record(time.monotonic() - start, failed=True)
+                    logging.error(f"Stage {stage.name} failed for {item}: {e}")
+                    self._fail(item, stage.name, e)
+                else:
+                    stats.record(time.monotonic() - start)
+                    if has_next and result is not None:
+                        self._put(index + 1, result)
+                finally:
+                    with stats.lock:
+                        stats.active -= 1
+                    inbox.task_done()
+        finally:
+            if stage.teardown:
+                stage.teardown(context)
+
+    def join(self):
+        """Waits until every submitted item has left the last stage."""
+        for q in self.queues:
+            q.join()
+
+    def stop(self):
+        # Drain stage by stage so in-flight items are finished before the next stage shuts down
+        for index, stage in enumerate(self.stages):
+            for thread in self.threads.get(stage.name, []):
+                # A thread that has already died would never take its _STOP off a full queue
+                if thread.is_alive():
+                    self._put(index, _STOP)
+            for thread in self.threads.get(stage.name, []):
+                thread.join()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        elapsed = max(time.monotonic() - self.started_at, 1e-9) if self.started_at else 0.0
+        report = []
+        for stage, q in zip(self.stages, self.queues):
+            stats = self.stats_by_stage[stage.name]
+            with stats.lock:
+                report.append({
+                    'stage': stage.name,
+                    'workers': stage.workers,
+                    'active': stats.active,
+                    'queue_depth': q.qsize(),
+                    'processed': stats.processed,
+                    'failed': stats.failed,
+                    'throughput_per_min': stats.processed / elapsed * 60 if elapsed else 0.0,
+                    'avg_seconds': stats.busy_seconds / max(stats.processed + stats.failed, 1),
+                    'utilisation': stats.busy_seconds / (elapsed * stage.workers) if elapsed else 0.0,
+                })
+        return report
+
+    def log_stats(self):
+        for s in self.stats():
+            logging.info(f"[pipeline] {s['stage']}: queue={s['queue_depth']} active={s['active']}/{s['workers']} "
+                         f"done={s['processed']} failed={s['failed']} "
+                         f"{s['throughput_per_min']:.2f}/min avg={s['avg_seconds']:.1f}s util={s['utilisation']:.0%}")
@@ -4,23 +4,35 @@ import pandas as pd
 import numpy as np
 from typing import List, Dict, Any
 import yaml, json
-from utils.verbalisation_module import VerbModule 
-import nltk
 from bs4 import BeautifulSoup
-from cleantext import clean
-from utils.sentence_retrieval_module import SentenceRetrievalModule
-from utils.textual_entailment_module import TextualEntailmentModule
 from tqdm import tqdm
 from datetime import datetime
-import torch, gc
+import gc
+import heapq
+
+import resources
+import model_host
+import page_sentences
+from utils import token_cache
+from utils.candidate_pruning import query_terms, select_candidates, window_candidates
+
+# torch, transformers (via the utils model modules), nltk and cleantext are imported
+# where they are used, so importing this module stays cheap until a check runs.
 
 class ReferenceChecker:
     def __init__(self, config_path: str = 'config.yaml'):
         self.config = self.load_config(config_path)
         self.db_name = self.config['database']['name']
+        resources.configure(self.config.get('resources'))
         self.conn = None
         self.cursor = None
-        self.verb_module = VerbModule()
+        from utils.verbalisation_module import VerbModule, INFERENCE_MODEL_DIR
+        import nltk
+        models_config = self.config.get('models', {})
+        token_cache.configure(models_config.get('token_cache_size'))
+        model_dir = models_config.get('verbaliser_dir', INFERENCE_MODEL_DIR)
+        # One instance per process, shared by every checker (and inherited by forked workers)
+        self.verb_module = model_host.get(('verbaliser', model_dir), lambda: VerbModule(model_dir=model_dir))
         nltk.download('punkt', quiet=True)
 
     def __enter__(self):
@@ -37,6 +49,45 @@ class ReferenceChecker:
         with open(config_path, 'r') as file:
             return yaml.safe_load(file)
 
+    def onnx_threads(self, model_name):
+        # onnxruntime sizes its pool once per session, so the resources budget is applied here
+        threads = self.config.get('models', {}).get('onnx_intra_op_threads', 0)
+        if not threads and resources.SETTINGS['enabled']:
+            threads = resources.thread_budget(model_name)
+        return threads
+
+    def retrieval_module(self):
+        models_config = self.config.get('models', {})
+        max_len = self.config['evidence_selection']['token_size']
+        backend = models_config.get('backend', 'torch')
+        return model_host.get(('sentence_retrieval', backend, max_len),
+                              lambda: self._load_retrieval_module(models_config, backend, max_len))
+
+    def _load_retrieval_module(self, models_config, backend, max_len):
+        if backend == 'onnx':
+            from utils.onnx_backend import OnnxSentenceRetrievalModule
+            return OnnxSentenceRetrievalModule(models_config.get('onnx_dir', 'base/onnx'), max_len,
+                                               self.onnx_threads('sentence_retrieval'),
+                                               models_config.get('onnx_inter_op_threads', 0))
+        from utils.sentence_retrieval_module import SentenceRetrievalModule
+        return SentenceRetrievalModule(max_len=max_len, int8=models_config.get('int8_retrieval', False),
+                                       fused_attention=models_config.get('fused_attention', False))
+
+    def entailment_module(self):
+        models_config = self.config.get('models', {})
+        backend = models_config.get('backend', 'torch')
+        return model_host.get(('textual_entailment', backend),
+                              lambda: self._load_entailment_module(models_config, backend))
+
+    def _load_entailment_module(self, models_config, backend):
+        if backend == 'onnx':
+            from utils.onnx_backend import OnnxTextualEntailmentModule
+            return OnnxTextualEntailmentModule(models_config.get('onnx_dir', 'base/onnx'),
+                                               self.onnx_threads('textual_entailment'),
+                                               models_config.get('onnx_inter_op_threads', 0))
+        from utils.textual_entailment_module import TextualEntailmentModule
+        return TextualEntailmentModule(int8=models_config.get('int8_entailment', False))
+
     def execute_query(self, query: str, params: tuple = ()) -> List[tuple]:
         try:
             self.cursor.execute(query, params)
@@ -70,15 +121,18 @@ class ReferenceChecker:
             }
             triples.append(triple)
         
-        claim_df['verbalisation'] = self.verb_module.verbalise_triples(triples)
+        with resources.threads('verbalisation'):
+            claim_df['verbalisation'] = self.verb_module.verbalise_triples(triples)
         claim_df['verbalisation_unks_replaced'] = claim_df['verbalisation'].apply(self.verb_module.replace_unks_on_sentence)
         claim_df['verbalisation_unks_replaced_then_dropped'] = claim_df['verbalisation'].apply(lambda x: self.verb_module.replace_unks_on_sentence(x, empty_after=True))
         
         return claim_df
 
     def sentenceSplitter(self, verbalised_claims_df_final, reference_text_df):
+        import nltk
+        from cleantext import clean
         join_df = pd.merge(verbalised_claims_df_final, reference_text_df[['reference_id', 'url', 'html']], on='reference_id', how='left')
-        SS_df = join_df[['reference_id','url','verbalisation', 'html']].copy()
+        SS_df = join_df[['claim_id','reference_id','url','verbalisation', 'html']].copy()
         def clean_html(html_content):
             if not html_content or html_content.startswith('Error:'):
                 return "No TEXT"
@@ -118,52 +172,68 @@ class ReferenceChecker:
             except:
                 return ["No TEXT"]
 
-        def slide_sentences(sentences, window_size=2):
-            if not sentences:
-                return ["No TEXT"]
-            try:
-                if len(sentences) < window_size:
-                    return [" ".join(sentences)]
-                return [" ".join(sentences[i:i + window_size]) for i in range(len(sentences) - window_size + 1)]
-            except:
-                return ["No TEXT"]
-        
-        SS_df['html2text'] = SS_df['html'].apply(clean_html)
-        SS_df['nlp_sentences'] = SS_df['html2text'].apply(split_into_sentences)
-        SS_df['nlp_sentences_slide_2'] = SS_df['nlp_sentences'].apply(slide_sentences)
-
-        return SS_df[['reference_id','verbalisation','url','nlp_sentences','nlp_sentences_slide_2']]
+        # A page cited by several claims is split once and its lists are shared by those rows
+        pages = {}
+        def split_page(html):
+            if html not in pages:
+                sentences = split_into_sentences(clean_html(html))
+                pages[html] = (sentences, page_sentences.slide_sentences(sentences))
+            return pages[html]
+
+        split_pages = [split_page(html) for html in SS_df['html']]
+        SS_df['nlp_sentences'] = [sentences for sentences, _ in split_pages]
+        SS_df['nlp_sentences_slide_2'] = [windows for _, windows in split_pages]
+        # Labels and aliases for the first-stage retriever in evidence_selection (not stored)
+        label_columns = [c for c in ['entity_label', 'entity_alias', 'object_label', 'object_alias'] if c in join_df.columns]
+        SS_df['query_labels'] = join_df[label_columns].values.tolist() if label_columns else [[] for _ in range(len(SS_df))]
+
+        return SS_df[['claim_id','reference_id','verbalisation','url','nlp_sentences','nlp_sentences_slide_2','query_labels']]
     
     def evidence_selection(self, splited_sentences_from_html: pd.DataFrame) -> pd.DataFrame:
-        sr_module = SentenceRetrievalModule(max_len=self.config['evidence_selection']['token_size'])
+        sr_module = self.retrieval_module()
         sentence_relevance_df = splited_sentences_from_html.copy()
         sentence_relevance_df.rename(columns={'verbalisation': 'final_verbalisation'}, inplace=True)
+        query_labels = sentence_relevance_df.pop('query_labels') if 'query_labels' in sentence_relevance_df else None
+        candidate_k = self.config['evidence_selection'].get('candidate_k', 0)
+        window_threshold = self.config['evidence_selection'].get('window_threshold')
+        n_top = self.config['evidence_selection']['n_top_sentences']
+        compact = self.config['evidence_selection'].get('compact_results', False)
 
         def chunks(l: List, n: int) -> List[List]:
             n = max(1, n)
             return [l[i:i + n] for i in range(0, len(l), n)]
         
-        def compute_scores(column_name: str) -> None:
-            all_outputs = []
-            for _, row in tqdm(sentence_relevance_df.iterrows(), total=sentence_relevance_df.shape[0]):
-                outputs = []
-                for batch in chunks(row[column_name], self.config['evidence_selection']['batch_size']):
-                    batch_outputs = sr_module.score_sentence_pairs([(row['final_verbalisation'], sentence) for sentence in batch])
-                    outputs += batch_outputs
-                all_outputs.append(outputs)
-            sentence_relevance_df[f'{column_name}_scores'] = pd.Series(all_outputs)
-            assert all(sentence_relevance_df.apply(lambda x: len(x[column_name]) == len(x[f'{column_name}_scores']), axis=1))
-
-        compute_scores('nlp_sentences')
-        compute_scores('nlp_sentences_slide_2')
-
-        def get_top_n_sentences(row: pd.Series, column_name: str, n: int) -> List[Dict]:
-            try:
-                sentences_with_scores = [{'sentence': t[0], 'score': t[1], 'sentence_id': f"{row.name}_{j}"} for j, t in enumerate(zip(row[column_name], row[f'{column_name}_scores']))]
-                return sorted(sentences_with_scores, key=lambda x: x['score'], reverse=True)[:n]
-            except Exception as e:
-                print(f"Error in get_top_n_sentences: {e}")
-                return [{'sentence': '', 'score': 0, 'sentence_id': ''}]
+        def candidate_indices(index, row: pd.Series, column_name: str, sentence_scores: List = None) -> List[int]:
+            # BM25 pre-selection; with candidate_k 0 every sentence is a candidate
+            labels = query_labels[index] if query_labels is not None else []
+            candidates = select_candidates(query_terms(row['final_verbalisation'], labels), row[column_name], candidate_k)
+            if column_name == 'nlp_sentences_slide_2' and window_threshold is not None:
+                # Windows whose sentences all scored at or below the threshold are not scored, unless
+                # BM25 picked them: the union keeps at least TOP_N windows (an intersection could not)
+                windows = window_candidates(sentence_scores, len(row[column_name]), window_threshold, n_top)
+                candidates = sorted(set(windows).union(candidates) if candidate_k > 0 else windows)
+            return candidates
+
+        def score_column(index, row: pd.Series, column_name: str, sentence_scores: List = None):
+            """Scores the candidates into a top-N heap; returns the top N as (index, score), every score and a summary."""
+            candidates = candidate_indices(index, row, column_name, sentence_scores)
+            # Sentences outside the candidates keep a None score and cannot be selected
+            scores = [None] * len(row[column_name])
+            heap = []
+            for batch in chunks(candidates, self.config['evidence_selection']['batch_size']):
+                batch_outputs = sr_module.score_sentence_pairs([(row['final_verbalisation'], row[column_name][i]) for i in batch])
+                for i, score in zip(batch, batch_outputs):
+                    scores[i] = score
+                    # Ties keep page order, as the stable sort did
+                    if len(heap) < n_top:
+                        heapq.heappush(heap, (score, -i))
+                    elif (score, -i) > heap[0]:
+                        heapq.heapreplace(heap, (score, -i))
+            top = [(-negative_i, score) for score, negative_i in sorted(heap, reverse=True)]
+            scored = [score for score in scores if score is not None]
+            summary = {'count': len(scores), 'scored': len(scored), 'max': max(scored) if scored else None,
+                       'mean': sum(scored) / len(scored) if scored else None}
+            return top, scores, summary
 
         def filter_overlaps(sentences: List[Dict]) -> List[Dict]:
             filtered = []
@@ -180,31 +250,55 @@ class ReferenceChecker:
         def limit_sentence_length(sentence: str, max_length: int) -> str:
             return sentence[:max_length] + '...' if len(sentence) > max_length else sentence
 
-        nlp_sentences_TOP_N, nlp_sentences_slide_2_TOP_N, nlp_sentences_all_TOP_N = [{'sentence': '', 'score': ''}], [{'sentence': '', 'score': ''}], [{'sentence': '', 'score': ''}]
-        
+        def evidence(row: pd.Series, column_name: str, top) -> List[Dict]:
+            return [{'sentence': limit_sentence_length(row[column_name][j], 1024), 'score': score, 'sentence_id': f"{row.name}_{j}"}
+                    for j, score in top]
+
         nlp_sentences_TOP_N, nlp_sentences_slide_2_TOP_N, nlp_sentences_all_TOP_N = [], [], []
+        score_columns = {'nlp_sentences_scores': [], 'nlp_sentences_slide_2_scores': []}
         
-        for _, row in tqdm(sentence_relevance_df.iterrows(), total=sentence_relevance_df.shape[0]):
+        # Rows are scored one at a time; with compact_results a row's score lists are dropped once its top N is taken
+        for index, row in tqdm(sentence_relevance_df.iterrows(), total=sentence_relevance_df.shape[0]):
+            with resources.threads('sentence_retrieval'):
+                top, scores, summary = score_column(index, row, 'nlp_sentences')
+                top_slide_2, scores_slide_2, summary_slide_2 = score_column(index, row, 'nlp_sentences_slide_2', scores)
+            score_columns['nlp_sentences_scores'].append(summary if compact else scores)
+            score_columns['nlp_sentences_slide_2_scores'].append(summary_slide_2 if compact else scores_slide_2)
             try:
-                top_n = get_top_n_sentences(row, 'nlp_sentences', self.config['evidence_selection']['n_top_sentences'])
-                top_n = [{'sentence': limit_sentence_length(s['sentence'], 1024), 'score': s['score'], 'sentence_id': s['sentence_id']} for s in top_n]
+                top_n = evidence(row, 'nlp_sentences', top)
                 nlp_sentences_TOP_N.append(top_n)
                 
-                top_n_slide_2 = get_top_n_sentences(row, 'nlp_sentences_slide_2', self.config['evidence_selection']['n_top_sentences'])
-                top_n_slide_2 = [{'sentence': limit_sentence_length(s['sentence'], 1024), 'score': s['score'], 'sentence_id': s['sentence_id']} for s in top_n_slide_2]
+                top_n_slide_2 = evidence(row, 'nlp_sentences_slide_2', top_slide_2)
                 nlp_sentences_slide_2_TOP_N.append(top_n_slide_2)
                 
                 all_sentences = top_n + top_n_slide_2
                 all_sentences_sorted = sorted(all_sentences, key=lambda x: x['score'], reverse=True)
                 filtered_sentences = filter_overlaps(all_sentences_sorted)
-                filtered_sentences = [{'sentence': limit_sentence_length(s['sentence'], 1024), 'score': s['score'], 'sentence_id': s['sentence_id']} for s in filtered_sentences]
-                nlp_sentences_all_TOP_N.append(filtered_sentences[:self.config['evidence_selection']['n_top_sentences']])
+                nlp_sentences_all_TOP_N.append(filtered_sentences[:n_top])
             except Exception as e:
                 print(f"Error processing row: {e}")
                 nlp_sentences_TOP_N.append([{'sentence': '', 'score': 0, 'sentence_id': ''}])
                 nlp_sentences_slide_2_TOP_N.append([{'sentence': '', 'score': 0, 'sentence_id': ''}])
                 nlp_sentences_all_TOP_N.append([{'sentence': '', 'score': 0, 'sentence_id': ''}])
 
+        for column_name, values in score_columns.items():
+            sentence_relevance_df[column_name] = pd.Series(values)
+        if compact:
+            # Rows keep a reference to their page; the first row citing it carries the sentences,
+            # which save_to_sqlite moves to page_sentences (the windows are rebuilt from them)
+            refs, pages, page_refs = [], [], {}
+            for sentences in sentence_relevance_df['nlp_sentences']:
+                if id(sentences) in page_refs:
+                    pages.append(None)
+                else:
+                    sentences_json = json.dumps(sentences)
+                    page_refs[id(sentences)] = page_sentences.page_ref(sentences_json)
+                    pages.append(sentences_json)
+                refs.append(page_refs[id(sentences)])
+            sentence_relevance_df['nlp_sentences'] = refs
+            sentence_relevance_df['nlp_sentences_slide_2'] = refs
+            sentence_relevance_df['page_sentences'] = pages
+
         sentence_relevance_df['nlp_sentences_TOP_N'] = pd.Series(nlp_sentences_TOP_N)
         sentence_relevance_df['nlp_sentences_slide_2_TOP_N'] = pd.Series(nlp_sentences_slide_2_TOP_N)
         sentence_relevance_df['nlp_sentences_all_TOP_N'] = pd.Series(nlp_sentences_all_TOP_N)
@@ -214,7 +308,7 @@ class ReferenceChecker:
     def textEntailment(self, evidence_df):
         SCORE_THRESHOLD=self.config['evidence_selection']['score_threshold']
         textual_entailment_df = evidence_df.copy()
-        te_module = TextualEntailmentModule()
+        te_module = self.entailment_module()
 
         keys = ['TOP_N', 'slide_2_TOP_N', 'all_TOP_N']
         te_columns = {f'evidence_TE_prob_{key}': [] for key in keys}
@@ -270,11 +364,12 @@ class ReferenceChecker:
                     'claim_TE_label_malon': claim_TE_label_malon
                 }
             return results
-        for i, row in tqdm(textual_entailment_df.iterrows(), total=textual_entailment_df.shape[0]):
-            result_sets = process_row(row)
-            for key in keys:
-                for k, v in result_sets[key].items():
-                    te_columns[f'{k}_{key}'].append(v)
+        with resources.threads('textual_entailment'):
+            for i, row in tqdm(textual_entailment_df.iterrows(), total=textual_entailment_df.shape[0]):
+                result_sets = process_row(row)
+                for key in keys:
+                    for k, v in result_sets[key].items():
+                        te_columns[f'{k}_{key}'].append(v)
 
 
 
@@ -410,33 +505,46 @@ def freq_selection_for_result(aggregated_result):
 
     
     
-def main(qids: List[str]):
-    with ReferenceChecker() as checker:
-        original_results = pd.DataFrame()
-        aggregated_results = pd.DataFrame()
-        reformedHTML_results = pd.DataFrame()
-        for qid in qids:
-            claim_df = checker.get_claim_df(qid)
-            html_df = checker.get_html_df(qid)
-            if len(html_df) != 0:
-                verbalised_claims_df_final = checker.verbalisation(claim_df)
-                splited_sentences_from_html = checker.sentenceSplitter(verbalised_claims_df_final, html_df)
-                evidence_df = checker.evidence_selection(splited_sentences_from_html)
-                original_result = checker.textEntailment(evidence_df)
-                original_result['qid'] = qid
-                aggregated_result, reformedHTML = checker.TableMaking(verbalised_claims_df_final, original_result)
-                aggregated_result['qid'] = qid
-                aggregated_result['reference_id'] = original_result.index
-                aggregated_result= aggregated_result.reset_index(drop=True)
-                aggregated_result = pd.concat([aggregated_result, freq_selection_for_result(aggregated_result)], axis=1)
-                reformedHTML_result = pd.DataFrame({'qid': qid, 'HTML': [reformedHTML]})
-                original_result['processed_timestamp'] = datetime.now().isoformat()
-                original_results = pd.concat([original_results, original_result], axis=0)
-                aggregated_results = pd.concat([aggregated_results, aggregated_result], axis=0)
-                reformedHTML_results = pd.concat([reformedHTML_results, reformedHTML_result], axis=0)
+def check_qids(checker: ReferenceChecker, qids: List[str], reference_ids: Dict[str, set] = None):
+    # reference_ids optionally restricts each qid to the references that need re-checking
+    original_results = pd.DataFrame()
+    aggregated_results = pd.DataFrame()
+    reformedHTML_results = pd.DataFrame()
+    for qid in qids:
+        claim_df = checker.get_claim_df(qid)
+        html_df = checker.get_html_df(qid)
+        if reference_ids is not None and qid in reference_ids:
+            claim_df = claim_df[claim_df['reference_id'].isin(reference_ids[qid])].reset_index(drop=True)
+            html_df = html_df[html_df['reference_id'].isin(reference_ids[qid])].reset_index(drop=True)
+        if len(html_df) != 0 and len(claim_df) != 0:
+            verbalised_claims_df_final = checker.verbalisation(claim_df)
+            splited_sentences_from_html = checker.sentenceSplitter(verbalised_claims_df_final, html_df)
+            evidence_df = checker.evidence_selection(splited_sentences_from_html)
+            original_result = checker.textEntailment(evidence_df)
+            original_result['qid'] = qid
+            aggregated_result, reformedHTML = checker.TableMaking(verbalised_claims_df_final, original_result)
+            aggregated_result['qid'] = qid
+            aggregated_result['reference_id'] = original_result.index
+            aggregated_result['claim_id'] = original_result['claim_id'].values
+            aggregated_result= aggregated_result.reset_index(drop=True)
+            aggregated_result = pd.concat([aggregated_result, freq_selection_for_result(aggregated_result)], axis=1)
+            reformedHTML_result = pd.DataFrame({'qid': qid, 'HTML': [reformedHTML]})
+            original_result = original_result.reset_index()
+            original_result['processed_timestamp'] = datetime.now().isoformat()
+            original_results = pd.concat([original_results, original_result], axis=0)
+            aggregated_results = pd.concat([aggregated_results, aggregated_result], axis=0)
+            reformedHTML_results = pd.concat([reformedHTML_results, reformedHTML_result], axis=0)
+        try:
+            import torch
             torch.cuda.empty_cache()
-            gc.collect()
-        return original_results, aggregated_results, reformedHTML_results
+        except ImportError:  # scoring workers on the onnx backend may run without torch
+            pass
+        gc.collect()
+    return original_results, aggregated_results, reformedHTML_results
+
+def main(qids: List[str], reference_ids: Dict[str, set] = None):
+    with ReferenceChecker() as checker:
+        return check_qids(checker, qids, reference_ids)
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -0,0 +1,168 @@
+import os
+import sys
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import List, Optional
+
+# CPU budgets for the models of a worker process. Several workers on one host
+# would otherwise each start one BLAS/OpenMP thread per core and oversubscribe
+# it. Settings come from the `resources` section of config.yaml via `configure`:
+# `apply_process_settings` runs once at worker start-up (before torch is imported),
+# and each model call runs inside `threads(<model>)`. torch's intra-op count (and
+# MKL's, in OpenMP builds) is process-wide, so budgets apply per process: the first
+# model call to start sets its budget, model calls that overlap it in other
+# pipeline threads run under that budget, and the last one to finish restores the
+# previous count. Without the pipeline, calls never overlap and each model gets
+# its own budget.
+
+SETTINGS = {
+    'enabled': False,
+    'cpu_affinity': None,  # None, 'auto' (this worker's share of the cores) or a core list such as '0-7,16-23'
+    'workers_per_host': 1,  # with cpu_affinity 'auto': how many slices the cores are split into
+    'interop_threads': 1,
+    'tokenizers_parallelism': False,
+    'threads': {
+        'verbalisation': 0,  # 0 = every core available to this process
+        'sentence_retrieval': 0,
+        'textual_entailment': 0,
+        'spacy': 1,
+    },
+}
+
+_torch_configured = False
+_lock = threading.Lock()
+_active = 0  # threads() bodies currently running in this process
+_restore_threads = None
+
+
+def configure(settings=None):
+    if settings:
+        threads = dict(SETTINGS['threads'], **settings.get('threads', {}))
+        SETTINGS.update(settings)
+        SETTINGS['threads'] = threads
+
+
+def parse_cores(spec) -> List[int]:
+    """'0-3,8' -> [0, 1, 2, 3, 8]; lists pass through."""
+    if isinstance(spec, (list, tuple)):
+        return sorted(int(c) for c in spec)
+    cores = []
+    for part in str(spec).split(','):
+        part = part.strip()
+        if '-' in part:
+            start, end = part.split('-')
+            cores += range(int(start), int(end) + 1)
+        elif part:
+            cores.append(int(part))
+    return sorted(set(cores))
+
+
+def worker_cores(worker_index: Optional[int] = None) -> Optional[List[int]]:
+    """Cores this process should run on, or None to leave it to the OS."""
+    spec = SETTINGS.get('cpu_affinity')
+    if not spec:
+        return None
+    if spec != 'auto':
+        return parse_cores(spec)
+    available = sorted(os.sched_getaffinity(0))
+    slices = max(1, int(SETTINGS.get('workers_per_host', 1)))
+    if worker_index is None:
+        worker_index = int(os.environ.get('PROVE_WORKER_INDEX', 0))
+    size = max(1, len(available) // slices)
+    start = (worker_index % slices) * size
+    return available[start:start + size] or available
+
+
+def available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # not Linux
+        return os.cpu_count() or 1
+
+
+def thread_budget(name: str) -> int:
+    budget = int(SETTINGS['threads'].get(name, 0) or 0)
+    return min(budget, available_cores()) if budget > 0 else available_cores()
+
+
+def apply_process_settings(worker_index: Optional[int] = None):
+    """Pins the process and sets the thread environment; call before torch/spaCy are imported."""
+    if not SETTINGS['enabled']:
+        return
+    cores = worker_cores(worker_index)
+    if cores:
+        try:
+            os.sched_setaffinity(0, cores)
+        except (AttributeError, OSError) as e:
+            logging.warning(f"Could not pin worker to cores {cores}: {e}")
+    apply_thread_environment()
+    logging.info(f"Worker resources: cores {cores or 'all'} ({available_cores()}), "
+                 f"threads {', '.join(f'{k}={thread_budget(k)}' for k in SETTINGS['threads'])}")
+
+
+def apply_thread_environment():
+    """Default pool sizes for libraries that size their pools once, at import; no effect once they are loaded.
+
+    model_host.run_workers calls this in the parent before loading the models, since forked
+    workers inherit the pools; their later apply_process_settings only pins them.
+    """
+    if not SETTINGS['enabled']:
+        return
+    default_threads = str(max([thread_budget(name) for name in SETTINGS['threads']] or [available_cores()]))
+    for variable in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ.setdefault(variable, default_threads)
+    os.environ['TOKENIZERS_PARALLELISM'] = 'true' if SETTINGS['tokenizers_parallelism'] else 'false'
+
+
+def _configure_torch(torch):
+    global _torch_configured
+    with _lock:
+        if _torch_configured:
+            return
+        _torch_configured = True
+        try:
+            torch.set_num_interop_threads(int(SETTINGS['interop_threads']))
+        except RuntimeError as e:
+            # Only possible before the first inter-op parallel work in the process
+            logging.warning(f"Could not set torch inter-op threads: {e}")
+
+
+def _blas_limits(n: int):
+    # Once torch is loaded its thread count (set in `threads`) is what limits BLAS/OpenMP
+    if 'torch' in sys.modules:
+        return nullcontext()
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return nullcontext()  # the OMP_/OPENBLAS_NUM_THREADS defaults apply instead
+    return threadpool_limits(limits=n)
+
+
+@contextmanager
+def threads(name: str):
+    """Runs the body with the thread budget of `name` (a key of resources.threads), unless another
+    model call in this process already set one; the budget is process-wide, not per thread."""
+    global _active, _restore_threads
+    if not SETTINGS['enabled']:
+        yield
+        return
+    n = thread_budget(name)
+    torch = sys.modules.get('torch')
+    if torch is not None:
+        _configure_torch(torch)
+    with _lock:
+        first = _active == 0
+        _active += 1
+        if first and torch is not None:
+            _restore_threads = torch.get_num_threads()
+            torch.set_num_threads(n)
+    try:
+        with (_blas_limits(n) if first else nullcontext()):
+            yield
+    finally:
+        with _lock:
+            _active -= 1
+            if _active == 0 and _restore_threads is not None:
+                torch.set_num_threads(_restore_threads)
+                _restore_threads = None
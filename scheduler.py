@@ -0,0 +1,107 @@
+import time
+import logging
+from typing import Dict, List, Tuple
+
+import task_queue
+
+# Scheduling classes on top of the task queue. User requests go through an
+# interactive lane that is always claimed first; background backfill
+# (from_pagepile) is only claimed, and only topped up, while no interactive
+# task is waiting. Request types missing from REQUEST_CLASSES are background.
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+REQUEST_CLASSES = {
+    'user_request': INTERACTIVE,
+    'from_pagepile': BACKGROUND,
+    'random_running': BACKGROUND,
+}
+
+
+def class_for(request_type) -> str:
+    return REQUEST_CLASSES.get(request_type, BACKGROUND)
+
+
+def request_types_for(scheduling_class) -> List[str]:
+    return [r for r, c in REQUEST_CLASSES.items() if c == scheduling_class]
+
+
+def class_filter(scheduling_class) -> dict:
+    """claim_tasks keyword arguments selecting a class; background is every non-interactive type."""
+    if scheduling_class == INTERACTIVE:
+        return {'request_types': request_types_for(INTERACTIVE)}
+    return {'exclude_request_types': request_types_for(INTERACTIVE)}
+
+
+def count_queued_query(scheduling_class) -> Tuple[str, list]:
+    """(sql, params) counting the queued tasks of a class; also checked by db_migrations.API_QUERY_PLANS."""
+    type_filter, type_params = task_queue.request_type_filter(**class_filter(scheduling_class))
+    return f"SELECT COUNT(*) FROM status WHERE status = ? {type_filter}", [task_queue.IN_QUEUE] + type_params
+
+
+def count_queued(conn, scheduling_class) -> int:
+    sql, params = count_queued_query(scheduling_class)
+    return conn.execute(sql, params).fetchone()[0]
+
+
+def claim_next(conn, worker_id, limit, lease_seconds) -> List[Tuple[str, str, str, str]]:
+    """Claims up to `limit` tasks, interactive first.
+
+    Returns (task_id, qid, start_time, scheduling_class) tuples. Background tasks are
+    only claimed when the interactive lane is empty after this claim.
+    """
+    claimed = [t + (INTERACTIVE,) for t in task_queue.claim_tasks(
+        conn, worker_id, limit, lease_seconds, **class_filter(INTERACTIVE))]
+    if claimed or count_queued(conn, INTERACTIVE) > 0:
+        return claimed
+    claimed += [t + (BACKGROUND,) for t in task_queue.claim_tasks(
+        conn, worker_id, limit - len(claimed), lease_seconds, **class_filter(BACKGROUND))]
+    return claimed
+
+
+def should_backfill(conn, watermark) -> bool:
+    """Background items are only added while no user is waiting and the backlog is low."""
+    return count_queued(conn, INTERACTIVE) == 0 and count_queued(conn, BACKGROUND) < watermark
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+# Range scan of ix_status_claimed_at, answered from the index alone (db_migrations checks the plan)
+QUEUE_WAIT_SQL = '''
+    SELECT request_type, claimed_at - enqueued_at FROM status
+    WHERE claimed_at IS NOT NULL AND enqueued_at IS NOT NULL AND claimed_at >= ?
+      AND claimed_at >= enqueued_at  -- requeued and not yet claimed again
+    '''
+
+
+def queue_wait_stats(conn, window_seconds=86400) -> Dict[str, Dict[str, float]]:
+    """p50/p95 time between enqueue and claim, per scheduling class, over the last `window_seconds`.
+
+    A retried task is counted from when it re-entered the queue (see task_queue), so time
+    spent on failed attempts is not reported as queue wait.
+    """
+    cursor = conn.execute(QUEUE_WAIT_SQL, (time.time() - window_seconds,))
+    waits = {}
+    for request_type, wait in cursor.fetchall():
+        waits.setdefault(class_for(request_type), []).append(wait)
+    stats = {}
+    for scheduling_class, values in waits.items():
+        values.sort()
+        stats[scheduling_class] = {
+            'count': len(values),
+            'p50_seconds': _percentile(values, 0.50),
+            'p95_seconds': _percentile(values, 0.95),
+        }
+    return stats
+
+
+def log_queue_wait_stats(conn, window_seconds=86400):
+    for scheduling_class, s in queue_wait_stats(conn, window_seconds).items():
+        logging.info(f"[scheduler] {scheduling_class}: {s['count']} claimed, "
+                     f"queue wait p50={s['p50_seconds']:.1f}s p95={s['p95_seconds']:.1f}s")
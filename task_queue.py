@@ -0,0 +1,237 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import datetime
+import logging
+import db_connections
+from typing import List, Tuple
+
+# Work-queue protocol on top of the `status` table, so several verification
+# workers (on one box or several sharing the DB) never process the same task.
+#
+#   in queue --claim--> in progress --finish--> completed / error
+#                            |
+#                            +-- lease expired or failed --> in queue (until max_attempts)
+#
+# A task that goes back to the queue gets a new `enqueued_at`, so `claimed_at -
+# enqueued_at` is the wait before its latest claim, not including earlier attempts.
+#
+# A claim is a single UPDATE ... RETURNING, which SQLite executes under one write
+# lock, so two workers cannot claim the same row. Workers keep their claims alive
+# by extending `lease_expires`; tasks of a crashed worker return to the queue once
+# their lease runs out.
+
+IN_QUEUE = "in queue"
+IN_PROGRESS = "in progress"
+COMPLETED = "completed"
+ERROR = "error"
+
+# Higher runs first
+REQUEST_PRIORITIES = {
+    'user_request': 10,
+    'from_pagepile': 0,
+    'random_running': 0,
+}
+
+QUEUE_COLUMNS = {
+    'priority': 'INTEGER DEFAULT 0',
+    'attempts': 'INTEGER DEFAULT 0',
+    'worker_id': 'TEXT',
+    'lease_expires': 'REAL',
+    'heartbeat_at': 'REAL',
+    'enqueued_at': 'REAL',
+    'claimed_at': 'REAL',
+}
+
+
+def priority_for(request_type) -> int:
+    return REQUEST_PRIORITIES.get(request_type, 0)
+
+
+def make_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def now_iso() -> str:
+    return datetime.datetime.now().isoformat()
+
+
+def ensure_queue_columns(conn):
+    columns = [col[1] for col in conn.execute("PRAGMA table_info(status)").fetchall()]
+    for column, definition in QUEUE_COLUMNS.items():
+        if column not in columns:
+            conn.execute(f"ALTER TABLE status ADD COLUMN {column} {definition}")
+    if 'priority' not in columns:
+        for request_type, priority in REQUEST_PRIORITIES.items():
+            conn.execute("UPDATE status SET priority = ? WHERE request_type = ?", (priority, request_type))
+
+
+def request_type_filter(request_types=None, exclude_request_types=None) -> Tuple[str, list]:
+    """SQL condition (starting with AND) and parameters restricting `status` rows by request_type."""
+    if request_types is not None:
+        return f"AND request_type IN ({','.join('?' * len(request_types))})", list(request_types)
+    if exclude_request_types:
+        # COALESCE: a NULL request_type is not in the excluded list
+        return (f"AND COALESCE(request_type, '') NOT IN ({','.join('?' * len(exclude_request_types))})",
+                list(exclude_request_types))
+    return '', []
+
+
+def claim_tasks(conn, worker_id, limit, lease_seconds, request_types=None,
+                exclude_request_types=None) -> List[Tuple[str, str, str]]:
+    """Atomically moves up to `limit` queued tasks to "in progress" for `worker_id`.
+
+    `request_types` restricts the claim to those request types (e.g. one scheduling class);
+    `exclude_request_types` claims every other type instead.
+    """
+    if limit <= 0:
+        return []
+    now = time.time()
+    type_filter, type_params = request_type_filter(request_types, exclude_request_types)
+    cursor = conn.execute(f'''
+    UPDATE status
+    SET status = ?, worker_id = ?, lease_expires = ?, heartbeat_at = ?, claimed_at = ?,
+        attempts = COALESCE(attempts, 0) + 1
+    WHERE status = ? AND task_id IN (
+        SELECT task_id FROM status
+        WHERE status = ? {type_filter}
+        ORDER BY priority DESC, start_time ASC
+        LIMIT ?
+    )
+    RETURNING task_id, qid, start_time
+    ''', [IN_PROGRESS, worker_id, now + lease_seconds, now, now, IN_QUEUE, IN_QUEUE] + type_params + [limit])
+    claimed = cursor.fetchall()
+    conn.commit()
+    return [(row[0], row[1], row[2]) for row in claimed]
+
+
+def heartbeat(conn, worker_id, task_ids, lease_seconds) -> int:
+    if not task_ids:
+        return 0
+    now = time.time()
+    task_ids = list(task_ids)
+    placeholders = ','.join('?' * len(task_ids))
+    cursor = conn.execute(f'''
+    UPDATE status SET lease_expires = ?, heartbeat_at = ?
+    WHERE worker_id = ? AND status = ? AND task_id IN ({placeholders})
+    ''', [now + lease_seconds, now, worker_id, IN_PROGRESS] + task_ids)
+    conn.commit()
+    return cursor.rowcount
+
+
+class LeaseLost(Exception):
+    """The worker no longer holds the task (its lease expired and the task was requeued or reclaimed)."""
+
+
+def confirm_lease(conn, task_id, worker_id):
+    """Raises LeaseLost unless `worker_id` still holds `task_id`. Does not commit.
+
+    Being an UPDATE, it takes the write lock, so nobody can requeue the task between this
+    check and the caller's commit: run it first in the transaction that saves the results.
+    """
+    cursor = conn.execute('''
+    UPDATE status SET heartbeat_at = ?
+    WHERE task_id = ? AND worker_id = ? AND status = ?
+    ''', (time.time(), task_id, worker_id, IN_PROGRESS))
+    if cursor.rowcount == 0:
+        raise LeaseLost(f"Task {task_id} is no longer held by {worker_id}")
+
+
+def finish_task(conn, task_id, worker_id, status=COMPLETED, commit=True) -> bool:
+    """Marks a claimed task as finished. Returns False if the worker no longer owns it."""
+    cursor = conn.execute('''
+    UPDATE status SET status = ?, start_time = ?, lease_expires = NULL
+    WHERE task_id = ? AND worker_id = ? AND status = ?
+    ''', (status, now_iso(), task_id, worker_id, IN_PROGRESS))
+    if commit:
+        conn.commit()
+    if cursor.rowcount == 0:
+        logging.warning(f"Task {task_id} is no longer held by {worker_id}; result status '{status}' not recorded")
+    return cursor.rowcount > 0
+
+
+def retry_or_fail(conn, task_id, worker_id, max_attempts, commit=True) -> str:
+    """Puts a failed task back in the queue, or marks it as error after `max_attempts`."""
+    cursor = conn.execute('''
+    UPDATE status
+    SET status = CASE WHEN COALESCE(attempts, 0) < ? THEN ? ELSE ? END,
+        enqueued_at = CASE WHEN COALESCE(attempts, 0) < ? THEN ? ELSE enqueued_at END,
+        worker_id = NULL, lease_expires = NULL
+    WHERE task_id = ? AND worker_id = ? AND status = ?
+    RETURNING status
+    ''', (max_attempts, IN_QUEUE, ERROR, max_attempts, time.time(), task_id, worker_id, IN_PROGRESS))
+    row = cursor.fetchone()
+    if commit:
+        conn.commit()
+    return row[0] if row else None
+
+
+def requeue_expired(conn, max_attempts, commit=True) -> List[Tuple[str, str, str]]:
+    """Returns tasks whose lease ran out (their worker died or hung) to the queue.
+
+    Tasks out of attempts become errors instead; returns (task_id, qid, new status) so the
+    caller can record those like any other failed task.
+    """
+    now = time.time()
+    cursor = conn.execute('''
+    UPDATE status
+    SET status = CASE WHEN COALESCE(attempts, 0) < ? THEN ? ELSE ? END,
+        enqueued_at = CASE WHEN COALESCE(attempts, 0) < ? THEN ? ELSE enqueued_at END,
+        worker_id = NULL, lease_expires = NULL
+    WHERE status = ? AND lease_expires < ?
+    RETURNING task_id, qid, status
+    ''', (max_attempts, IN_QUEUE, ERROR, max_attempts, now, IN_PROGRESS, now))
+    expired = cursor.fetchall()
+    if commit:
+        conn.commit()
+    for task_id, _, status in expired:
+        logging.warning(f"Lease expired for task {task_id}; now '{status}'")
+    return [(row[0], row[1], row[2]) for row in expired]
+
+
+class LeaseKeeper:
+    """Background thread that heartbeats every task this worker currently holds."""
+
+    def __init__(self, db_path, worker_id, lease_seconds, interval):
+        self.db_path = db_path
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.interval = interval
+        self.task_ids = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='lease-keeper', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def add(self, task_id):
+        with self.lock:
+            self.task_ids.add(task_id)
+
+    def discard(self, task_id):
+        with self.lock:
+            self.task_ids.discard(task_id)
+
+    def held(self):
+        with self.lock:
+            return set(self.task_ids)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            task_ids = self.held()
+            if not task_ids:
+                continue
+            try:
+                with db_connections.connection(self.db_path) as conn:
+                    heartbeat(conn, self.worker_id, task_ids, self.lease_seconds)
+            except sqlite3.Error as e:
+                logging.error(f"Heartbeat failed for {self.worker_id}: {e}")
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
@@ -46,6 +46,8 @@ PRETRAINED_MODEL_ARCHIVE_MAP = {
     'bert-base-chinese': "https://s3.amazonaws.com/models.huggingface.co/bert/bert-base-chinese.tar.gz",
 }
 CONFIG_NAME = 'bert_config.json'
+# torch>=2.0 fuses scale, mask, softmax, dropout and the second matmul into one kernel
+FUSED_ATTENTION_AVAILABLE = hasattr(nn.functional, 'scaled_dot_product_attention')
 WEIGHTS_NAME = 'pytorch_model.bin'
 TF_WEIGHTS_NAME = 'model.ckpt'
 
@@ -280,6 +282,8 @@ class BertSelfAttention(nn.Module):
         self.value = nn.Linear(config.hidden_size, self.all_head_size)
 
         self.dropout = nn.Dropout(config.attention_probs_dropout_prob)
+        # Off until models.fused_attention turns it on (set_fused_attention)
+        self.use_fused_attention = False
 
     def transpose_for_scores(self, x):
         new_x_shape = x.size()[:-1] + (self.num_attention_heads, self.attention_head_size)
@@ -295,6 +299,14 @@ class BertSelfAttention(nn.Module):
         key_layer = self.transpose_for_scores(mixed_key_layer)
         value_layer = self.transpose_for_scores(mixed_value_layer)
 
+        if self.use_fused_attention:
+            # Same computation without materialising the probabilities as a separate tensor;
+            # the additive mask broadcasts like below and the default scale is 1/sqrt(head size)
+            context_layer = nn.functional.scaled_dot_product_attention(
+                query_layer, key_layer, value_layer, attn_mask=attention_mask,
+                dropout_p=self.dropout.p if self.training else 0.0)
+            return self._merge_heads(context_layer)
+
         # Take the dot product between "query" and "key" to get the raw attention scores.
         attention_scores = torch.matmul(query_layer, key_layer.transpose(-1, -2))
         attention_scores = attention_scores / math.sqrt(self.attention_head_size)
@@ -309,12 +321,24 @@ class BertSelfAttention(nn.Module):
         attention_probs = self.dropout(attention_probs)
 
         context_layer = torch.matmul(attention_probs, value_layer)
+        return self._merge_heads(context_layer)
+
+    def _merge_heads(self, context_layer):
         context_layer = context_layer.permute(0, 2, 1, 3).contiguous()
         new_context_layer_shape = context_layer.size()[:-2] + (self.all_head_size,)
         context_layer = context_layer.view(*new_context_layer_shape)
         return context_layer
 
 
+def set_fused_attention(model, enabled=True):
+    """Switches every BertSelfAttention in `model` between the fused and the explicit attention path."""
+    enabled = enabled and FUSED_ATTENTION_AVAILABLE
+    for module in model.modules():
+        if isinstance(module, BertSelfAttention):
+            module.use_fused_attention = enabled
+    return enabled
+
+
 class BertSelfOutput(nn.Module):
     def __init__(self, config):
         super(BertSelfOutput, self).__init__()
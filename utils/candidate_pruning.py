@@ -0,0 +1,81 @@
+import re
+import math
+from collections import Counter
+from typing import Iterable, List
+
+# First-stage retrieval for evidence_selection: BM25 between the claim (its
+# verbalisation plus the entity/object labels and aliases) and each sentence or
+# window of a page, with document frequencies taken from that page. Only the
+# top-K candidates go on to the BERT cross-encoder. Check K against stored
+# exhaustive scores with benchmark_pruning.py before lowering it.
+#
+# `window_candidates` prunes the 2-sentence windows further using the sentence
+# scores the cross-encoder has already produced: a window whose sentences are all
+# irrelevant is not scored (benchmark_windows.py compares against scoring all).
+# With candidate_k set as well, evidence_selection scores the union of both
+# window sets, so neither can leave the window TOP_N short. benchmark_windows.py
+# validates window_candidates alone (candidate_k 0); the union only adds windows.
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+PLACEHOLDER_LABELS = {'no label', 'no alias', 'no-alias', 'no description', 'no-desc', 'none', ''}
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text) -> List[str]:
+    return TOKEN_PATTERN.findall(str(text).lower()) if text else []
+
+
+def query_terms(verbalisation, labels: Iterable = ()) -> List[str]:
+    """Distinct terms of the verbalisation and of the labels/aliases that are real values."""
+    texts = [verbalisation] + [label for label in labels
+                               if isinstance(label, str) and label.strip().lower() not in PLACEHOLDER_LABELS]
+    return list(dict.fromkeys(term for text in texts for term in tokenize(text)))
+
+
+def bm25_scores(query: List[str], documents: List[str]) -> List[float]:
+    tokenized = [tokenize(document) for document in documents]
+    n = len(tokenized)
+    if n == 0 or not query:
+        return [0.0] * n
+    average_length = sum(len(tokens) for tokens in tokenized) / n or 1.0
+    frequencies = [Counter(tokens) for tokens in tokenized]
+    document_frequency = Counter(term for counts in frequencies for term in set(query) & counts.keys())
+    idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in document_frequency.items()}
+    scores = []
+    for tokens, counts in zip(tokenized, frequencies):
+        norm = K1 * (1 - B + B * len(tokens) / average_length)
+        scores.append(sum(idf[term] * counts[term] * (K1 + 1) / (counts[term] + norm)
+                          for term in idf if term in counts))
+    return scores
+
+
+def select_candidates(query: List[str], documents: List[str], k: int) -> List[int]:
+    """Indices (in page order) of the k documents that score highest against `query`; all if k <= 0."""
+    if k <= 0 or len(documents) <= k:
+        return list(range(len(documents)))
+    scores = bm25_scores(query, documents)
+    ranked = sorted(range(len(documents)), key=lambda i: (-scores[i], i))
+    return sorted(ranked[:k])
+
+
+def window_candidates(sentence_scores: List, n_windows: int, threshold: float, min_windows: int = 0,
+                      window_size: int = 2) -> List[int]:
+    """Windows (nlp_sentences_slide_2 indices) worth scoring, derived from the per-sentence pass.
+
+    A window is kept if one of its sentences scored above `threshold`; the `min_windows` windows
+    with the best sentence scores are always kept so the window TOP_N stays full. Unscored
+    (pruned) sentences count as below the threshold. If the windows do not line up with the
+    sentences (pages shorter than a window), every window is kept.
+    """
+    n = len(sentence_scores)
+    if n_windows != max(1, n - window_size + 1) or n == 0:
+        return list(range(n_windows))
+    best = []
+    for j in range(n_windows):
+        scores = [s for s in sentence_scores[j:j + window_size] if s is not None]
+        best.append(max(scores) if scores else None)
+    keep = {j for j, score in enumerate(best) if score is not None and score > threshold}
+    ranked = sorted((j for j, score in enumerate(best) if score is not None), key=lambda j: (-best[j], j))
+    keep.update(ranked[:min_windows])
+    return sorted(keep)
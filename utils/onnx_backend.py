@@ -0,0 +1,225 @@
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+from typing import List, Tuple
+
+import numpy as np
+
+from utils.token_cache import encode_pairs
+
+# onnxruntime backend for sentence retrieval and entailment (models.backend: 'onnx'
+# in config.yaml). `export` traces the torch models once into ONNX graphs with
+# dynamic batch and sequence axes and copies their tokenizers next to them, so the
+# runtime classes below need onnxruntime and transformers' tokenizers but not torch.
+# Batches are padded to their longest pair instead of to max_len.
+#
+#   python -m utils.onnx_backend export [--output base/onnx]
+#   python -m utils.onnx_backend check  [--output base/onnx] [--pairs pairs.json]   # compare against torch
+
+ONNX_DIR = 'base/onnx'
+RETRIEVAL_FILE = 'sentence_retrieval.onnx'
+ENTAILMENT_FILE = 'textual_entailment.onnx'
+RETRIEVAL_TOKENIZER = 'sentence_retrieval_tokenizer'
+ENTAILMENT_TOKENIZER = 'textual_entailment_tokenizer'
+SETTINGS_FILE = 'onnx_settings.json'
+OPSET_VERSION = 14
+CLASSES = ['SUPPORTS', 'REFUTES', 'NOT ENOUGH INFO']
+
+
+def process_sent(sentence):
+    # Same clean-up as utils/sentence_retrieval_module.py, without importing torch
+    sentence = re.sub("LSB.*?RSB", "", sentence)
+    sentence = re.sub("LRB\s*?RRB", "", sentence)
+    sentence = re.sub("(\s*?)LRB((\s*?))", "\\1(\\2", sentence)
+    sentence = re.sub("(\s*?)RRB((\s*?))", "\\1)\\2", sentence)
+    sentence = re.sub("--", "-", sentence)
+    sentence = re.sub("``", '"', sentence)
+    sentence = re.sub("''", '"', sentence)
+    return sentence
+
+
+def create_session(path, intra_op_threads=0, inter_op_threads=0):
+    """CPU session; 0 threads lets onnxruntime decide (one intra-op thread per physical core)."""
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = inter_op_threads
+    options.execution_mode = ort.ExecutionMode.ORT_PARALLEL if inter_op_threads > 1 else ort.ExecutionMode.ORT_SEQUENTIAL
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+
+
+def _settings(model_dir):
+    with open(os.path.join(model_dir, SETTINGS_FILE), 'r') as file:
+        return json.load(file)
+
+
+class OnnxSentenceRetrievalModule():
+    """Drop-in for SentenceRetrievalModule.score_sentence_pairs."""
+
+    def __init__(self, model_dir=ONNX_DIR, max_len=None, intra_op_threads=0, inter_op_threads=0):
+        from transformers import BertTokenizer
+        self.max_len = max_len or _settings(model_dir)['retrieval_max_len']
+        self.tokenizer = BertTokenizer.from_pretrained(os.path.join(model_dir, RETRIEVAL_TOKENIZER), do_lower_case=False)
+        self.session = create_session(os.path.join(model_dir, RETRIEVAL_FILE), intra_op_threads, inter_op_threads)
+
+    def score_sentence_pairs(self, inputs: List[Tuple[str]]):
+        inputs_processed = [(process_sent(input[0]), process_sent(input[1])) for input in inputs]
+        encodings = encode_pairs(
+            self.tokenizer,
+            inputs_processed,
+            max_length=self.max_len,
+            padding='longest',
+            return_token_type_ids=True,
+            return_tensors='np',
+        )
+        outputs = self.session.run(None, {
+            'input_ids': encodings['input_ids'].astype(np.int64),
+            'attention_mask': encodings['attention_mask'].astype(np.int64),
+            'token_type_ids': encodings['token_type_ids'].astype(np.int64),
+        })[0].tolist()
+        assert len(outputs) == len(inputs)
+        return outputs
+
+
+class OnnxTextualEntailmentModule():
+    """Drop-in for TextualEntailmentModule (get_batch_scores and the label helpers)."""
+
+    def __init__(self, model_dir=ONNX_DIR, intra_op_threads=0, inter_op_threads=0):
+        from transformers import BertTokenizer
+        self.max_len = _settings(model_dir)['entailment_max_len']
+        self.tokenizer = BertTokenizer.from_pretrained(os.path.join(model_dir, ENTAILMENT_TOKENIZER))
+        self.session = create_session(os.path.join(model_dir, ENTAILMENT_FILE), intra_op_threads, inter_op_threads)
+
+    def get_batch_scores(self, claims, evidence):
+        encodings = encode_pairs(
+            self.tokenizer,
+            list(zip(claims, evidence)),
+            max_length=self.max_len,
+            padding='longest',
+            return_token_type_ids=False,
+            return_tensors='np',
+        )
+        logits = self.session.run(None, {
+            'input_ids': encodings['input_ids'].astype(np.int64),
+            'attention_mask': encodings['attention_mask'].astype(np.int64),
+        })[0]
+        # Softmax as torch.softmax(logits, dim=1)
+        exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def get_label_from_scores(self, scores):
+        return CLASSES[np.argmax(scores)]
+
+    def get_label_malon(self, score_set):
+        score_labels = [np.argmax(s) for s in score_set]
+        if 1 not in score_labels and 0 not in score_labels:
+            return CLASSES[2] #NOT ENOUGH INFO
+        elif 0 in score_labels:
+            return CLASSES[0] #SUPPORTS
+        elif 1 in score_labels:
+            return CLASSES[1] #REFUTES
+
+
+def export(output_dir=ONNX_DIR):
+    import torch
+    from utils.sentence_retrieval_module import SentenceRetrievalModule, ARGS
+    from utils.textual_entailment_module import TextualEntailmentModule, MAX_LEN
+
+    os.makedirs(output_dir, exist_ok=True)
+    sequence_axes = {0: 'batch', 1: 'sequence'}
+
+    sr_module = SentenceRetrievalModule()
+    sr_model = sr_module.model.cpu().eval()
+    sample = sr_module.tokenizer([('claim', 'sentence')], padding='longest', return_token_type_ids=True,
+                                 return_attention_mask=True, return_tensors='pt')
+    with torch.no_grad():
+        torch.onnx.export(
+            sr_model, (sample['input_ids'], sample['attention_mask'], sample['token_type_ids']),
+            os.path.join(output_dir, RETRIEVAL_FILE),
+            input_names=['input_ids', 'attention_mask', 'token_type_ids'], output_names=['score'],
+            dynamic_axes={'input_ids': sequence_axes, 'attention_mask': sequence_axes,
+                          'token_type_ids': sequence_axes, 'score': {0: 'batch'}},
+            opset_version=OPSET_VERSION)
+    sr_module.tokenizer.save_pretrained(os.path.join(output_dir, RETRIEVAL_TOKENIZER))
+
+    te_module = TextualEntailmentModule()
+    te_model = te_module.model.cpu().eval()
+
+    class Logits(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask).logits
+
+    sample = te_module.tokenizer([('claim', 'sentence')], padding='longest', return_token_type_ids=False,
+                                 return_tensors='pt')
+    with torch.no_grad():
+        torch.onnx.export(
+            Logits(te_model), (sample['input_ids'], sample['attention_mask']),
+            os.path.join(output_dir, ENTAILMENT_FILE),
+            input_names=['input_ids', 'attention_mask'], output_names=['logits'],
+            dynamic_axes={'input_ids': sequence_axes, 'attention_mask': sequence_axes, 'logits': {0: 'batch'}},
+            opset_version=OPSET_VERSION)
+    te_module.tokenizer.save_pretrained(os.path.join(output_dir, ENTAILMENT_TOKENIZER))
+
+    with open(os.path.join(output_dir, SETTINGS_FILE), 'w') as file:
+        json.dump({'retrieval_max_len': ARGS['max_len'], 'entailment_max_len': MAX_LEN,
+                   'opset_version': OPSET_VERSION}, file, indent=2)
+    logging.info(f'Exported sentence retrieval and entailment models to {output_dir}')
+
+
+def check(pairs, output_dir=ONNX_DIR, max_len=None, batch_size=16, atol=1e-3):
+    """Compares onnxruntime against the torch modules on `pairs`; returns False if any output is off by > atol."""
+    from utils.sentence_retrieval_module import SentenceRetrievalModule
+    from utils.textual_entailment_module import TextualEntailmentModule
+    claims, sentences = [c for c, _ in pairs], [s for _, s in pairs]
+
+    def batched(func, *columns):
+        start, outputs = time.perf_counter(), []
+        for i in range(0, len(pairs), batch_size):
+            outputs += list(func(*[column[i:i + batch_size] for column in columns]))
+        return np.array(outputs), len(pairs) / (time.perf_counter() - start)
+
+    ok = True
+    for name, torch_module, onnx_module, score in [
+        ('retrieval', SentenceRetrievalModule(max_len=max_len), OnnxSentenceRetrievalModule(output_dir, max_len),
+         lambda module, c, s: module.score_sentence_pairs(list(zip(c, s)))),
+        ('entailment', TextualEntailmentModule(), OnnxTextualEntailmentModule(output_dir),
+         lambda module, c, s: module.get_batch_scores(c, s)),
+    ]:
+        torch_out, torch_rate = batched(lambda c, s: score(torch_module, c, s), claims, sentences)
+        onnx_out, onnx_rate = batched(lambda c, s: score(onnx_module, c, s), claims, sentences)
+        diff = float(np.max(np.abs(torch_out - onnx_out)))
+        line = f"{name:<11} max |diff| {diff:.2e}  torch {torch_rate:7.1f} pairs/s  onnx {onnx_rate:7.1f} pairs/s"
+        if name == 'entailment':
+            line += f"  label agreement {np.mean(torch_out.argmax(axis=1) == onnx_out.argmax(axis=1)):.3f}"
+        print(line)
+        ok = ok and diff <= atol
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ONNX export and check for retrieval/entailment')
+    parser.add_argument('command', choices=['export', 'check'])
+    parser.add_argument('--output', default=ONNX_DIR)
+    parser.add_argument('--pairs', help="JSON [[claim, sentence], ...] for `check`; built-in fixture if omitted")
+    parser.add_argument('--atol', type=float, default=1e-3)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.command == 'export':
+        export(args.output)
+        return
+    from benchmark_quantization import FIXTURE_PAIRS, load_pairs
+    pairs = load_pairs(args.pairs) if args.pairs else FIXTURE_PAIRS
+    sys.exit(0 if check(pairs, args.output, atol=args.atol) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+import logging
+
+import torch
+import torch.nn as nn
+
+# Opt-in dynamic int8 quantisation for CPU inference. nn.Linear weights are
+# stored as int8 and activations are quantised per batch at run time, so no
+# calibration data is needed; embeddings, LayerNorm and softmax stay in fp32.
+# Check accuracy on the deployment's hardware with benchmark_quantization.py
+# before enabling it in config.yaml (models.int8_retrieval / int8_entailment).
+
+
+def quantization_engine() -> str:
+    engines = torch.backends.quantized.supported_engines
+    for engine in ('fbgemm', 'x86', 'qnnpack'):  # x86 servers first, qnnpack on ARM
+        if engine in engines:
+            return engine
+    raise RuntimeError(f'No int8 quantisation engine available (supported: {engines})')
+
+
+def quantize_linear_int8(model: nn.Module) -> nn.Module:
+    """Returns an int8 copy of `model` with dynamically quantised Linear layers (CPU only)."""
+    torch.backends.quantized.engine = quantization_engine()
+    model.eval()
+    quantized = torch.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+    logging.info(f'Quantised Linear layers of {type(model).__name__} to int8 ({torch.backends.quantized.engine})')
+    return quantized
+
+
+def maybe_quantize(model: nn.Module, enabled: bool, on_cuda: bool) -> nn.Module:
+    if not enabled:
+        return model
+    if on_cuda:
+        logging.warning(f'int8 quantisation is CPU-only; {type(model).__name__} keeps running in fp32 on CUDA')
+        return model
+    return quantize_linear_int8(model)
@@ -1,4 +1,5 @@
 import re
+import logging
 from typing import List, Tuple
 import pathlib
 
@@ -6,6 +7,9 @@ import torch
 from transformers import BertTokenizer
 
 from utils.sentence_retrieval_model import sentence_retrieval_model
+from utils.quantization import maybe_quantize
+from utils.bert_model import set_fused_attention
+from utils.token_cache import encode_pairs
 
 
 THIS_DIR = pathlib.Path(__file__).parent.absolute()
@@ -19,9 +23,6 @@ ARGS = {
     'cuda': torch.cuda.is_available()
 }
 
-if not ARGS['cuda']:
-    print('CUDA NOT AVAILABLE')
-
 
 def process_sent(sentence):
     sentence = re.sub("LSB.*?RSB", "", sentence)
@@ -35,27 +36,31 @@ def process_sent(sentence):
 
 class SentenceRetrievalModule():
 
-    def __init__(self, max_len=None):
+    def __init__(self, max_len=None, int8=False, fused_attention=False):
         
         if max_len:
             ARGS['max_len'] = max_len
+        if not ARGS['cuda']:
+            logging.info('CUDA not available, sentence retrieval runs on CPU')
         
         self.tokenizer = BertTokenizer.from_pretrained(ARGS['bert_pretrain'], do_lower_case=False)
         self.model = sentence_retrieval_model(ARGS)
         self.model.load_state_dict(torch.load(ARGS['checkpoint'], map_location=torch.device('cpu'))['model'])
         if ARGS['cuda']:
             self.model = self.model.cuda()
+        if fused_attention and not set_fused_attention(self.model, True):
+            logging.warning('models.fused_attention needs torch>=2.0; using the explicit attention')
+        self.model = maybe_quantize(self.model, int8, ARGS['cuda'])
 
     def score_sentence_pairs(self, inputs: List[Tuple[str]]):
         inputs_processed = [(process_sent(input[0]), process_sent(input[1])) for input in inputs]
 
-        encodings =  self.tokenizer(
+        encodings = encode_pairs(
+            self.tokenizer,
             inputs_processed,
-            padding='max_length',
-            truncation='longest_first',
             max_length=ARGS['max_len'],
+            padding='max_length',
             return_token_type_ids=True,
-            return_attention_mask=True,
             return_tensors='pt',
         )
 
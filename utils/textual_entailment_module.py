@@ -7,6 +7,9 @@ import re
 
 from transformers import BertTokenizer, BertForSequenceClassification
 
+from utils.quantization import maybe_quantize
+from utils.token_cache import encode_pairs
+
 # Constants and paths
 HOME = Path('/users/k2031554')
 DEVICE = 'cuda:0' if torch.cuda.is_available() else 'cpu'
@@ -29,7 +32,8 @@ class TextualEntailmentModule():
     def __init__(
         self,
         model_path = 'base/models/BERT_FEVER_v4_model_PBT',
-        tokenizer_path = 'base/models/BERT_FEVER_v4_tok_PBT'
+        tokenizer_path = 'base/models/BERT_FEVER_v4_tok_PBT',
+        int8 = False
         ):
         self.tokenizer = BertTokenizer.from_pretrained(
             tokenizer_path
@@ -38,6 +42,7 @@ class TextualEntailmentModule():
             model_path
         )
         self.model.to(DEVICE)
+        self.model = maybe_quantize(self.model, int8, DEVICE != 'cpu')
 
     #def get_pair_scores(self, claim, evidence):
     #    
@@ -63,12 +68,12 @@ class TextualEntailmentModule():
 
         inputs = list(zip(claims, evidence))
         
-        encodings = self.tokenizer(
+        encodings = encode_pairs(
+            self.tokenizer,
             inputs,
-            max_length= MAX_LEN,
-            return_token_type_ids=False,
+            max_length=MAX_LEN,
             padding='max_length',
-            truncation=True,
+            return_token_type_ids=False,
             return_tensors='pt',
         ).to(DEVICE)
 
@@ -0,0 +1,88 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Tuple
+
+# Token ids of claims and evidence sentences, shared by the retrieval and
+# entailment modules. A page cited by many claims of an item is tokenised once
+# instead of once per (verbalisation, sentence) pair: `encode_pairs` builds the
+# pair encodings (special tokens, truncation, padding) from the cached segments
+# with the tokenizer's own prepare_for_model/pad, which gives the same ids as
+# tokenising the text pairs for BERT's WordPiece. Entries are keyed by tokenizer
+# and sentence hash and evicted least-recently-used; size 0 (the default) calls
+# the tokenizer directly.
+# benchmark_tokenisation.py checks parity and speed.
+
+DEFAULT_MAX_ENTRIES = 200000
+
+
+def tokenizer_key(tokenizer) -> str:
+    return f"{type(tokenizer).__name__}:{tokenizer.name_or_path}:{getattr(tokenizer, 'do_lower_case', None)}"
+
+
+class TokenCache:
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, max_entries):
+        with self._lock:
+            self.max_entries = int(max_entries)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def token_ids(self, tokenizer, text: str, key_prefix: str = None) -> List[int]:
+        key = (key_prefix or tokenizer_key(tokenizer), hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest())
+        with self._lock:
+            ids = self._entries.get(key)
+            if ids is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return ids
+            self.misses += 1
+        # Tokenised outside the lock; two threads missing the same sentence both do the work once
+        ids = tokenizer.convert_tokens_to_ids(tokenizer.tokenize(text))
+        with self._lock:
+            self._entries[key] = ids
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return ids
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+# Off until models.token_cache_size turns it on
+CACHE = TokenCache(0)
+
+
+def configure(max_entries=None):
+    if max_entries is not None:
+        CACHE.configure(max_entries)
+
+
+def encode_pairs(tokenizer, pairs: List[Tuple[str, str]], max_length: int, padding='max_length',
+                 return_token_type_ids=True, return_tensors='pt', cache: TokenCache = None):
+    """Same as tokenizer(pairs, truncation='longest_first', ...), built from cached segment ids."""
+    cache = cache or CACHE
+    if not cache.enabled:
+        return tokenizer(list(pairs), padding=padding, truncation='longest_first', max_length=max_length,
+                         return_token_type_ids=return_token_type_ids, return_attention_mask=True,
+                         return_tensors=return_tensors)
+    prefix = tokenizer_key(tokenizer)
+    features = [
+        tokenizer.prepare_for_model(
+            cache.token_ids(tokenizer, first, prefix), cache.token_ids(tokenizer, second, prefix),
+            add_special_tokens=True, truncation='longest_first', max_length=max_length,
+            return_token_type_ids=return_token_type_ids, return_attention_mask=True)
+        for first, second in pairs
+    ]
+    return tokenizer.pad(features, padding=padding, max_length=max_length, return_tensors=return_tensors)
@@ -0,0 +1,74 @@
+import os
+import json
+import logging
+import argparse
+
+import torch
+
+from utils.verbalisation_module import CHECKPOINT, INFERENCE_MODEL_DIR, GENERATION_FILE, load_inference_model
+
+# Writes the inference-only part of the verbaliser's Lightning checkpoint:
+# config.json, the tokenizer (with the <H>/<R>/<T> special tokens), the T5 weights
+# as model.safetensors and the generation settings VerbModule needs. Optimizer
+# state and hparams stay behind, and loading no longer builds the pretrained T5
+# first only to overwrite its weights.
+#
+#   python -m utils.verbalisation_export [--checkpoint base/....ckpt] [--output base/t5-base_inference]
+
+SAMPLE_INPUTS = [
+    'translate Graph to English: <H> World Trade Center <R> height <T> 200 meter',
+    'translate Graph to English: <H> Douglas Adams <R> place of birth <T> Cambridge <H> Douglas Adams <R> occupation <T> writer',
+]
+
+
+def export_inference_model(checkpoint: str = CHECKPOINT, output_dir: str = INFERENCE_MODEL_DIR):
+    from utils.finetune import Graph2TextModule
+    g2t_module = Graph2TextModule.load_from_checkpoint(checkpoint, strict=False, map_location='cpu')
+    model, tokenizer = g2t_module.model.eval(), g2t_module.tokenizer
+    os.makedirs(output_dir, exist_ok=True)
+    try:
+        model.save_pretrained(output_dir, safe_serialization=True)
+    except TypeError:
+        # transformers without safetensors support: pytorch_model.bin still skips the checkpoint overhead
+        logging.warning('This transformers version cannot write safetensors; saving pytorch_model.bin instead')
+        model.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, GENERATION_FILE), 'w') as file:
+        json.dump({
+            'decoder_start_token_id': g2t_module.decoder_start_token_id,
+            'eval_beams': g2t_module.eval_beams,
+            'eval_max_length': g2t_module.eval_max_length,
+            'source_checkpoint': os.path.basename(checkpoint),
+        }, file, indent=2)
+    return g2t_module
+
+
+def verify_export(g2t_module, output_dir: str = INFERENCE_MODEL_DIR):
+    """Checks the export reproduces the checkpoint: same vocabulary, encodings and weights."""
+    model, tokenizer, _ = load_inference_model(output_dir)
+    assert tokenizer.get_vocab() == g2t_module.tokenizer.get_vocab(), 'tokenizer vocabulary differs'
+    for text in SAMPLE_INPUTS:
+        assert tokenizer.encode(text) == g2t_module.tokenizer.encode(text), f'tokenisation of {text!r} differs'
+    exported = model.state_dict()
+    for name, tensor in g2t_module.model.state_dict().items():
+        assert torch.equal(exported[name], tensor), f'weight {name} differs'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the verbaliser checkpoint for inference')
+    parser.add_argument('--checkpoint', default=CHECKPOINT)
+    parser.add_argument('--output', default=INFERENCE_MODEL_DIR)
+    parser.add_argument('--no-verify', action='store_true', help="skip reloading the export and comparing it")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    g2t_module = export_inference_model(args.checkpoint, args.output)
+    if not args.no_verify:
+        verify_export(g2t_module, args.output)
+    size = sum(os.path.getsize(os.path.join(args.output, f)) for f in os.listdir(args.output))
+    logging.info(f'Exported {args.checkpoint} to {args.output} ({size / 1e6:.0f} MB, '
+                 f'checkpoint {os.path.getsize(args.checkpoint) / 1e6:.0f} MB)')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,56 @@
-from utils.finetune import Graph2TextModule
 from typing import Dict, List, Tuple, Union, Optional
 import torch
+import os
 import re
+import json
+import logging
 
-if torch.cuda.is_available():
-    DEVICE = 'cuda'
-else:
-    DEVICE = 'cpu'
-    print('CUDA NOT AVAILABLE')
+DEVICE = 'cuda' if torch.cuda.is_available() else 'cpu'
 
 CHECKPOINT = 'base/t5-base_13881_val_avg_bleu=68.1000-step_count=5.ckpt'
+# Inference-only export of CHECKPOINT (see utils/verbalisation_export.py); used instead of it when present
+INFERENCE_MODEL_DIR = 'base/t5-base_inference'
+GENERATION_FILE = 'generation_settings.json'
 MAX_LENGTH = 384
 SEED = 42
 
 
+def load_inference_model(model_dir: str):
+    """Model, tokenizer and generation settings from an export, without building the Lightning module.
+    Weights are read from model.safetensors; the .ckpt optimizer state and Lightning wrapper are never loaded."""
+    from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+    with open(os.path.join(model_dir, GENERATION_FILE), 'r') as file:
+        generation = json.load(file)
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = AutoModelForSeq2SeqLM.from_pretrained(model_dir)
+    return model, tokenizer, generation
+
+
 class VerbModule():
     
-    def __init__(self, override_args: Dict[str, str] = None): 
+    def __init__(self, override_args: Dict[str, str] = None, model_dir: Optional[str] = INFERENCE_MODEL_DIR): 
+        if DEVICE == 'cpu':
+            logging.info('CUDA not available, verbalisation runs on CPU')
         # Model
         if not override_args:
             override_args = {}
-        self.g2t_module = Graph2TextModule.load_from_checkpoint(CHECKPOINT, strict=False, **override_args)
-        self.tokenizer = self.g2t_module.tokenizer
+        # hparams overrides need the Lightning module, so they always load the checkpoint
+        if model_dir and os.path.isdir(model_dir) and not override_args:
+            self.model, self.tokenizer, generation = load_inference_model(model_dir)
+            self.decoder_start_token_id = generation['decoder_start_token_id']
+            self.eval_beams = generation['eval_beams']
+            self.eval_max_length = generation['eval_max_length']
+        else:
+            if model_dir and not override_args:
+                logging.info(f'No verbaliser export in {model_dir}, loading {CHECKPOINT}')
+            from utils.finetune import Graph2TextModule
+            g2t_module = Graph2TextModule.load_from_checkpoint(CHECKPOINT, strict=False, **override_args)
+            self.model, self.tokenizer = g2t_module.model, g2t_module.tokenizer
+            self.decoder_start_token_id = g2t_module.decoder_start_token_id
+            self.eval_beams = g2t_module.eval_beams
+            self.eval_max_length = g2t_module.eval_max_length
+        self.model = self.model.to(DEVICE)
+        self.model.eval()
         # Unk replacer
         self.vocab = self.tokenizer.get_vocab()
         self.convert_some_japanese_characters = True
@@ -35,15 +64,14 @@ class VerbModule():
             )
             inputs_encoding = {k: v.to(DEVICE) for k, v in inputs_encoding.items()}
             
-            self.g2t_module.model.eval()
             with torch.no_grad():
-                gen_output = self.g2t_module.model.generate(
+                gen_output = self.model.generate(
                     inputs_encoding['input_ids'],
                     attention_mask=inputs_encoding['attention_mask'],
                     use_cache=True,
-                    decoder_start_token_id = self.g2t_module.decoder_start_token_id,
-                    num_beams= self.g2t_module.eval_beams,
-                    max_length= self.g2t_module.eval_max_length,
+                    decoder_start_token_id = self.decoder_start_token_id,
+                    num_beams= self.eval_beams,
+                    max_length= self.eval_max_length,
                     length_penalty=1.0    
                 )
         except Exception:
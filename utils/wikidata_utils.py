@@ -17,6 +17,11 @@ from urllib3.exceptions import MaxRetryError, ConnectionError
 from qwikidata.linked_data_interface import LdiResponseNotOk
 
 import hashlib
+import os
+import threading
+
+# Several pipeline stages can hold their own CachedWikidataAPI and share one cache file
+_CACHE_FILE_LOCK = threading.Lock()
 
 class CachedWikidataAPI():
     
@@ -39,8 +44,11 @@ class CachedWikidataAPI():
             self.x_queries_passed = self.save_every_x_queries
         self.x_queries_passed = self.x_queries_passed+1
         if self.x_queries_passed >= self.save_every_x_queries:
-            with open(self.cache_path,'wb') as f:
-                pickle.dump(self.entity_cache,f)
+            with _CACHE_FILE_LOCK:
+                tmp_path = f'{self.cache_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+                with open(tmp_path,'wb') as f:
+                    pickle.dump(self.entity_cache,f)
+                os.replace(tmp_path, self.cache_path)
             self.x_queries_passed = 0
 
     def get_entity(self, item_id):
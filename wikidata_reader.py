@@ -1,8 +1,6 @@
 import sqlite3
 import pandas as pd
 from qwikidata.linked_data_interface import get_entity_dict_from_api
-import nltk
-import spacy
 import logging
 from typing import List, Dict, Any
 import sys, subprocess
@@ -13,6 +11,7 @@ import utils.wikidata_utils as wdutils
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 def ensure_spacy_model():
+    import spacy
     try:
         spacy.load("en_core_web_sm")
     except OSError:
@@ -40,6 +39,7 @@ class WikidataParser:
         self.cursor = self.conn.cursor()
         self.setup_database()
         ensure_spacy_model()
+        import spacy
         self.nlp = spacy.load("en_core_web_sm")
         return self
 
@@ -92,6 +92,12 @@ class WikidataParser:
                 url TEXT,
                 PRIMARY KEY (entity_id, reference_id, reference_property_id)
             );
+
+            CREATE TABLE IF NOT EXISTS entity_revisions(
+                entity_id TEXT,
+                lastrevid INTEGER,
+                PRIMARY KEY (entity_id)
+            );
                                   
         ''')
         self.conn.commit()
@@ -109,6 +115,7 @@ class WikidataParser:
             DROP TABLE IF EXISTS claims;
             DROP TABLE IF EXISTS claims_refs;
             DROP TABLE IF EXISTS refs;
+            DROP TABLE IF EXISTS entity_revisions;
         ''')
         self.setup_database()
         logging.info("Database reset completed.")
@@ -208,14 +215,36 @@ class WikidataParser:
                         self.extract_reference(ref)
 
 
+    def get_stored_revision(self, entity_id):
+        self.cursor.execute('SELECT lastrevid FROM entity_revisions WHERE entity_id = ?', (entity_id,))
+        row = self.cursor.fetchone()
+        return row[0] if row else None
+
+    def drop_entity_claims(self, entity_id):
+        """Removes claims parsed from an older revision so edited claims can be re-inserted."""
+        self.cursor.execute('''
+            DELETE FROM claims_refs
+            WHERE claim_id IN (SELECT claim_id FROM claims WHERE entity_id = ?)
+        ''', (entity_id,))
+        self.cursor.execute('DELETE FROM claims WHERE entity_id = ?', (entity_id,))
+
     def claimParser(self, qid):
         entity_id = qid
         logging.info('Fetching entity from API ...')
         entity = get_entity_dict_from_api(entity_id)
 
         if entity:
-            logging.info(f'Parsing entity: {entity_id}')
-            self.extract_entity(entity)
+            lastrevid = entity.get('lastrevid')
+            if lastrevid is not None and lastrevid == self.get_stored_revision(entity_id):
+                logging.info(f'Entity {entity_id} unchanged since revision {lastrevid}, skipping parsing')
+            else:
+                logging.info(f'Parsing entity: {entity_id}')
+                self.drop_entity_claims(entity_id)
+                self.extract_entity(entity)
+                self.cursor.execute('''
+                    INSERT OR REPLACE INTO entity_revisions(entity_id, lastrevid)
+                    VALUES(?, ?)
+                ''', (entity_id, lastrevid))
         else:
             logging.warning(f'Failed to fetch entity: {entity_id}')
 
@@ -359,6 +388,7 @@ def main(qids: List[str], reset: bool = False):
             parser.urlParser(qid)
 
 if __name__ == "__main__":
+    import nltk
     nltk.download('punkt', quiet=True)
     qids =['Q30']
     main(qids)
\ No newline at end of file
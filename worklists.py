@@ -0,0 +1,166 @@
+import sys
+import time
+import logging
+import threading
+from typing import Dict, List, Optional
+
+import item_health
+import db_connections
+
+# Worklists of items whose references most need attention. Per-item label counts
+# come from item_health (kept current as tasks complete) and the number of
+# connected sites per item from a local copy of the Quarry site-link table,
+# which is downloaded again only once it is older than `max_age_hours`. API
+# requests never wait for the download: a missing or stale copy is refreshed on a
+# background thread and requests use what is there meanwhile (without a copy, all
+# items are listed as having no site-link data). To download it ahead of time:
+#
+#   python worklists.py [db_path]
+
+SITELINKS_URL = "https://quarry.wmcloud.org/run/888614/output/0/csv"
+
+_refresh_lock = threading.Lock()
+_thread_lock = threading.Lock()
+_refresh_thread = None
+
+
+def ensure_tables(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS item_sitelinks (
+        qid TEXT PRIMARY KEY,
+        n_connected_site INTEGER
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_item_sitelinks_n ON item_sitelinks (n_connected_site DESC)")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS cache_refresh (
+        name TEXT PRIMARY KEY,
+        refreshed_at REAL
+    )
+    """)
+    for column in ['refutes', 'not_enough_info']:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS ix_item_health_{column} ON item_health ({column} DESC)")
+
+
+def sitelinks_age(conn) -> Optional[float]:
+    row = conn.execute("SELECT refreshed_at FROM cache_refresh WHERE name = 'item_sitelinks'").fetchone()
+    return time.time() - row[0] if row else None
+
+
+def refresh_sitelinks(conn, url=SITELINKS_URL):
+    import pandas as pd
+    df = pd.read_csv(url)
+    df = df.rename(columns={'ips_item_id': 'qid', 'count(i.ips_site_id)': 'N_connected_site'})
+    rows = [('Q' + str(qid), int(n)) for qid, n in zip(df['qid'], df['N_connected_site'])]
+    with conn:
+        conn.execute("DELETE FROM item_sitelinks")
+        conn.executemany("INSERT OR REPLACE INTO item_sitelinks (qid, n_connected_site) VALUES (?, ?)", rows)
+        conn.execute("INSERT OR REPLACE INTO cache_refresh (name, refreshed_at) VALUES ('item_sitelinks', ?)",
+                     (time.time(),))
+    print(f"Refreshed site-link counts for {len(rows)} items")
+
+
+def ensure_sitelinks(conn, max_age_hours=24, url=SITELINKS_URL):
+    """Downloads the site-link table if it is missing or stale; a failed download keeps the old copy."""
+    age = sitelinks_age(conn)
+    if age is not None and age < max_age_hours * 3600:
+        return
+    with _refresh_lock:
+        age = sitelinks_age(conn)
+        if age is not None and age < max_age_hours * 3600:
+            return
+        try:
+            refresh_sitelinks(conn, url)
+        except Exception as e:
+            if age is None:
+                raise
+            logging.error(f"Site-link refresh failed, keeping copy from {age / 3600:.1f}h ago: {e}")
+
+
+def refresh_in_background(db_path, max_age_hours=24, url=SITELINKS_URL) -> bool:
+    """Starts ensure_sitelinks on a thread if the copy is missing or stale; returns whether one was started."""
+    global _refresh_thread
+    age = sitelinks_age(db_connections.get_connection(db_path))
+    if age is not None and age < max_age_hours * 3600:
+        return False
+    with _thread_lock:
+        if _refresh_thread is not None and _refresh_thread.is_alive():
+            return False
+        _refresh_thread = threading.Thread(target=_refresh, args=(db_path, max_age_hours, url),
+                                           name='sitelinks-refresh', daemon=True)
+        _refresh_thread.start()
+    return True
+
+
+def _refresh(db_path, max_age_hours, url):
+    try:
+        ensure_sitelinks(db_connections.get_connection(db_path), max_age_hours, url)
+    except Exception as e:
+        logging.error(f"Site-link download failed: {e}")
+    finally:
+        db_connections.close_thread_connections()
+
+
+def _rows(cursor) -> List[Dict]:
+    columns = [d[0] for d in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+# Same column names as the former pandas worklist
+_ITEM_COLUMNS = ('h.qid, h.not_enough_info AS "NOT ENOUGH INFO", h.refutes AS "REFUTES", '
+                 'h.supports AS "SUPPORTS", s.n_connected_site AS "N_connected_site"')
+
+
+# CROSS JOIN keeps item_sitelinks as the outer loop, so the rows come in ix_item_sitelinks_n
+# order and LIMIT stops the scan early (db_migrations checks both plans)
+TOP_CITED_SQL = f'''
+    SELECT {_ITEM_COLUMNS}
+    FROM item_sitelinks s CROSS JOIN item_health h ON h.qid = s.qid
+    WHERE h.total > 0
+    ORDER BY s.n_connected_site DESC, h.refutes DESC
+    LIMIT ?
+    '''
+UNLINKED_SQL = f'''
+    SELECT {_ITEM_COLUMNS}
+    FROM item_health h LEFT JOIN item_sitelinks s ON s.qid = h.qid
+    WHERE h.total > 0 AND s.qid IS NULL
+    ORDER BY h.refutes DESC
+    LIMIT ?
+    '''
+
+
+def top_cited_items(conn, top_n=None) -> List[Dict]:
+    """Checked items, most connected sites first, then most REFUTES; items without site-link data last."""
+    limit = -1 if top_n is None else int(top_n)
+    items = _rows(conn.execute(TOP_CITED_SQL, (limit,)))
+    if top_n is None or len(items) < top_n:
+        items += _rows(conn.execute(UNLINKED_SQL, (-1 if top_n is None else top_n - len(items),)))
+    return items
+
+
+def by_label_sql(label) -> str:
+    column = item_health.LABELS[label]
+    return f'''
+    SELECT {_ITEM_COLUMNS}
+    FROM item_health h LEFT JOIN item_sitelinks s ON s.qid = h.qid
+    WHERE h.{column} > 0
+    ORDER BY h.{column} DESC
+    LIMIT ?
+    '''
+
+
+def top_items_by_label(conn, label, top_n=100) -> List[Dict]:
+    """Items with the most results of `label` ('REFUTES' or 'NOT ENOUGH INFO') in their latest task."""
+    return _rows(conn.execute(by_label_sql(label), (int(top_n),)))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        path = sys.argv[1]
+    else:
+        import yaml
+        with open('config.yaml', 'r') as file:
+            path = yaml.safe_load(file)['database']['result_db_for_API']
+    with db_connections.connection(path) as conn:
+        ensure_tables(conn)
+        refresh_sitelinks(conn)